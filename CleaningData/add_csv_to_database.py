@@ -2,69 +2,81 @@
 This module will either add new data to the database or create the database
 and table if the database does not already exist. It will be called in the
 login module depending on whether a configuration file exists. It will then
-either load the entire CSV into the database or only the new runs based on
-the date.
+either load the entire cleaned data cache into the database or only the new
+runs based on the date.
 """
 
 
-import csv
+import numpy
 from constants import *
-from pathlib import Path
+from run_cache import CACHE_COLUMNS, cache_path, load_runs, records_to_rows
 import configparser
 
+# How many runs are sent to MySQL in each executemany
+BATCH_SIZE = 1000
+
 
 class AddCSVtoDatabase:
     def __init__(self, connection, config_path):
         self.connection = connection
         self.config_path = config_path
+        self.batch_size = BATCH_SIZE
+        self.on_progress = None  # Called with the runs inserted and total
 
     def read_config_file(self):
         self.config = configparser.ConfigParser()
         self.config.read(self.config_path)
         self.database = self.config.get('mysql_info', 'database')
         self.table = self.config.get('mysql_info', 'table')
-        self.csv_file = Path(self.config.get('directory_info', 'cleaned_data'))
+        self.cache_file = cache_path(self.config.get('directory_info', 'cleaned_data'))
 
     def open_file(self):
         """
-        Opens the CSV file in the CleaningData directory and reads it.
+        Maps the cleaned data cache in the CleaningData directory into
+        memory. The runs are only read when they are inserted.
         """
-        with open(self.csv_file, 'r') as csv_file:
-            # Read the file - returns reader object
-            csv_reader = csv.reader(csv_file)
-            # Save the column names and move on to the first data row
-            self.columns = next(csv_reader)
-            # Get a list of rows of run data from the csv file
-            self.rows = [row for row in csv_reader]
+        self.columns = CACHE_COLUMNS
+        self.records = load_runs(self.cache_file)
 
-    def insert_rows(self, rows):
+    def insert_rows(self, records):
         """
-        Crafts the insert statement for each row and then inserts that row
-        into the database. The values are first put into quotation marks to
-        account for the SQL date and time datatypes.
+        Inserts the runs in batches with a single commit, so nothing is kept
+        if a batch fails or on_progress raises to cancel. The missing values
+        are sent as None so MySQL stores them as NULL. The weekly and monthly
+        rollups and the personal records are then updated for the new runs.
         """
-        for row in rows:
-            values = [f"'{value}'" if value != 'NULL' else value for value in row]
-            statement = f"""INSERT INTO {self.table} ({', '.join(self.columns)}) 
-            VALUES ({', '.join(values)});"""
-            self.connection.execute_query(statement)
+        rows = records_to_rows(records)
+        if not rows:
+            return
+        statement = f"""INSERT INTO {self.table} ({', '.join(self.columns)})
+        VALUES ({', '.join(['%s'] * len(self.columns))})"""
+        cursor = self.connection.connection.cursor()
+        try:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(statement, rows[start:start + self.batch_size])
+                if self.on_progress:
+                    self.on_progress(min(start + self.batch_size, len(rows)), len(rows))
+            self.connection.commit()
+        except Exception:
+            self.connection.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.connection.mark_changed()
+        self.connection.rollups.refresh([row[0] for row in rows])
+        self.connection.records.add_runs([dict(zip(self.columns, row)) for row in rows])
 
     def add(self):
         """
         First queries the table to get the latest run's date and then adds all
-        runs from the CSV file that occurred after that date. If the table is
-        it will add all rows.
+        runs from the cache that occurred after that date. If the table is
+        empty it will add all rows.
         """
         select_statement = f"SELECT MAX(date) FROM {self.table};"
         last_date = self.connection.execute_query(select_statement)[0][0]
         if last_date:
-            new_rows = []
-            for row in self.rows:
-                row_datetime = datetime.datetime.strptime(row[0], '%Y-%m-%d').date()
-                if row_datetime > last_date:
-                    new_rows.append(row)
-            self.rows = new_rows
-        self.insert_rows(self.rows)
+            self.records = self.records[self.records['date'] > numpy.datetime64(last_date, 'D')]
+        self.insert_rows(self.records)
 
     def add_to_database(self):
         self.read_config_file()
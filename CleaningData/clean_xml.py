@@ -1,25 +1,39 @@
 """
 This program opens the Apple Health Data XML file and then extracts the
 health and workout data. That data is then converted to a pandas dataframe
-to be cleaned and then saved to a CSV file.
+to be cleaned and then saved to the cleaned data cache, a typed NumPy file
+described in run_cache.
 
 XML format:
 root element = HealthData,
 HealthData attributes (children) that are needed = Record, Workout.
 Workout attributes (children) = metadata and workoutStatistcs with
 'type' and 'key' keys.
+
+With streaming on, the file is streamed with iter_export and only the
+workouts and VO2 max records are kept, instead of parsing the whole export
+into a tree that can take gigabytes of memory.
 """
 
+import copy
 import numpy
 import pandas as pd
 import xml.etree.ElementTree as Et
 from constants import *
+from run_cache import cache_path, rows_to_records, save_runs
+from CleaningData.export_stream import iter_export
 import configparser
 
 
+VO2_MAX_TYPE = 'HKQuantityTypeIdentifierVO2Max'
+
+
 class CleanXML:
-    def __init__(self, config_file):
+    def __init__(self, config_file, streaming=False):
         self.config_file = config_file
+        self.streaming = streaming
+        self.on_read = None  # Called with the bytes read while streaming
+        self.runs_found = 0
         # The columns that I will have and will use in my MySQL table
         self.table_columns = ['date', 'start_time', 'distance', 'duration', 'pace',
                               'calories', 'vo2_max', 'avg_hr', 'max_hr', 'min_hr',
@@ -32,13 +46,27 @@ class CleanXML:
         config = configparser.ConfigParser()
         config.read(self.config_file)
         self.xml_file = config.get('directory_info', 'OLD_XML_FILE')
-        self.cleaned_data = config.get('directory_info', 'CLEANED_DATA')
+        self.cleaned_data = cache_path(config.get('directory_info', 'CLEANED_DATA'))
 
     def create_tree(self):
         # Parse the element tree and get the root
         tree = Et.parse(self.xml_file)
         self.root = tree.getroot()
 
+    def stream_tree(self):
+        """
+        Builds a root holding copies of only the workouts and VO2 max
+        records while streaming the file. The other methods read it the
+        same as the whole tree.
+        """
+        self.root = Et.Element('HealthData')
+        for element in iter_export(self.xml_file, self.on_read):
+            if element.tag == 'Workout' or (element.tag == 'Record'
+                                            and element.get('type') == VO2_MAX_TYPE):
+                self.root.append(copy.deepcopy(element))
+                if element.get('workoutActivityType') == 'HKWorkoutActivityTypeRunning':
+                    self.runs_found += 1
+
 ###############################################################################
 # Extract the desired data from the workouts elements and their children
 ###############################################################################
@@ -86,8 +114,7 @@ class CleanXML:
         to that workouts dictionary in the main workouts list.
         """
         # Get only the records for vo2 max data
-        vo2_type = 'HKQuantityTypeIdentifierVO2Max'
-        vo2_records = [record.attrib for record in self.root.iter('Record') if record.attrib['type'] == vo2_type]
+        vo2_records = [record.attrib for record in self.root.iter('Record') if record.attrib['type'] == VO2_MAX_TYPE]
 
         # Get all the vo2 records from a workout's start to end time and add the average
         # to the workout dictionary
@@ -214,21 +241,24 @@ class CleanXML:
             if int(row['duration']) < 59:
                 self.df.drop(index=index, axis=0, inplace=True)
 
-    def save_to_csv(self):
+    def save_to_cache(self):
         """
-        Saves the pandas dataframe as a CSV file that can be imported into
-        MySQL with either an import statement or by reading the CSV and adding
-        each run row by row.
+        Saves the pandas dataframe as a structured array with the 'NULL'
+        values marked as missing, which is loaded into MySQL without parsing
+        any strings.
         """
-        self.df.to_csv(self.cleaned_data, index=False)
+        save_runs(self.cleaned_data, rows_to_records(self.df.itertuples(index=False)))
 
     def clean_file(self):
         """
         A single method that calls all the methods in the proper order to
-        run the program and output the csv file.
+        run the program and output the cleaned data cache.
         """
         self.get_files()
-        self.create_tree()
+        if self.streaming:
+            self.stream_tree()
+        else:
+            self.create_tree()
         self.get_workout_data()
         self.get_vo2_max()
         self.convert_missing_to_null()
@@ -240,4 +270,4 @@ class CleanXML:
         self.calculate_pace()
         self.drop_columns()
         self.delete_rows()
-        self.save_to_csv()
+        self.save_to_cache()
@@ -0,0 +1,67 @@
+"""
+This module streams the elements of the export XML file so the ingest stages
+can read it without building the whole element tree, which takes gigabytes
+of memory for a large export. Every element is yielded once it has been
+read, and the finished top level elements are then cleared from the root.
+A function can be given that is called with the bytes read so far each time
+the parser reads the next chunk of the file, to show progress or to stop the
+parse by raising an exception.
+"""
+
+import xml.etree.ElementTree as Et
+
+
+class ProgressReader:
+    """
+    Wraps a binary file and calls on_read with the total bytes read after
+    every read.
+    """
+    def __init__(self, file, on_read):
+        self.file = file
+        self.on_read = on_read
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.bytes_read += len(data)
+        self.on_read(self.bytes_read)
+        return data
+
+
+def iter_export(xml_file, on_read=None):
+    """
+    Yields each element of the XML file when its end tag is read, children
+    before their parents. An element must not be kept after the loop moves
+    on since it is cleared once its top level element is finished.
+    """
+    if on_read is None:
+        yield from iter_elements(xml_file)
+        return
+    with open(xml_file, 'rb') as file:
+        yield from iter_elements(ProgressReader(file, on_read))
+
+
+def iter_elements(source):
+    depth = 0
+    root = None
+    for event, element in Et.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        yield element
+        # Drop the finished top level elements from the root
+        if depth == 1:
+            root.clear()
+
+
+def route_file_reference(workout) -> str | None:
+    """
+    Returns the path of a workout's GPX route file relative to the export
+    folder, or None if the workout has no route.
+    """
+    for reference in workout.iter('FileReference'):
+        return reference.get('path', '').lstrip('/')
+    return None
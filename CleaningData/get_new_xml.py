@@ -1,19 +1,46 @@
 """
 This module first checks to see if there is a new export ZIP file. If so it
 opens and extracts the new export XML file and replaces the old XML file in the
-program directory. It will get the most recently modified ZIP folder if there
-are multiple files in the directory.
+program directory. The workout-routes folder of GPX files is moved to the
+CleaningData directory for the route ingest. It will get the most recently
+modified ZIP folder if there are multiple files in the directory.
+
+Each export is identified by the SHA-256 of its export.xml, which is
+streamed out of the ZIP a chunk at a time. The fingerprints of the exports
+that have been loaded are kept in a file in the CleaningData directory with
+the database and table they were loaded into, so a download of the same
+export again is skipped instead of being cleaned and loaded a second time,
+while a new or reset database still loads it.
 """
 import configparser
-from zipfile import ZipFile
+import hashlib
+from zipfile import ZipFile, BadZipFile
 import shutil
 from pathlib import Path
 
+PROCESSED_EXPORTS_FILE = 'processed_exports.txt'
+XML_ENTRY_NAME = 'export.xml'
+
+# Chunk size for hashing the export
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def hash_file(file) -> str:
+    """
+    Returns the SHA-256 of an open binary file, read a chunk at a time.
+    """
+    digest = hashlib.sha256()
+    while chunk := file.read(HASH_CHUNK_BYTES):
+        digest.update(chunk)
+    return f"sha256:{digest.hexdigest()}"
+
 
 class GetNewXML:
     def __init__(self, config_file, new_file=False):
         self.new_file = new_file
         self.config_file = config_file
+        self.fingerprint = None
+        self.already_processed = False
 
     def get_file_names(self):
         self.config = configparser.ConfigParser()
@@ -23,20 +50,81 @@ class GetNewXML:
         self.downloads_folder = Path(self.config.get('directory_info', 'downloads_directory'))
         self.unzipped_file = Path(self.config.get('directory_info', 'unzipped_file'))
         self.unzipped_folder = Path(self.config.get('directory_info', 'unzipped_folder'))
+        cleaning_data = self.config.get('directory_info', 'cleaning_data_directory')
+        self.routes_folder = Path(self.config.get(
+            'directory_info', 'routes_directory',
+            fallback=str(Path(cleaning_data, 'workout-routes'))))
+        self.processed_exports = Path(cleaning_data, PROCESSED_EXPORTS_FILE)
+        # The processed exports are kept for each database and table
+        self.database_key = (f"{self.config.get('mysql_info', 'database', fallback='')}."
+                             f"{self.config.get('mysql_info', 'table', fallback='')}")
 
     def check_for_file(self):
         """
         The program first goes to the downloads folder and checks for an
-        export.zip file. If there is no file it returns False.
+        export.zip file. If there is no file it returns False. An export
+        that has already been loaded is left where it is and skipped.
         """
-        self.get_file_names()
-        if Path.exists(self.zip_file):
-            self.check_for_multiple_files()
+        if self.find_new_export():
             # Delete the old xml file from the clean old data folder
             if Path.exists(self.old_xml_file):
                 self.old_xml_file.unlink()
             self.unzip_file()
 
+    def find_new_export(self) -> bool:
+        """
+        Returns whether there is an export ZIP in the downloads folder that
+        hasn't been loaded yet. Nothing is extracted.
+        """
+        self.get_file_names()
+        if not Path.exists(self.zip_file):
+            return False
+        self.check_for_multiple_files()
+        self.already_processed = self.fingerprint is None
+        return not self.already_processed
+
+    def get_fingerprint(self, zip_file=None) -> str:
+        """
+        Returns the SHA-256 of the export.xml entry, decompressed a chunk at
+        a time. If the entry can't be found the whole ZIP is hashed instead.
+        """
+        zip_file = zip_file or self.zip_file
+        try:
+            with ZipFile(zip_file, 'r') as zip_object:
+                for info in zip_object.infolist():
+                    if Path(info.filename).name == XML_ENTRY_NAME:
+                        with zip_object.open(info) as file:
+                            return hash_file(file)
+        except BadZipFile:
+            pass
+        with open(zip_file, 'rb') as file:
+            return hash_file(file)
+
+    def read_processed(self) -> set[str]:
+        """
+        Returns the fingerprints of the exports that have been loaded into
+        the configured database and table. Each line is the database and
+        table followed by the fingerprint.
+        """
+        if not Path.exists(self.processed_exports):
+            return set()
+        fingerprints = set()
+        with open(self.processed_exports, 'r') as file:
+            for line in file:
+                key, _, fingerprint = line.strip().partition(' ')
+                if key == self.database_key and fingerprint:
+                    fingerprints.add(fingerprint)
+        return fingerprints
+
+    def record_processed(self):
+        """
+        Adds the export's fingerprint to the processed exports. Called once
+        the export has been loaded into the database.
+        """
+        if self.fingerprint and self.fingerprint not in self.read_processed():
+            with open(self.processed_exports, 'a') as file:
+                file.write(f"{self.database_key} {self.fingerprint}\n")
+
     def unzip_file(self):
         """
         Unzips the export file. This will result in multiple files and a
@@ -51,35 +139,57 @@ class GetNewXML:
         """
         Once the zip file has been extracted the 'Apple Health Export'
         directory is searched for the export.xml file. If it exists it is
-        moved to the program directory
+        moved to the program directory along with the workout-routes folder,
+        which replaces the routes from the last export.
         """
         if Path.exists(self.unzipped_file):
             self.unzipped_file.rename(self.old_xml_file)
+            exported_routes = Path.joinpath(self.unzipped_folder, 'workout-routes')
+            if Path.exists(exported_routes):
+                if Path.exists(self.routes_folder):
+                    shutil.rmtree(self.routes_folder)
+                shutil.move(exported_routes, self.routes_folder)
             self.delete_files()
 
     def delete_files(self):
         """
         It is first verified that the new export.xml file has been moved to
-        the program directory. If so, all the zip and extracted files are
-        deleted from the downloads folder to free up space.
+        the program directory. If so, the extracted files are deleted from
+        the downloads folder to free up space. The ZIP is kept until the
+        export has been loaded, so a load that is cancelled or fails can be
+        run again.
         """
         if Path.exists(self.old_xml_file):
-            # Delete the export files from the downloads folder
+            # Delete the extracted files from the downloads folder
             shutil.rmtree(self.unzipped_folder)
-            self.zip_file.unlink()
             self.new_file = True
 
+    def delete_zip(self):
+        """
+        Deletes the export ZIP from the downloads folder once it has been
+        loaded.
+        """
+        if Path.exists(self.zip_file):
+            self.zip_file.unlink()
+
     def check_for_multiple_files(self):
         """
         Checks if there are multiple export files in the downloads folder.
-        If so the most recently created file is used.
-        """
-        files = [(file, file.stat().st_mtime) for file in self.downloads_folder.glob('export*.zip')]
-        if len(files) > 1:
-            creation_time = 0
-            for file, time in files:
-                if time > creation_time:
-                    creation_time = time
-                    self.zip_file = file
+        If so the most recently created file that hasn't been loaded is
+        used, so an older export isn't skipped because a newer one was
+        already loaded. The fingerprint is left as None if every export has
+        been loaded.
+        """
+        files = {file: file.stat().st_mtime
+                 for file in self.downloads_folder.glob('export*.zip')}
+        files.setdefault(self.zip_file, self.zip_file.stat().st_mtime)
+        processed = self.read_processed()
+        self.fingerprint = None
+        for file in sorted(files, key=files.get, reverse=True):
+            fingerprint = self.get_fingerprint(file)
+            if fingerprint not in processed:
+                self.zip_file = file
+                self.fingerprint = fingerprint
+                return
 
 
@@ -0,0 +1,168 @@
+"""
+This module stores the heart rate samples recorded during each run. The
+export has hundreds of thousands of heart rate Records, far more than the
+runs, so the XML file is streamed with iter_export and each element is
+cleared once it has been read instead of building the whole tree. The same
+pass records each running workout's route file for the route ingest. The
+sample times are converted with numpy in one pass, each sample is matched to
+the running workout it falls in with searchsorted, and the samples are
+written to the heart rate table in large batches with executemany.
+
+Each sample is stored as the run id, the number of seconds since the start
+of the run and the beats per minute, which fit in 8 bytes a row. Runs that
+already have samples are skipped so the same export can be loaded again.
+"""
+
+import numpy
+from constants import *
+from CleaningData.export_stream import iter_export, route_file_reference
+import configparser
+
+HEART_RATE_TYPE = 'HKQuantityTypeIdentifierHeartRate'
+RUNNING_TYPE = 'HKWorkoutActivityTypeRunning'
+
+# How many samples are sent to MySQL in each executemany
+BATCH_SIZE = 10000
+
+
+def parse_export_times(times) -> numpy.ndarray:
+    """
+    Converts a list of export time strings such as
+    '2023-05-01 07:12:33 -0400' to UTC datetime64 seconds in one pass.
+    """
+    if not times:
+        return numpy.array([], dtype='datetime64[s]')
+    # View each string as an array of characters to slice every time at once
+    characters = numpy.array(times, dtype='U25').view('U1').reshape(-1, 25)
+    local = characters[:, :19].copy()
+    local[:, 10] = 'T'
+    local = local.view('U19').ravel().astype('datetime64[s]')
+    hours = characters[:, 21:23].copy().view('U2').ravel().astype(numpy.int64)
+    minutes = characters[:, 23:25].copy().view('U2').ravel().astype(numpy.int64)
+    sign = numpy.where(characters[:, 20] == '-', -1, 1)
+    offset = sign * (hours * 3600 + minutes * 60)
+    return local - offset.astype('timedelta64[s]')
+
+
+class HeartRateIngest:
+    def __init__(self, connection, config_file):
+        self.connection = connection
+        self.config_file = config_file
+        self.table = f"{connection.table}_heart_rate"
+        self.rows_added = 0
+        self.batch_size = BATCH_SIZE
+        self.on_read = None  # Called with the bytes of the export read
+        self.on_progress = None  # Called with the samples inserted and total
+        self.route_files = {}  # Route file of each running workout's start
+
+    def get_files(self):
+        config = configparser.ConfigParser()
+        config.read(self.config_file)
+        self.xml_file = config.get('directory_info', 'OLD_XML_FILE')
+
+    def create_table(self):
+        self.connection.execute_query(f"""CREATE TABLE IF NOT EXISTS {self.table} (
+        run_id INT UNSIGNED NOT NULL, second_offset MEDIUMINT UNSIGNED NOT NULL,
+        bpm TINYINT UNSIGNED NOT NULL, PRIMARY KEY (run_id, second_offset));""")
+
+    def stream_export(self):
+        """
+        Reads the heart rate samples, the running workouts' start and end
+        times and their route files from the XML file without keeping the
+        elements in memory.
+        """
+        self.sample_times, self.sample_values = [], []
+        self.workout_starts, self.workout_ends = [], []
+        self.route_files = {}
+        for element in iter_export(self.xml_file, self.on_read):
+            if element.tag == 'Record':
+                if element.get('type') == HEART_RATE_TYPE:
+                    self.sample_times.append(element.get('startDate'))
+                    self.sample_values.append(element.get('value'))
+            elif element.tag == 'Workout':
+                if element.get('workoutActivityType') == RUNNING_TYPE:
+                    start = element.get('startDate')
+                    self.workout_starts.append(start)
+                    self.workout_ends.append(element.get('endDate'))
+                    route_file = route_file_reference(element)
+                    if route_file:
+                        self.route_files[start] = route_file
+
+    def match_samples(self) -> numpy.ndarray:
+        """
+        Returns an array of (run_id, second_offset, bpm) rows for the samples
+        recorded during a run in the database that has no samples yet.
+        """
+        # The runs are stored by their local start date and time
+        run_ids = self.connection.get_run_ids_by_start()
+        existing = {row[0] for row in self.connection.execute_query(
+            f"SELECT DISTINCT run_id FROM {self.table};")}
+        workouts = []
+        for start, end in zip(self.workout_starts, self.workout_ends):
+            local_start = datetime.datetime.strptime(start[:19], '%Y-%m-%d %H:%M:%S')
+            run_id = run_ids.get(local_start)
+            if run_id is not None and run_id not in existing:
+                workouts.append((start, end, run_id))
+        if not workouts or not self.sample_times:
+            return numpy.empty((0, 3), dtype=numpy.int64)
+
+        starts = parse_export_times([workout[0] for workout in workouts])
+        ends = parse_export_times([workout[1] for workout in workouts])
+        ids = numpy.array([workout[2] for workout in workouts], dtype=numpy.int64)
+        order = numpy.argsort(starts)
+        starts, ends, ids = starts[order], ends[order], ids[order]
+        times = parse_export_times(self.sample_times)
+        bpm = numpy.array(self.sample_values, dtype=float).round().astype(numpy.int64)
+
+        # The workout each sample falls in is the last one starting before it
+        index = numpy.searchsorted(starts, times, side='right') - 1
+        during = index >= 0
+        during[during] &= times[during] <= ends[index[during]]
+        index = index[during]
+        offsets = (times[during] - starts[index]).astype(numpy.int64)
+        rows = numpy.column_stack([ids[index], offsets,
+                                   numpy.clip(bpm[during], 0, 255)])
+        return rows[numpy.lexsort((rows[:, 1], rows[:, 0]))]
+
+    def insert_samples(self, rows):
+        """
+        Writes the rows in batches with a single commit. Samples recorded in
+        the same second are only stored once. Nothing is kept if a batch
+        fails or on_progress raises to cancel.
+        """
+        statement = f"""INSERT IGNORE INTO {self.table} (run_id, second_offset, bpm)
+        VALUES (%s, %s, %s)"""
+        cursor = self.connection.connection.cursor()
+        try:
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size].tolist()
+                cursor.executemany(statement, batch)
+                if self.on_progress:
+                    self.on_progress(start + len(batch), len(rows))
+            self.connection.commit()
+        except Exception:
+            self.connection.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.rows_added = len(rows)
+        self.connection.mark_changed()
+
+    def ingest(self):
+        """
+        A single method that calls all the methods in the proper order. The
+        runs must already be in the database.
+        """
+        self.create_table()
+        self.load()
+
+    def load(self):
+        """
+        Reads the samples from the export and inserts them. The table must
+        already exist.
+        """
+        self.get_files()
+        self.stream_export()
+        rows = self.match_samples()
+        if len(rows):
+            self.insert_samples(rows)
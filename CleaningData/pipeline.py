@@ -0,0 +1,190 @@
+"""
+This module runs the stages of loading a new export in order: extracting the
+export ZIP, cleaning the XML file, adding the new runs to the database and
+then storing their heart rate samples and routes. The login, the folder
+watcher and the command line all load exports through it. The number of rows
+each stage added is kept in counts.
+
+The XML file can be streamed while cleaning instead of parsed into a whole
+tree, the route files can be parsed without the process pool and the batch
+size of the loaders' executemany calls can be changed.
+
+The pipeline can be run on another thread. If a progress function is given
+it is called from that thread with the stage, a description and the fraction
+done (None when it isn't known) as the export is read and the rows are
+inserted. cancel() can be called from any thread. The next progress update
+then raises IngestCancelled. The runs, heart rates and routes are added in
+one transaction, so a cancelled or failed load keeps none of them, and the
+export ZIP is only deleted once everything has been added, so the export can
+be loaded again.
+"""
+
+import threading
+from pathlib import Path
+from CleaningData.get_new_xml import GetNewXML
+
+MEGABYTE = 1024 * 1024
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+class IngestPipeline:
+    def __init__(self, connection, config_path, streaming=False, parallel=True,
+                 batch_size=None, progress=None):
+        self.connection = connection
+        self.config_path = config_path
+        self.streaming = streaming
+        self.parallel = parallel
+        self.batch_size = batch_size  # The loaders' own sizes if None
+        self.progress = progress
+        self.cancelled = threading.Event()
+        self.check = None
+        self.heart_rate = None
+        self.counts = {'cleaned_runs': 0, 'runs': 0, 'heart_rate_samples': 0,
+                       'routes': 0}
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def report(self, stage, detail, fraction=None):
+        """
+        Passes a progress update on, or stops the stage if the ingest has
+        been cancelled.
+        """
+        if self.cancelled.is_set():
+            raise IngestCancelled(stage)
+        if self.progress:
+            self.progress(stage, detail, fraction)
+
+    def watch_reading(self, stage, xml_file, found=None):
+        """
+        Returns an on_read function that reports the megabytes of the XML
+        file read and, if found is given, how many runs it has found.
+        """
+        total = max(Path(xml_file).stat().st_size, 1)
+
+        def on_read(bytes_read):
+            detail = f"{bytes_read / MEGABYTE:,.1f} of {total / MEGABYTE:,.1f} MB read"
+            if found:
+                detail += f", {found():,} runs found"
+            self.report(stage, detail, bytes_read / total)
+        return on_read
+
+    def watch_rows(self, stage, unit):
+        """
+        Returns an on_progress function that reports the rows done.
+        """
+        def on_progress(done, total):
+            self.report(stage, f"{done:,} of {total:,} {unit}", done / max(total, 1))
+        return on_progress
+
+    def set_batch_size(self, loader):
+        if self.batch_size:
+            loader.batch_size = self.batch_size
+
+    def unzip(self) -> bool:
+        """
+        Extracts the export if there is one that hasn't been loaded yet and
+        returns whether there was.
+        """
+        self.report('Extracting export', 'Checking the downloads folder')
+        self.check = GetNewXML(config_file=self.config_path)
+        self.check.check_for_file()
+        return self.check.new_file
+
+    def clean(self):
+        from CleaningData.clean_xml import CleanXML
+
+        self.report('Cleaning export', 'Reading the export')
+        cleaner = CleanXML(self.config_path, streaming=self.streaming)
+        if self.progress and self.streaming:
+            cleaner.get_files()
+            cleaner.on_read = self.watch_reading('Cleaning export', cleaner.xml_file,
+                                                 lambda: cleaner.runs_found)
+        cleaner.clean_file()
+        self.counts['cleaned_runs'] = len(cleaner.df)
+
+    def prepare(self):
+        """
+        Creates the heart rate, route and route index tables before loading,
+        since creating a table commits the transaction the load runs in.
+        """
+        from CleaningData.heart_rate_ingest import HeartRateIngest
+        from CleaningData.route_ingest import RouteIngest
+
+        self.report('Preparing tables', 'Creating any missing tables')
+        HeartRateIngest(self.connection, self.config_path).create_table()
+        RouteIngest(self.connection, self.config_path).create_tables()
+
+    def load(self):
+        from CleaningData.add_csv_to_database import AddCSVtoDatabase
+
+        self.report('Adding runs', 'Finding the new runs')
+        add = AddCSVtoDatabase(self.connection, config_path=self.config_path)
+        self.set_batch_size(add)
+        add.on_progress = self.watch_rows('Adding runs', 'runs inserted')
+        add.add_to_database()
+        self.counts['runs'] = len(add.records)
+
+    def load_heart_rate(self):
+        from CleaningData.heart_rate_ingest import HeartRateIngest
+
+        self.report('Adding heart rates', 'Reading the export')
+        self.heart_rate = HeartRateIngest(self.connection, self.config_path)
+        self.set_batch_size(self.heart_rate)
+        if self.progress:
+            self.heart_rate.get_files()
+            self.heart_rate.on_read = self.watch_reading('Adding heart rates',
+                                                         self.heart_rate.xml_file)
+        self.heart_rate.on_progress = self.watch_rows('Adding heart rates',
+                                                      'samples inserted')
+        self.heart_rate.load()
+        self.counts['heart_rate_samples'] = self.heart_rate.rows_added
+
+    def load_routes(self):
+        """
+        Stores the routes using the route files found by the heart rate
+        stage, or reads them from the export if it hasn't run.
+        """
+        from CleaningData.route_ingest import RouteIngest
+
+        self.report('Adding routes', 'Finding the route files')
+        route_files = self.heart_rate.route_files if self.heart_rate else None
+        routes = RouteIngest(self.connection, self.config_path, route_files)
+        routes.parallel = self.parallel
+        self.set_batch_size(routes)
+        routes.on_progress = self.watch_rows('Adding routes', 'routes read')
+        routes.load()
+        self.counts['routes'] = routes.rows_added
+
+    def load_export(self):
+        """
+        Adds the runs, heart rates and routes in one transaction, so nothing
+        is kept if the load is cancelled or fails.
+        """
+        self.prepare()
+        with self.connection.transaction():
+            self.load()
+            self.load_heart_rate()
+            self.load_routes()
+
+    def finish(self):
+        """
+        Records the export as loaded so it is skipped if it is downloaded
+        again and deletes its ZIP.
+        """
+        self.check.record_processed()
+        self.check.delete_zip()
+
+    def run(self) -> bool:
+        """
+        Runs every stage and returns whether a new export was loaded.
+        """
+        if not self.unzip():
+            return False
+        self.clean()
+        self.load_export()
+        self.finish()
+        return True
@@ -0,0 +1,297 @@
+"""
+This module stores the GPS route of each run from the workout-routes folder
+of the export, which has a GPX file for every run recorded with GPS. The
+files are parsed in a process pool since an export can have thousands of
+them. The distance, elevation gain and mile splits are calculated with numpy
+over the whole route at once, using the haversine formula for the distance
+between points. Each route is stored with its run id as an encoded polyline,
+which is about 4 bytes a point, and the grid cells it passes through are
+added to the route index.
+
+The route files are matched to the runs through the FileReference of each
+running workout in the export XML file. The references can be passed in from
+the heart rate ingest, which reads them in the same pass over the file.
+"""
+
+import multiprocessing
+import numpy
+import os
+import xml.etree.ElementTree as Et
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from constants import *
+from CleaningData.export_stream import iter_export, route_file_reference
+from route_index import RouteIndex, cell_ids
+import configparser
+
+RUNNING_TYPE = 'HKWorkoutActivityTypeRunning'
+
+EARTH_RADIUS = 6371008.8  # Meters
+METERS_PER_MILE = 1609.344
+FEET_PER_METER = 3.28084
+
+# Fewer routes than this are parsed without starting a process pool
+MIN_PARALLEL_ROUTES = 8
+
+# How many routes are sent to MySQL in each executemany
+BATCH_SIZE = 500
+
+
+def read_gpx(path):
+    """
+    Returns the latitude, longitude, elevation (meters) and time (seconds
+    since the first point) arrays of a GPX file's track points. Missing
+    elevations and times are NaN.
+    """
+    latitudes, longitudes, elevations, times = [], [], [], []
+    for _, element in Et.iterparse(path):
+        if not element.tag.endswith('trkpt'):
+            continue
+        latitudes.append(element.get('lat'))
+        longitudes.append(element.get('lon'))
+        elevation = time = None
+        for child in element:
+            if child.tag.endswith('ele'):
+                elevation = child.text
+            elif child.tag.endswith('time'):
+                time = child.text[:19]
+        elevations.append(elevation if elevation is not None else 'nan')
+        times.append(time)
+        element.clear()
+    times = numpy.array(times, dtype='datetime64[s]')
+    timed = times[~numpy.isnat(times)]
+    if len(timed):
+        seconds = numpy.where(numpy.isnat(times), numpy.nan,
+                              (times - timed[0]).astype(float))
+    else:
+        seconds = numpy.full(len(times), numpy.nan)
+    return (numpy.array(latitudes, dtype=float), numpy.array(longitudes, dtype=float),
+            numpy.array(elevations, dtype=float), seconds)
+
+
+def segment_distances(latitudes, longitudes) -> numpy.ndarray:
+    """
+    Returns the distance in meters between each pair of consecutive points
+    with the haversine formula.
+    """
+    latitudes = numpy.radians(latitudes)
+    longitudes = numpy.radians(longitudes)
+    half_lat = numpy.diff(latitudes) / 2
+    half_lon = numpy.diff(longitudes) / 2
+    a = (numpy.sin(half_lat) ** 2
+         + numpy.cos(latitudes[:-1]) * numpy.cos(latitudes[1:]) * numpy.sin(half_lon) ** 2)
+    return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.clip(a, 0, 1)))
+
+
+def mile_splits(distances, seconds) -> numpy.ndarray:
+    """
+    Returns the seconds taken for each full mile, interpolating the time
+    each mile was reached between the timed points either side of it. A
+    mile outside the timed points is NaN.
+    """
+    total = numpy.concatenate([[0.0], numpy.cumsum(distances)])
+    miles = int(total[-1] // METERS_PER_MILE)
+    marks = numpy.arange(miles + 1) * METERS_PER_MILE
+    timed = numpy.isfinite(seconds)
+    if timed.sum() < 2:
+        return numpy.full(miles, numpy.nan)
+    return numpy.diff(numpy.interp(marks, total[timed], seconds[timed],
+                                   left=numpy.nan, right=numpy.nan))
+
+
+def encode_polyline(latitudes, longitudes) -> str:
+    """
+    Encodes the points with the Google encoded polyline algorithm. Each
+    value is the difference from the last point in 1e-5 degrees, split
+    into 5 bit chunks that are each written as one character.
+    """
+    points = numpy.round(numpy.column_stack([latitudes, longitudes]) * 1e5)
+    points = points.astype(numpy.int64)
+    deltas = numpy.diff(points, axis=0, prepend=numpy.zeros((1, 2), numpy.int64)).ravel()
+    values = numpy.where(deltas < 0, ~(deltas << 1), deltas << 1)
+
+    # Every value needs at least one chunk and one more for each 5 bits
+    bits = numpy.floor(numpy.log2(numpy.maximum(values, 1))).astype(numpy.int64) + 1
+    lengths = numpy.maximum((bits + 4) // 5, 1)
+    shifts = numpy.arange(7) * 5
+    chunks = (values[:, None] >> shifts) & 31
+    used = shifts < lengths[:, None] * 5
+    # All but the last chunk of a value are marked with 0x20
+    more = shifts < (lengths[:, None] - 1) * 5
+    characters = (chunks | numpy.where(more, 0x20, 0)) + 63
+    return characters[used].astype(numpy.uint8).tobytes().decode('ascii')
+
+
+def process_route(path):
+    """
+    Parses a route file and returns its summary, or None if the file can't
+    be read or has too few points. Splits that can't be timed because of
+    missing times are left out. This runs in the process pool.
+    """
+    try:
+        latitudes, longitudes, elevations, seconds = read_gpx(path)
+        if len(latitudes) < 2:
+            return None
+        distances = segment_distances(latitudes, longitudes)
+        climbs = numpy.diff(elevations)
+        gain = numpy.nansum(numpy.where(climbs > 0, climbs, 0)) * FEET_PER_METER
+        splits = mile_splits(distances, seconds)
+        splits = splits[numpy.isfinite(splits)]
+        return {'points': len(latitudes),
+                'distance': round(float(distances.sum()) / METERS_PER_MILE, 2),
+                'elevation_gain': int(round(gain)) if numpy.isfinite(gain) else 0,
+                'splits': ','.join(str(int(round(split))) for split in splits),
+                'polyline': encode_polyline(latitudes, longitudes),
+                'cells': cell_ids(latitudes, longitudes).tolist()}
+    except (Et.ParseError, OSError, ValueError, OverflowError):
+        return None
+
+
+class RouteIngest:
+    def __init__(self, connection, config_file, route_files=None):
+        """
+        route_files maps each running workout's start date string to its
+        route file, as read by the heart rate ingest. The export is read
+        again if it isn't given.
+        """
+        self.connection = connection
+        self.config_file = config_file
+        self.route_files = route_files
+        self.table = f"{connection.table}_routes"
+        self.rows_added = 0
+        self.batch_size = BATCH_SIZE
+        self.parallel = True  # Parse the route files in a process pool
+        self.on_read = None  # Called with the bytes of the export read
+        self.on_progress = None  # Called with the routes done and total
+        self.index = RouteIndex(connection)
+
+    def get_files(self):
+        config = configparser.ConfigParser()
+        config.read(self.config_file)
+        self.xml_file = config.get('directory_info', 'OLD_XML_FILE')
+        cleaning_data = config.get('directory_info', 'cleaning_data_directory')
+        self.routes_directory = Path(config.get(
+            'directory_info', 'routes_directory',
+            fallback=str(Path(cleaning_data, 'workout-routes'))))
+
+    def create_table(self):
+        self.connection.execute_query(f"""CREATE TABLE IF NOT EXISTS {self.table} (
+        run_id INT UNSIGNED PRIMARY KEY, points MEDIUMINT UNSIGNED,
+        distance DECIMAL(5, 2), elevation_gain SMALLINT UNSIGNED, splits TEXT,
+        polyline MEDIUMTEXT);""")
+
+    def read_route_files(self):
+        """
+        Reads the route file of each running workout from the export.
+        """
+        self.route_files = {}
+        for element in iter_export(self.xml_file, self.on_read):
+            if element.tag == 'Workout':
+                if element.get('workoutActivityType') == RUNNING_TYPE:
+                    route_file = route_file_reference(element)
+                    if route_file:
+                        self.route_files[element.get('startDate')] = route_file
+
+    def match_runs(self) -> list[tuple]:
+        """
+        Returns the run id and route file path of the runs in the database
+        that don't have a route yet and whose route file exists.
+        """
+        run_ids = self.connection.get_run_ids_by_start()
+        existing = {row[0] for row in self.connection.execute_query(
+            f"SELECT run_id FROM {self.table};")}
+        matches = []
+        for start, route_file in self.route_files.items():
+            local_start = datetime.datetime.strptime(start[:19], '%Y-%m-%d %H:%M:%S')
+            run_id = run_ids.get(local_start)
+            path = Path.joinpath(self.routes_directory, Path(route_file).name)
+            if run_id is not None and run_id not in existing and path.exists():
+                matches.append((run_id, path))
+        return matches
+
+    def process_routes(self, paths) -> list:
+        """
+        Parses the route files, in a process pool if there are enough of
+        them.
+        """
+        if not self.parallel or len(paths) < MIN_PARALLEL_ROUTES:
+            return self.collect_routes(map(process_route, paths), len(paths))
+        chunksize = max(1, len(paths) // ((os.cpu_count() or 1) * 4))
+        # Spawned since forking while Tk is running on another thread is unsafe
+        executor = ProcessPoolExecutor(mp_context=multiprocessing.get_context('spawn'))
+        try:
+            return self.collect_routes(executor.map(process_route, paths,
+                                                    chunksize=chunksize), len(paths))
+        finally:
+            # Drops the routes not started yet if on_progress raised to cancel
+            executor.shutdown(cancel_futures=True)
+
+    def collect_routes(self, results, total) -> list:
+        routes = []
+        for route in results:
+            routes.append(route)
+            if self.on_progress:
+                self.on_progress(len(routes), total)
+        return routes
+
+    def insert_routes(self, rows, cells):
+        """
+        Writes the routes and their (cell_id, run_id) index rows in batches
+        with a single commit. Nothing is kept if a batch fails.
+        """
+        statement = f"""INSERT INTO {self.table}
+        (run_id, points, distance, elevation_gain, splits, polyline)
+        VALUES (%s, %s, %s, %s, %s, %s)"""
+        cursor = self.connection.connection.cursor()
+        try:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(statement, rows[start:start + self.batch_size])
+            cell_batch = self.batch_size * 20
+            for start in range(0, len(cells), cell_batch):
+                cursor.executemany(self.index.insert_statement(),
+                                   cells[start:start + cell_batch])
+            self.connection.commit()
+        except Exception:
+            self.connection.connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.rows_added = len(rows)
+        self.connection.mark_changed()
+
+    def ingest(self):
+        """
+        A single method that calls all the methods in the proper order. The
+        runs must already be in the database.
+        """
+        self.create_tables()
+        self.load()
+
+    def create_tables(self):
+        """
+        Creates the route and route index tables and indexes any stored
+        routes that are missing from the index.
+        """
+        self.create_table()
+        self.index.create_table()
+        self.index.add_missing_routes()
+
+    def load(self):
+        """
+        Parses the route files of the runs that don't have a route yet and
+        inserts them. The tables must already exist.
+        """
+        self.get_files()
+        if self.route_files is None:
+            self.read_route_files()
+        matches = self.match_runs()
+        routes = self.process_routes([path for _, path in matches])
+        rows, cells = [], []
+        for (run_id, _), route in zip(matches, routes):
+            if route:
+                rows.append((run_id, route['points'], route['distance'],
+                             route['elevation_gain'], route['splits'],
+                             route['polyline']))
+                cells += [(cell, run_id) for cell in route['cells']]
+        if rows:
+            self.insert_routes(rows, cells)
@@ -0,0 +1,231 @@
+"""
+This module watches the downloads folder for new export ZIP files while the
+app is open and loads them in the background, so logging in never waits on
+an import. On Linux the folder is watched with inotify through ctypes, which
+wakes the watcher as soon as a file is finished being written or is renamed
+into the folder. On other systems, or if inotify can't be used, the folder is
+checked every POLL_SECONDS and a ZIP is only loaded once its size and
+modified time have stopped changing between two checks.
+
+Each export is loaded by the ingest pipeline in a worker process with its own
+database connection, so the cleaning never competes with the GUI for the
+interpreter. The watcher reports what happened on its events queue, which
+the main window reads to reload its pages once new runs have been added.
+"""
+
+import ctypes
+import ctypes.util
+import multiprocessing
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+from pathlib import Path
+from constants import *
+from CleaningData.get_new_xml import GetNewXML
+
+EXPORT_PATTERN = 'export*.zip'
+
+# How often (seconds) the folder is checked when inotify isn't available.
+# inotify also uses it as the longest wait before checking for stop().
+POLL_SECONDS = 5
+
+# inotify event masks from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+# wd, mask, cookie and name length of each inotify event
+EVENT_HEADER = struct.Struct('iIII')
+EVENT_BUFFER_BYTES = 64 * 1024
+
+
+def read_event_names(data: bytes) -> list[str]:
+    """
+    Returns the file names of the inotify events read from the descriptor.
+    Each name is padded with null bytes to the length in its header.
+    """
+    names = []
+    offset = 0
+    while offset + EVENT_HEADER.size <= len(data):
+        _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        name = data[offset:offset + length].rstrip(b'\0')
+        names.append(os.fsdecode(name))
+        offset += length
+    return names
+
+
+def ingest_export(user, password, database, table, config_path, results):
+    """
+    Loads the new export in the worker process and puts the outcome and the
+    rows added on the results queue.
+    """
+    try:
+        from database import Database
+        from CleaningData.pipeline import IngestPipeline
+
+        connection = Database(user, password, database, table)
+        try:
+            pipeline = IngestPipeline(connection, config_path, streaming=True)
+            loaded = pipeline.run()
+        finally:
+            connection.connection.close()
+    except Exception as error:
+        results.put(('failed', str(error)))
+    else:
+        results.put(('finished' if loaded else 'skipped', pipeline.counts))
+
+
+class ExportWatcher:
+    def __init__(self, connection, config_path):
+        self.connection = connection
+        self.config_path = config_path
+        config = read_config_file(config_path)
+        self.downloads = Path(config.get('directory_info', 'downloads_directory'))
+        self.events = queue.Queue()  # (event, detail) tuples read by the GUI
+        self.stopped = threading.Event()
+        self.thread = None
+        self.worker = None  # The ingest process while one is running
+
+    def start(self):
+        self.thread = threading.Thread(target=self.watch, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops watching once the current wait or ingest is over.
+        """
+        self.stopped.set()
+
+    def shutdown(self, timeout=POLL_SECONDS):
+        """
+        Stops watching and ends an ingest that is still running, since the
+        worker isn't a daemon and would keep the app open after its window
+        closes. The insert the worker is in the middle of is never committed.
+        """
+        self.stop()
+        worker = self.worker
+        if worker is not None and worker.is_alive():
+            worker.terminate()
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.kill()
+                worker.join()
+
+    def watch(self):
+        """
+        Loads an export already in the folder and then waits for new ones.
+        """
+        self.check_for_export()
+        descriptor = self.open_inotify()
+        if descriptor is None:
+            self.poll()
+        else:
+            try:
+                self.watch_inotify(descriptor)
+            finally:
+                os.close(descriptor)
+
+    def open_inotify(self) -> int | None:
+        """
+        Returns an inotify descriptor watching the downloads folder, or None
+        if inotify can't be used.
+        """
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                               use_errno=True)
+            descriptor = libc.inotify_init()
+        except (OSError, AttributeError):
+            return None
+        if descriptor < 0:
+            return None
+        watch = libc.inotify_add_watch(descriptor, os.fsencode(self.downloads),
+                                       IN_CLOSE_WRITE | IN_MOVED_TO)
+        if watch < 0:
+            os.close(descriptor)
+            return None
+        return descriptor
+
+    def watch_inotify(self, descriptor):
+        while not self.stopped.is_set():
+            ready, _, _ = select.select([descriptor], [], [], POLL_SECONDS)
+            if not ready:
+                continue
+            names = read_event_names(os.read(descriptor, EVENT_BUFFER_BYTES))
+            if any(Path(name).match(EXPORT_PATTERN) for name in names):
+                self.check_for_export()
+
+    def find_exports(self) -> dict:
+        """
+        Returns the modified time and size of each export ZIP in the folder.
+        """
+        exports = {}
+        for path in self.downloads.glob(EXPORT_PATTERN):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue  # Removed since the folder was listed
+            exports[path] = (stat.st_mtime, stat.st_size)
+        return exports
+
+    def poll(self):
+        """
+        Checks the folder every POLL_SECONDS. A file that is new or changed
+        is pending until a check finds it unchanged, since it may still be
+        downloading.
+        """
+        previous = self.find_exports()
+        pending = set()
+        while not self.stopped.wait(POLL_SECONDS):
+            current = self.find_exports()
+            ready = {path for path in pending if current.get(path) == previous.get(path)}
+            pending = {path for path, stat in current.items() if previous.get(path) != stat}
+            previous = current
+            if ready:
+                self.check_for_export()
+
+    def check_for_export(self):
+        """
+        Starts the ingest if there is an export that hasn't been loaded. The
+        check hashes the export in this thread, which is never the Tk
+        thread.
+        """
+        try:
+            if GetNewXML(config_file=self.config_path).find_new_export():
+                self.run_ingest()
+        except OSError as error:
+            self.events.put(('failed', str(error)))
+
+    def run_ingest(self):
+        """
+        Loads the export in a worker process and waits for its outcome. The
+        worker is started with spawn since forking a process that is running
+        Tk is unsafe, and it is not a daemon so the route ingest can start
+        its own process pool.
+        """
+        self.events.put(('started', None))
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        self.worker = worker = context.Process(target=ingest_export, args=(
+            self.connection.user, self.connection.password,
+            self.connection.database, self.connection.table,
+            str(self.config_path), results))
+        worker.start()
+        outcome = None
+        while outcome is None:
+            try:
+                outcome = results.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                if not worker.is_alive():
+                    try:
+                        outcome = results.get(timeout=1)
+                    except queue.Empty:
+                        outcome = ('failed', f"The ingest stopped with exit code "
+                                             f"{worker.exitcode}")
+        worker.join()
+        self.worker = None
+        self.events.put(outcome)
@@ -163,6 +163,16 @@ class AddRunPage:
             if entry != 'date':
                 self.entries_dict[entry].delete(0, END)
 
+    def refresh(self):
+        """
+        The page doesn't display any data from the database.
+        """
+        pass
+
+    def show(self):
+        self.frame.grid()
+        self.root.current_frame = self.frame
+
     def initialize(self):
         self.create_frame()
         self.fill_frame()
@@ -0,0 +1,51 @@
+"""
+This module reduces large series to about as many points as the canvas has
+pixels before they are drawn. Matplotlib spends most of its time drawing
+points that land on top of each other on screen, so removing them makes
+drawing and panning much faster without changing what the plot looks like.
+Both functions take numpy arrays and return the sorted indices of the points
+to keep.
+"""
+
+import numpy
+
+
+def min_max_downsample(x, y, buckets):
+    """
+    For a series sorted by x, splits the x range into equal buckets and keeps
+    the lowest and highest y point in each one. The peaks and dips of the
+    series are kept so a line drawn through the points looks the same.
+    """
+    if len(x) <= 2 * buckets:
+        return numpy.arange(len(x))
+    span = x[-1] - x[0]
+    if span <= 0:
+        return numpy.array([numpy.argmin(y), numpy.argmax(y)])
+    bins = ((x - x[0]) / span * (buckets - 1)).astype(numpy.int64)
+
+    # Sort by bucket and then by y so each bucket starts with its lowest
+    # point and ends with its highest
+    order = numpy.lexsort((y, bins))
+    sorted_bins = bins[order]
+    starts = numpy.flatnonzero(numpy.r_[True, sorted_bins[1:] != sorted_bins[:-1]])
+    ends = numpy.r_[starts[1:] - 1, len(order) - 1]
+    return numpy.unique(numpy.r_[order[starts], order[ends]])
+
+
+def pixel_downsample(x, y, x_limits, y_limits, width, height):
+    """
+    Keeps one point for each pixel of the plot area that has a point in it
+    and drops the points outside the limits. This works for scattered data
+    that isn't sorted.
+    """
+    x_low, x_high = x_limits
+    y_low, y_high = y_limits
+    visible = numpy.flatnonzero((x >= x_low) & (x <= x_high)
+                                & (y >= y_low) & (y <= y_high))
+    if len(visible) == 0:
+        return visible
+    columns = ((x[visible] - x_low) / ((x_high - x_low) or 1) * (width - 1))
+    rows = ((y[visible] - y_low) / ((y_high - y_low) or 1) * (height - 1))
+    pixels = columns.astype(numpy.int64) * int(height) + rows.astype(numpy.int64)
+    _, first = numpy.unique(pixels, return_index=True)
+    return numpy.sort(visible[first])
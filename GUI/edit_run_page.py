@@ -52,6 +52,9 @@ class EditRunPage:
         the entries so that the user can make changes.
         """
         # First checks to make sure a run has been selected
+        if self.root.table.grouped:
+            messagebox.showwarning(message="Search for runs instead of a summary to edit")
+            return
         try:
             row = self.root.table.run_table.selection()[0]
         except IndexError:
@@ -78,6 +81,9 @@ class EditRunPage:
         Deletes the selected run from the database and reloads the table to
         no longer include the deleted run.
         """
+        if self.root.table.grouped:
+            messagebox.showwarning(message="Search for runs instead of a summary to delete")
+            return
         try:  # First make sure that a run has been selected
             row = self.root.table.run_table.selection()[0]
         except IndexError:
@@ -90,6 +96,18 @@ class EditRunPage:
                 self.root.connection.delete(date)
                 self.root.table.fill_table()
 
+    def refresh(self):
+        """
+        The page doesn't display any data from the database.
+        """
+        pass
+
+    def show(self):
+        self.frame.grid()
+        self.buttons_frame.grid()
+        self.root.current_frame = self.frame
+        self.root.edit_buttons_frame = self.buttons_frame
+
     def initialize(self):
         self.create_enter_frame()
         self.reconfigure_frame()
@@ -1,18 +1,30 @@
 """
 This module houses the class that serves as the home/welcome page of the app.
 This is the page that will appear when the app is initialized after logging in.
-It queries the database and displays run summary information.
+It queries the database and displays run summary information, including the
+current training load from the rolling training metrics, the fitness, fatigue
+and form from the fitness model and the personal records. The summaries are
+only queried again when the database has changed.
 """
 
 from tkinter import *
 from constants import *
+from records import RECORDS, RECORD_NAMES
 import platform
 
 
+def format_pace(minutes) -> str:
+    """
+    Formats a pace in minutes as minutes:seconds.
+    """
+    return str(datetime.timedelta(minutes=float(minutes)))[2:7]
+
+
 class HomePage:
     def __init__(self, root):
         self.root = root
         self.table = self.root.connection.table
+        self.data_version = None  # Database version the summaries are from
 
     def create_frame(self):
         """
@@ -26,7 +38,13 @@ class HomePage:
         text = "Welcome To Your Personal Run Tracking APP"
         welcome_label = Label(self.frame, text=text)
         welcome_label.grid(row=0, column=0, pady=10, padx=10)
+        self.create_summary_frame()
 
+    def create_summary_frame(self):
+        """
+        Creates the frame that holds the summary labels so that it can be
+        destroyed and rebuilt when the summaries are out of date.
+        """
         self.summary_frame = Frame(self.frame, borderwidth=2,
                                    relief='sunken')
         self.summary_frame.grid(row=1, column=0)
@@ -39,29 +57,31 @@ class HomePage:
         Queries the database and displays the information about the users run
         history.
         """
+        # The longest runs and quickest pace come from the personal records
+        records = self.root.connection.records.get_records()
+
         # Display the longest run time
-        long_statement = f"SELECT MAX(duration) FROM {self.table};"
-        long_query = self.root.connection.execute_query(long_statement)[0][0]
-        display_time = datetime.timedelta(minutes=float(long_query))
-        display_time = str(display_time)[:7]
+        long_query = records.get('longest_duration', (None, None))[1]
+        if long_query is None:
+            display_time = '-'
+        else:
+            display_time = str(datetime.timedelta(minutes=float(long_query)))[:7]
         if platform.system() == 'Darwin':
             longest = Label(self.summary_frame, text=f"Longest Run (Time):\t\t{display_time}")
-        elif platform.system() == 'Windows':
+        else:
             longest = Label(self.summary_frame, text=f"Longest Run (Time):\t{display_time}")
         longest.grid(row=1, column=0, sticky='W')
 
         # Display the longest run distance
-        distance_statement = f"SELECT MAX(distance) FROM {self.table};"
-        distance_query = self.root.connection.execute_query(distance_statement)[0][0]
+        distance_query = records.get('longest_distance', (None, None))[1]
+        distance_display = '-' if distance_query is None else f"{distance_query:.2f}"
         distance = Label(self.summary_frame,
-                         text=f"Longest Run (Distance):\t{distance_query} Miles")
+                         text=f"Longest Run (Distance):\t{distance_display} Miles")
         distance.grid(row=2, column=0, sticky='W')
 
         # Display the quickest mile pace
-        pace_statement = f"SELECT MIN(pace) FROM {self.table};"
-        pace_query = self.root.connection.execute_query(pace_statement)[0][0]
-        pace_display = datetime.timedelta(minutes=float(pace_query))
-        pace_display = str(pace_display)[2:7]
+        quickest = records.get('pace_any', (None, None))[1]
+        pace_display = '-' if quickest is None else format_pace(quickest)
         pace = Label(self.summary_frame, text=f"Quickest Pace:\t\t{pace_display}")
         pace.grid(row=3, column=0, sticky='W')
 
@@ -72,12 +92,69 @@ class HomePage:
         runs_label = Label(self.summary_frame, text=f"Runs this month:\t\t{runs}")
         runs_label.grid(row=4, column=0, sticky='W')
 
+        # Display the current training load from the rolling metrics
+        current = self.root.metrics.current()
+        if current:
+            acute = current['mileage_7']
+            chronic = current['mileage_28']
+            ratio = current['workload_ratio']
+            ratio_display = '-' if ratio != ratio else f"{ratio:.2f}"
+            acute_label = Label(self.summary_frame,
+                                text=f"Last 7 Days:\t\t{acute:.2f} Miles")
+            acute_label.grid(row=5, column=0, sticky='W')
+            chronic_label = Label(self.summary_frame,
+                                  text=f"Last 28 Days:\t\t{chronic:.2f} Miles")
+            chronic_label.grid(row=6, column=0, sticky='W')
+            ratio_label = Label(self.summary_frame,
+                                text=f"Workload Ratio (7:28):\t{ratio_display}")
+            ratio_label.grid(row=7, column=0, sticky='W')
+            pace_7 = current['pace_7']
+            pace_display = '-' if pace_7 != pace_7 else format_pace(pace_7)
+            pace_label = Label(self.summary_frame,
+                               text=f"7 Day Average Pace:\t{pace_display}")
+            pace_label.grid(row=8, column=0, sticky='W')
+            avg_hr_7 = current['avg_hr_7']
+            hr_display = '-' if avg_hr_7 != avg_hr_7 else f"{avg_hr_7:.0f} BPM"
+            hr_label = Label(self.summary_frame,
+                             text=f"7 Day Average HR:\t{hr_display}")
+            hr_label.grid(row=9, column=0, sticky='W')
+
+        # Display today's fitness, fatigue and form from the fitness model
+        fitness = self.root.fitness.current()
+        if fitness:
+            fitness_label = Label(self.summary_frame,
+                                  text=f"Fitness:\t\t\t{fitness['fitness']:.1f}")
+            fitness_label.grid(row=10, column=0, sticky='W')
+            fatigue_label = Label(self.summary_frame,
+                                  text=f"Fatigue:\t\t\t{fitness['fatigue']:.1f}")
+            fatigue_label.grid(row=11, column=0, sticky='W')
+            form_label = Label(self.summary_frame,
+                               text=f"Form:\t\t\t{fitness['form']:+.1f}")
+            form_label.grid(row=12, column=0, sticky='W')
+
+        # Display the best pace for each distance and the highest VO2 max
+        records_label = Label(self.summary_frame, text='Personal Records',
+                              borderwidth=2, relief='raised')
+        records_label.grid(row=13, column=0, sticky='NEWS')
+        row = 14
+        for record in RECORDS:
+            if record not in records or record in ('pace_any', 'longest_duration',
+                                                   'longest_distance'):
+                continue
+            date, value = records[record]
+            value = format_pace(value) if record.startswith('pace') else f"{value:.2f}"
+            record_label = Label(self.summary_frame,
+                                 text=f"{RECORD_NAMES[record]}:\t{value} ({date})")
+            record_label.grid(row=row, column=0, sticky='W')
+            row += 1
+
     def check_for_runs(self):
         """
         Checks if there are any runs. If the table is empty, displays a different
         instead of calling the summaries method.
         """
-        if self.root.connection.execute_query(f"""SELECT * FROM {self.table};"""):
+        self.data_version = self.root.connection.version
+        if self.root.connection.execute_query(f"""SELECT 1 FROM {self.table} LIMIT 1;"""):
             self.summaries()
         else:
             text = ("""Empty table. Enter a new run or import runs into the database\n
@@ -85,6 +162,20 @@ class HomePage:
             label = Label(self.summary_frame, text=text)
             label.grid(row=1, column=0)
 
+    def refresh(self):
+        """
+        Rebuilds the summaries if the database has changed since they were
+        queried.
+        """
+        if self.data_version != self.root.connection.version:
+            self.summary_frame.destroy()
+            self.create_summary_frame()
+            self.check_for_runs()
+
+    def show(self):
+        self.frame.grid()
+        self.root.current_frame = self.frame
+
     def initialize(self):
         self.create_frame()
         self.check_for_runs()
@@ -1,21 +1,28 @@
 """
 The program begins by initializing a tkinter window that will only be used for
-the login. Once logged in the program attempts to find a new data file,
-clean it, and unpack. If no file is found, the app is initialized. The app is
-opened in a new window using the root window module.
+the login. The first time the user logs in the program attempts to find a new
+data file, clean it, and unpack, showing the progress with the option to
+cancel. After that the app is opened straight away in a new window using the
+root window module, which loads new exports in the background.
+
+Only tkinter is imported before the login window is shown. The MySQL connector,
+the cleaning modules (pandas and numpy) and the main window (tkcalendar and
+matplotlib) are imported the first time they are needed so that the login
+window opens quickly.
 """
 
 from constants import *
-import mysql.connector
+from timing import TIMINGS
 from tkinter import *
 from tkinter import messagebox
-from GUI.root_window import Window
-from database import Database
+from tkinter import ttk
 from pathlib import Path
+import queue
+import threading
 from SetUp.set_up_config_file import clear_configuration_file
-from CleaningData.get_new_xml import GetNewXML
-from CleaningData.clean_xml import CleanXML
-from CleaningData.add_csv_to_database import AddCSVtoDatabase
+
+# How often (ms) the login window checks the ingest thread for progress
+PROGRESS_POLL_MS = 100
 
 
 class LoginPage(Tk):
@@ -72,6 +79,11 @@ class LoginPage(Tk):
 
 
     def login(self, *args):
+        import mysql.connector
+        from database import Database
+
+        TIMINGS.mark('login')
+
         # Get the username and password
         self.user = self.username_entry.get().strip()
         self.password = self.password_entry.get().strip()
@@ -105,6 +117,8 @@ class LoginPage(Tk):
         The connection has to be reset using the database name since the
         original login was done with database set to 'None'.
         """
+        from database import Database
+
         database = self.config.get('mysql_info', 'database')
         table = self.config.get('mysql_info', 'table')
         self.connection.connection.close()
@@ -117,15 +131,22 @@ class LoginPage(Tk):
 
     def returning_login(self):
         self.reconnect_to_database()
-        self.check_for_new_xml()
+        self.connection.create_indexes()
+        self.connection.rollups.create_tables()
+        self.connection.records.create_table()
+        if self.config.getboolean('mysql_info', 'partitioned', fallback=False):
+            self.connection.add_future_partitions()
+        # New exports are loaded in the background by the main window
         self.start_app()
 
     def new_login(self):
         """
         Once logged in the program first checks for an export zip. If none is
-        found it then checks for a csv file. If none is found it creates an
-        empty table in the database.
+        found it then checks for a cleaned data cache. If none is found it
+        creates an empty table in the database.
         """
+        import mysql.connector
+
         try:
             self.connection.get_database_and_table_from_config()
             self.connection.create_database()
@@ -139,60 +160,170 @@ class LoginPage(Tk):
             main()
         else:
             self.reconnect_to_database()
-            self.connection.create_table()
-            xml = self.check_for_new_xml()
-            if xml:
-                csv_path = Path(self.config.get('directory_info', 'cleaned_data'))
-                if Path.exists(csv_path):
-                    add = AddCSVtoDatabase(self.connection, config_path=self.config_path)
-                    add.add_to_database()
-            self.start_app()
+            partitioned = self.config.getboolean('mysql_info', 'partitioned',
+                                                 fallback=False)
+            self.connection.create_table(partitioned)
+            self.connection.rollups.create_tables()
+            self.connection.records.create_table()
+            # The app is started once the export has been loaded
+            self.check_for_new_xml()
 
     def check_for_new_xml(self):
         """
         Once successfully logged in the program checks for a new XML file. If
-        so it is cleaned, saved as a CSV, and the new runs are added to the
-        database.
-        """
-        check = GetNewXML(config_file=self.config_path)
-        check.check_for_file()
-        if check.new_file:
-            # Clean the new XML Data
-            try:
-                cleaner = CleanXML(self.config_path)
-                cleaner.clean_file()
-            except FileNotFoundError:
-                message = """There was a problem cleaning the XML file.\n
-                Check your Downloads folder and CleaningData directory.\n
-                Select 'Yes' to continue or 'No' to close the app."""
-                xml_error = messagebox.askyesno(message=message)
-                if xml_error == 'No':
-                    quit()
+        so it is cleaned, saved to the cleaned data cache, and the new runs with
+        their heart rate samples and routes are added to the database. If not,
+        an existing cleaned data cache is loaded. An export that was already
+        loaded is skipped. This runs on another thread while the login window
+        shows its progress, and the app is started when it is done. The
+        cleaning modules are only imported if there is a new file since they
+        load pandas and numpy.
+        """
+        from CleaningData.pipeline import IngestPipeline
+
+        self.ingest_events = queue.Queue()
+        self.pipeline = IngestPipeline(
+            self.connection, self.config_path, streaming=True,
+            progress=lambda *update: self.ingest_events.put(('progress', update)))
+        self.create_progress_frame()
+        threading.Thread(target=self.run_ingest, daemon=True).start()
+        self.after(PROGRESS_POLL_MS, self.check_ingest)
+
+    def create_progress_frame(self):
+        """
+        Replaces the login frame with the ingest's progress and a button to
+        cancel it.
+        """
+        self.login_frame.grid_remove()
+        self.progress_frame = Frame(self, borderwidth=2, relief='sunken')
+        self.progress_frame.grid()
+        progress_title = Label(self.progress_frame, text='Loading Your Export',
+                               borderwidth=2, relief='raised')
+        progress_title.grid(row=0, sticky='EW')
+        self.stage_label = Label(self.progress_frame, text='Starting...')
+        self.stage_label.grid(row=1)
+        self.progress_bar = ttk.Progressbar(self.progress_frame, length=300,
+                                            maximum=100, mode='indeterminate')
+        self.progress_bar.grid(row=2, padx=10)
+        self.progress_bar.start()
+        self.detail_label = Label(self.progress_frame, text='')
+        self.detail_label.grid(row=3)
+        self.cancel_button = Button(self.progress_frame, text='Cancel',
+                                    command=self.cancel_ingest)
+        self.cancel_button.grid(row=4)
+
+    def run_ingest(self):
+        """
+        Runs on the ingest thread. Tk can't be used from here so the outcome
+        is put on the events queue for check_ingest.
+        """
+        from CleaningData.pipeline import IngestCancelled
+        from run_cache import cache_path
+
+        stage = 'clean'
+        try:
+            if self.pipeline.unzip():
+                self.pipeline.clean()
+                # Upload the new runs with their heart rate samples and GPS
+                # routes to the database
+                stage = 'load'
+                self.pipeline.load_export()
+                # Skip this export if it is downloaded again
+                self.pipeline.finish()
             else:
-                try:
-                    # Upload the new XML data to the database
-                    add = AddCSVtoDatabase(self.connection, config_path=self.config_path)
-                    add.add_to_database()
-                except FileNotFoundError:
-                    message = """There was a problem cleaning the CSV file\n
-                    or it could not be found.\n
-                    Check your CleaningData directory.\n
-                    Select 'Yes' to continue or 'No' to close the app."""
-                    csv_error = messagebox.askyesno(message=message)
-                    if csv_error == 'No':
-                        quit()
+                stage = 'load'
+                cache_file = cache_path(self.config.get('directory_info', 'cleaned_data'))
+                if Path.exists(cache_file):
+                    self.pipeline.load()
+        except IngestCancelled:
+            self.ingest_events.put(('cancelled', None))
+        except FileNotFoundError:
+            self.ingest_events.put(('missing', stage))
+        except Exception as error:
+            self.ingest_events.put(('failed', error))
         else:
-            return True
+            self.ingest_events.put(('done', None))
 
+    def check_ingest(self):
+        """
+        Shows the ingest thread's progress updates and starts the app once
+        the ingest has finished.
+        """
+        try:
+            while True:
+                event, detail = self.ingest_events.get_nowait()
+                if event == 'progress':
+                    self.show_progress(*detail)
+                else:
+                    self.finish_ingest(event, detail)
+                    return
+        except queue.Empty:
+            self.after(PROGRESS_POLL_MS, self.check_ingest)
+
+    def show_progress(self, stage, detail, fraction):
+        if self.pipeline.cancelled.is_set():
+            return
+        self.stage_label.configure(text=stage)
+        self.detail_label.configure(text=detail)
+        if fraction is None:
+            if str(self.progress_bar['mode']) != 'indeterminate':
+                self.progress_bar.configure(mode='indeterminate')
+                self.progress_bar.start()
+        else:
+            if str(self.progress_bar['mode']) != 'determinate':
+                self.progress_bar.stop()
+                self.progress_bar.configure(mode='determinate')
+            self.progress_bar['value'] = fraction * 100
+
+    def cancel_ingest(self):
+        """
+        Asks the ingest thread to stop. The insert it is in the middle of is
+        rolled back.
+        """
+        self.pipeline.cancel()
+        self.cancel_button.configure(state='disabled')
+        self.stage_label.configure(text='Cancelling...')
+
+    def finish_ingest(self, event, detail):
+        self.progress_bar.stop()
+        if event == 'missing' and detail == 'clean':
+            message = """There was a problem cleaning the XML file.\n
+            Check your Downloads folder and CleaningData directory.\n
+            Select 'Yes' to continue or 'No' to close the app."""
+            xml_error = messagebox.askyesno(message=message)
+            if not xml_error:
+                quit()
+        elif event == 'missing':
+            message = """There was a problem loading the cleaned data\n
+            or it could not be found.\n
+            Check your CleaningData directory.\n
+            Select 'Yes' to continue or 'No' to close the app."""
+            cache_error = messagebox.askyesno(message=message)
+            if not cache_error:
+                quit()
+        elif event == 'failed':
+            messagebox.showwarning(message=f"""The export could not be loaded.\n
+            {detail}""")
+        elif event == 'cancelled':
+            messagebox.showinfo(message="""Loading the export was cancelled.\n
+            Nothing from it was saved. It will be loaded again the next time\n
+            you log in.""")
+        self.start_app()
 
     def start_app(self):
+        from GUI.root_window import Window
+
         self.destroy()
         root = Window(self.connection)
-        root.initialize()
+        with TIMINGS.measure('Main window initialize'):
+            root.initialize()
         root.mainloop()
+        if root.watcher:
+            root.watcher.stop()
         root.connection.connection.close()
 
     def initialize(self):
         self.configure_window()
         self.create_login_frame()
+        self.after_idle(TIMINGS.since, 'start', 'Time to login window')
         self.mainloop()
@@ -0,0 +1,152 @@
+"""
+This module draws figures off the tkinter thread. A figure is drawn with
+matplotlib's Agg backend on a worker thread and saved as PNG bytes, which the
+visuals page shows in a label when they are ready. The images are kept in a
+least recently used cache with a memory limit, so going back to a chart that
+was already drawn shows it straight away. Only the newest request is drawn;
+a request made while the worker is busy replaces any request still waiting,
+and showing a cached image cancels it.
+The tkinter thread checks for finished images with after() so tkinter is
+only ever used from its own thread.
+"""
+
+import io
+import queue
+import threading
+from collections import OrderedDict
+
+# Most bytes of PNG images kept in the cache
+RENDER_CACHE_BYTES = 16 * 1024 * 1024
+
+# How often in ms the tkinter thread checks for a finished image
+POLL_INTERVAL = 30
+
+
+class RenderService:
+    def __init__(self, widget, figure_size, dpi):
+        """
+        The widget is used to schedule the checks for finished images on the
+        tkinter thread.
+        """
+        self.widget = widget
+        self.figure_size = figure_size
+        self.dpi = dpi
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.pending = None  # The newest request waiting for the worker
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.results = queue.Queue()
+        self.callbacks = {}  # Callback for the image that is still wanted
+        self.poll_job = None
+        self.worker = None
+
+    def get(self, key):
+        """
+        Returns the cached image for the key or None.
+        """
+        image = self.cache.get(key)
+        if image is not None:
+            self.cache.move_to_end(key)
+        return image
+
+    def add_to_cache(self, key, image):
+        """
+        Adds an image to the cache, removing the least recently used images
+        until it is under the memory limit.
+        """
+        if len(image) > RENDER_CACHE_BYTES:
+            return
+        if key in self.cache:
+            self.cache_bytes -= len(self.cache.pop(key))
+        self.cache[key] = image
+        self.cache_bytes += len(image)
+        while self.cache_bytes > RENDER_CACHE_BYTES:
+            _, removed = self.cache.popitem(last=False)
+            self.cache_bytes -= len(removed)
+
+    def request(self, key, draw, data, callback):
+        """
+        Calls the callback with the image for the key. A cached image is
+        passed straight away, otherwise draw(figure, data) is called on the
+        worker thread and the callback is made from the tkinter thread once
+        the image is ready. The callback gets None if drawing failed.
+        """
+        image = self.get(key)
+        if image is not None:
+            self.cancel()
+            callback(image)
+            return
+        # Only the newest request is wanted
+        self.callbacks = {key: callback}
+        with self.lock:
+            self.pending = (key, draw, data)
+        self.wake.set()
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.work, daemon=True)
+            self.worker.start()
+        if self.poll_job is None:
+            self.poll_job = self.widget.after(POLL_INTERVAL, self.poll)
+
+    def cancel(self):
+        """
+        Drops the request waiting for the worker and stops the image being
+        drawn from being passed on, since a newer chart has been shown.
+        """
+        self.callbacks = {}
+        with self.lock:
+            self.pending = None
+
+    def work(self):
+        """
+        Runs on the worker thread and draws the newest request each time it
+        is woken.
+        """
+        while True:
+            self.wake.wait()
+            with self.lock:
+                job, self.pending = self.pending, None
+                self.wake.clear()
+            if job is None:
+                continue
+            key, draw, data = job
+            try:
+                self.results.put((key, self.render(draw, data)))
+            except Exception as error:
+                self.results.put((key, error))
+
+    def render(self, draw, data) -> bytes:
+        """
+        Draws on a new figure that isn't attached to any window and returns
+        it as PNG bytes.
+        """
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        figure = Figure(figsize=self.figure_size, dpi=self.dpi)
+        FigureCanvasAgg(figure)
+        draw(figure, data)
+        buffer = io.BytesIO()
+        figure.savefig(buffer, format='png')
+        return buffer.getvalue()
+
+    def poll(self):
+        """
+        Runs on the tkinter thread. Caches any finished images and passes
+        the one that is still wanted to its callback.
+        """
+        self.poll_job = None
+        while True:
+            try:
+                key, image = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(image, Exception):
+                image = None
+            else:
+                self.add_to_cache(key, image)
+            callback = self.callbacks.pop(key, None)
+            if callback is not None:
+                callback(image)
+        if self.callbacks:
+            self.poll_job = self.widget.after(POLL_INTERVAL, self.poll)
@@ -1,28 +1,49 @@
 """
 Creates a child class of the main Tk window that will be used to hold
-all the frames and the mainloop. The current frame will be tracked in
-order for the app to know whether to destroy both the top and bottom
-frames or just the top frame when switching between pages.
+all the frames and the mainloop. Each page is built the first time it is
+opened and then kept alive. The current frame will be tracked in order for
+the app to know whether to hide both the top and bottom frames or just the
+top frame when switching between pages. New exports in the downloads folder
+are loaded in the background while the window is open and the pages reload
+once the new runs have been added.
 """
 
 from tkinter import *
+from tkinter import messagebox
 import tkinter.ttk as ttk
+import queue
 from GUI.runs_table import RunsTable
 from GUI.edit_run_page import EditRunPage
 from GUI.add_run_page import AddRunPage
 from GUI.home_page import HomePage
 from GUI.search_page import SearchRunsPage
 from GUI.visuals_page import RunVisuals
+from GUI.timings_window import TimingsWindow
+from timing import TIMINGS
+from training_metrics import TrainingMetrics
+from fitness_model import FitnessModel
+from CleaningData.watch_folder import ExportWatcher
+
+TITLE = 'Personal Run Tracking APP'
+
+# How often (ms) the window checks if the export watcher has loaded anything
+WATCHER_POLL_MS = 500
 
 
 class Window(Tk):
     def __init__(self, connection, window_width=1200, window_height=750):
         super().__init__()
         self.connection = connection
+        self.metrics = TrainingMetrics(connection)  # Shared by home and visuals
+        self.fitness = FitnessModel(connection)
         self.current_frame = Frame()
-        self.title('Personal Run Tracking APP')
+        self.title(TITLE)
+        self.protocol('WM_DELETE_WINDOW', self.shutdown)
         self.visuals_display = None
         self.edit_buttons_frame = None
+        self.current_page = None
+        self.built_pages = []  # Pages that have already been initialized
+        self.watcher = None
 
         # Set style to clam to deal with macOS style oddities
         style = ttk.Style()
@@ -41,6 +62,14 @@ class Window(Tk):
         self.rowconfigure(1, weight=0)
         self.rowconfigure(2, weight=1)
 
+        # Debug menu for viewing the start-up and page timings
+        menu_bar = Menu(self)
+        debug_menu = Menu(menu_bar, tearoff=0)
+        debug_menu.add_command(label='Show Timings',
+                               command=lambda: TimingsWindow(self))
+        menu_bar.add_cascade(label='Debug', menu=debug_menu)
+        self.config(menu=menu_bar)
+
     def create_main_frames(self):
         """
         Creates a top frame, bottom frame, and toolbar frame.
@@ -63,11 +92,11 @@ class Window(Tk):
         self.tool_frame.grid(row=0, column=0, sticky='NEWS',
                              padx=0, pady=(0, 10))
 
-        pages = {'Home': HomePage(self), 'Enter Run': AddRunPage(self),
-                 'Edit': EditRunPage(self), 'Search': SearchRunsPage(self),
-                 'Visuals': RunVisuals(self), 'Quit': quit}
+        self.pages = {'Home': HomePage(self), 'Enter Run': AddRunPage(self),
+                      'Edit': EditRunPage(self), 'Search': SearchRunsPage(self),
+                      'Visuals': RunVisuals(self), 'Quit': self.shutdown}
         column = 0
-        for key, value in pages.items():
+        for key, value in self.pages.items():
             if key == 'Quit':
                 command = value
             else:
@@ -78,30 +107,99 @@ class Window(Tk):
 
     def change_page(self, page):
         """
-        When changing from the visuals page to another page it will destroy
-        both the top and bottom frames. If the current page is the edit page,
-        it will delete the buttons frame. Switching between all other frames
-        it will only destroy the top frame.
+        Pages are only built the first time they are opened. After that the
+        current page is hidden with grid_remove and the chosen page is shown
+        again, so the calendars and combo boxes are never rebuilt. When
+        leaving the visuals page its display is hidden and the table is shown
+        again. If the current page is the edit page, it will hide the buttons
+        frame. Pages and the table only reload their data if the database has
+        changed since they last queried it. The time taken is recorded in the
+        timings split into the database time and the widget building time.
+        """
+        if page is self.current_page:
+            return
+
+        name = type(page).__name__
+        if page in self.built_pages:
+            name = f"Show {name}"
+        else:
+            name = f"Build {name}"
+        with TIMINGS.measure(name):
+            self.switch_page(page)
+
+    def switch_page(self, page):
+        """
+        Hides the current page and shows the chosen page.
         """
         if self.visuals_display:
-            self.visuals_display.destroy()
-            self.table = RunsTable(self, self.bottom_frame, self.connection)
-            self.table.initialize()
+            self.visuals_display.grid_remove()
+            self.table.grid()
             self.visuals_display = None
         elif self.edit_buttons_frame:
-            self.edit_buttons_frame.destroy()
+            self.edit_buttons_frame.grid_remove()
             self.edit_buttons_frame = None
+        self.current_frame.grid_remove()
 
-        self.current_frame.destroy()
-        page.initialize()
+        if page in self.built_pages:
+            page.show()
+        else:
+            page.initialize()
+            self.built_pages.append(page)
+        self.current_page = page
+
+        # Reload anything that is out of date with the database
+        self.table.refresh()
+        page.refresh()
 
     def initialize(self):
         """
         Starts the window with the home page on the top frame and the table
         filled with the runs from the database in the bottom frame.
         """
-        current_page = HomePage(self)
         self.create_main_frames()
         self.table = RunsTable(self, self.bottom_frame, self.connection)
         self.table.initialize()
-        current_page.initialize()
+        self.change_page(self.pages['Home'])
+        self.start_watcher()
+
+    def shutdown(self):
+        """
+        Stops the export watcher and any ingest it is running, then closes
+        the window. Used by the Quit button and the window's close button.
+        """
+        if self.watcher is not None:
+            self.watcher.shutdown()
+        self.destroy()
+
+    def start_watcher(self):
+        """
+        Starts loading new exports from the downloads folder in the
+        background.
+        """
+        self.watcher = ExportWatcher(self.connection, self.connection.config_path)
+        self.watcher.start()
+        self.after(WATCHER_POLL_MS, self.check_watcher)
+
+    def check_watcher(self):
+        """
+        Reads the watcher's events on the Tk thread. Once new runs have been
+        added the cached results are dropped and the table and the current
+        page reload.
+        """
+        while True:
+            try:
+                event, detail = self.watcher.events.get_nowait()
+            except queue.Empty:
+                break
+            if event == 'started':
+                self.title(f"{TITLE} - Loading New Export...")
+                continue
+            self.title(TITLE)
+            if event == 'finished':
+                self.connection.mark_changed()
+                self.table.refresh()
+                self.current_page.refresh()
+            elif event == 'failed':
+                messagebox.showwarning(
+                    message=f"The new export could not be loaded.\n\n{detail}")
+        self.after(WATCHER_POLL_MS, self.check_watcher)
@@ -1,11 +1,154 @@
 """
 This module houses the class for the displayed runs for the app. It is housed
 on the bottom frame of the main window and is seen unless on the visuals page.
+Above the table is a quick filter entry that narrows the rows already loaded
+from the database without sending a new query. Large results are inserted in
+small chunks between repaints so the window never freezes while filling.
+Each time all the runs are loaded they are saved as a snapshot, which is
+shown when the app opens while the first query is still running.
 """
 
 from tkinter import *
 from tkinter import ttk
+from bisect import bisect_left, bisect_right
 from constants import *
+import re
+from query_builder import PERIOD_COLUMNS
+from timing import TIMINGS
+from run_cache import (load_runs, records_to_rows, rows_to_records, save_runs,
+                       snapshot_path)
+import time
+
+# How long to wait (ms) after the last keystroke before filtering the table
+FILTER_DELAY = 250
+
+# How long (seconds) a single rendering pass may insert rows before giving
+# the window a chance to repaint. Roughly one frame at 60 frames per second.
+RENDER_BUDGET = 0.012
+
+# Patterns used to decide what the quick filter text is asking for
+DATE_PREFIX_PATTERN = re.compile(r'^\d{4}(-\d{0,2}(-\d{0,2})?)?$')
+NUMBER_PATTERN = re.compile(r'^\d+(?:\.(\d*))?$')
+RANGE_PATTERN = re.compile(r'^(\d+(?:\.\d*)?)\s*-\s*(\d+(?:\.\d*)?)$')
+COMPARISON_PATTERN = re.compile(r'^(<=|>=|<|>|=)\s*(\d+(?:\.\d*)?)$')
+
+# Column labels used when the table shows week, month or year summaries
+PERIOD_DISPLAY_NAMES = {'period': 'Period Start:', 'runs': 'Runs:',
+                        'distance': 'Total Distance:',
+                        'duration': 'Total Duration:', 'pace': 'Pace:',
+                        'avg_hr': 'Avg hr:', 'longest': 'Longest Run:'}
+
+
+def format_period(row: list) -> list:
+    """
+    Formats a week, month or year summary for the table. The total duration
+    is shown as hours:minutes:seconds, which can be more than 24 hours, and
+    the pace as minutes:seconds.
+    """
+    for column in ('duration', 'pace'):
+        index = PERIOD_COLUMNS.index(column)
+        if row[index] is not None:
+            total_seconds = round(float(row[index]) * 60)
+            minutes, seconds = divmod(total_seconds, 60)
+            if column == 'duration':
+                hours, minutes = divmod(minutes, 60)
+                row[index] = f"{hours}:{minutes:02d}:{seconds:02d}"
+            else:
+                row[index] = f"{minutes:02d}:{seconds:02d}"
+    distance_index = PERIOD_COLUMNS.index('distance')
+    if row[distance_index] is not None:
+        row[distance_index] = round(float(row[distance_index]), 2)
+    return row
+
+
+class RunsIndex:
+    """
+    Keeps the row positions of the loaded runs sorted by date and by distance
+    so the quick filter can find matches with a binary search instead of
+    checking every row or querying the database on each keystroke.
+    """
+    def __init__(self, rows, date_column=0, distance_column=2):
+        self.size = len(rows)
+
+        # Sorted date strings with the row position they came from
+        dates = sorted((str(row[date_column]), i) for i, row in enumerate(rows))
+        self.dates = [date for date, _ in dates]
+        self.date_positions = [i for _, i in dates]
+
+        # Sorted distances, skipping runs without one
+        distances = []
+        for i, row in enumerate(rows):
+            if row[distance_column] not in (None, 'NULL', ''):
+                distances.append((float(row[distance_column]), i))
+        distances.sort()
+        self.distances = [distance for distance, _ in distances]
+        self.distance_positions = [i for _, i in distances]
+
+    def date_prefix(self, prefix: str) -> list[int]:
+        """
+        Returns the positions of the rows whose date starts with the prefix.
+        """
+        start = bisect_left(self.dates, prefix)
+        end = bisect_left(self.dates, prefix + '~')
+        return self.date_positions[start:end]
+
+    def distance_range(self, low: float, high: float) -> list[int]:
+        """
+        Returns the positions of the rows with a distance between low and
+        high, inclusive.
+        """
+        start = bisect_left(self.distances, low)
+        end = bisect_right(self.distances, high)
+        return self.distance_positions[start:end]
+
+    def search(self, text: str) -> list[int] | None:
+        """
+        Interprets the quick filter text and returns the matching row
+        positions in their original order. Returns None when the text is
+        empty so that every row is shown.
+            2023-05     runs with a date starting with 2023-05
+            6, 6.2      runs with a distance starting with 6 or 6.2
+            5-7         runs between 5 and 7 miles
+            >6, <=3.1   runs compared to a distance
+        """
+        text = text.strip()
+        if not text:
+            return None
+        if DATE_PREFIX_PATTERN.match(text):
+            positions = self.date_prefix(text)
+        elif match := NUMBER_PATTERN.match(text):
+            # 6 is 6 up to 7 miles and 6.2 is 6.2 up to 6.3 miles
+            decimals = len(match.group(1) or '')
+            low = float(text)
+            high = round(low + 10 ** -decimals, decimals)
+            start = bisect_left(self.distances, low)
+            end = bisect_left(self.distances, high)
+            positions = self.distance_positions[start:end]
+        elif match := RANGE_PATTERN.match(text):
+            low, high = sorted([float(match.group(1)), float(match.group(2))])
+            positions = self.distance_range(low, high)
+        elif match := COMPARISON_PATTERN.match(text):
+            operator, value = match.group(1), float(match.group(2))
+            if operator == '<':
+                start = 0
+                end = bisect_left(self.distances, value)
+            elif operator == '<=':
+                start = 0
+                end = bisect_right(self.distances, value)
+            elif operator == '>':
+                start = bisect_right(self.distances, value)
+                end = len(self.distances)
+            elif operator == '>=':
+                start = bisect_left(self.distances, value)
+                end = len(self.distances)
+            else:
+                start = bisect_left(self.distances, value)
+                end = bisect_right(self.distances, value)
+            positions = self.distance_positions[start:end]
+        else:
+            positions = []
+        return sorted(positions)
+
 
 class RunsTable(Frame):
     """
@@ -18,11 +161,23 @@ class RunsTable(Frame):
         self.root = root
         self.connection = connection
         self.table = self.connection.table
+        self.rows = []
+        self.pending_rows = []
+        self.rendered = 0
+        self.index = RunsIndex(self.rows)
+        self.filter_job = None
+        self.render_job = None
+        self.cooperative = True  # Insert large results in chunks
+        self.search_statement = None
+        self.search_params = None
+        self.grouped = False  # Showing week, month or year summaries
+        self.data_version = None  # Database version the rows were loaded at
+        self.snapshot_file = snapshot_path(self.connection.config_path)
 
         # Configure the frame
         self.grid(row=0, column=0, sticky='NEWS', padx=10, pady=10)
         self.columnconfigure(0, weight=1)
-        self.rowconfigure(0, weight=0)  # For # of results
+        self.rowconfigure(0, weight=0)  # For # of results and the filter
         self.rowconfigure(1, weight=1)  # For the table
         self.rowconfigure(2, weight=0)  # for the toolbar
 
@@ -30,58 +185,213 @@ class RunsTable(Frame):
         """
         Creates the treeview table that will display the runs from the database.
         """
+        # Create a frame for the results label and the quick filter
+        header_frame = Frame(self)
+        header_frame.grid(row=0, sticky='NEWS')
+        header_frame.columnconfigure(0, weight=1)
+
         # Create a label that shows how many results were found
-        self.results_label = Label(self, text="0 Results Found")
-        self.results_label.grid(row=0, sticky='NEWS')
+        self.results_label = Label(header_frame, text="0 Results Found")
+        self.results_label.grid(row=0, column=0, sticky='NEWS')
+
+        # Create the quick filter entry that filters as the user types
+        filter_label = Label(header_frame, text='Quick Filter:')
+        filter_label.grid(row=0, column=1, sticky='E')
+        self.filter_variable = StringVar(header_frame)
+        self.filter_variable.trace_add('write', self.schedule_filter)
+        self.filter_entry = Entry(header_frame, textvariable=self.filter_variable)
+        self.filter_entry.grid(row=0, column=2, sticky='E')
 
         # Create the table widget using treeview
         self.run_table = ttk.Treeview(self, show='headings', selectmode='browse')
-        self.run_table['columns'] = COLUMN_NAMES
         self.run_table.grid(row=1, column=0, sticky='NEWS')
 
         # Label the columns and set the width of each column
+        self.set_columns(COLUMN_NAMES, DISPLAY_NAMES_DICT)
+
+    def set_columns(self, columns, display_names):
+        """
+        Changes the columns of the table if they are different from the
+        columns already shown.
+        """
+        if list(self.run_table['columns']) == columns:
+            return
+        self.run_table.delete(*self.run_table.get_children())
+        self.run_table['columns'] = columns
         index = 0
-        for column_name in self.run_table['columns']:
-            self.run_table.heading(index, text=DISPLAY_NAMES_DICT[column_name])
+        for column_name in columns:
+            self.run_table.heading(index, text=display_names[column_name])
             self.run_table.column(column=column_name, width=87, anchor='center')
             index += 1
 
-    def fill_table(self, search_statement=None):
+    def fill_table(self, search_statement=None, search_params=None,
+                   grouped=False):
         """
         Upon opening the app the table will automatically get all the
         past runs from the database to display. This method will also be called
-        to repopulate the table once a new run has been added.
+        to repopulate the table once a new run has been added. If grouped is
+        True the search statement returns one summary row per week, month or
+        year instead of runs.
         """
-        # Clears the table if there is any data already in it
-        for row in self.run_table.get_children():
-            self.run_table.delete(row)
-
         # Get the runs from the database
+        self.search_statement = search_statement
+        self.search_params = search_params
+        self.grouped = grouped
+        self.data_version = self.connection.version
         if search_statement:  # Comes from the search page
             select_statement = search_statement
         else:
             select_statement = f"""SELECT * FROM {self.table} ORDER BY date DESC;"""
-        query_result = self.connection.execute_query(select_statement)
+        query_result = self.connection.execute_query(select_statement,
+                                                     search_params)
 
-        # Convert result tuples to lists and remove the run id column
-        previous_runs = [list(result)[1:] for result in query_result]
+        if grouped:
+            self.set_columns(PERIOD_COLUMNS, PERIOD_DISPLAY_NAMES)
+            self.rows = [format_period(list(result)) for result in query_result]
+        else:
+            self.set_columns(COLUMN_NAMES, DISPLAY_NAMES_DICT)
 
-        # Format pace, duration, and start time for viewing
-        formatted_runs = [format_times(run) for run in previous_runs]
+            # Convert result tuples to lists and remove the run id column
+            previous_runs = [list(result)[1:] for result in query_result]
+            if not search_statement:
+                self.save_snapshot(previous_runs)
 
-        # Clear the table
-        for item in self.run_table.get_children():
-            self.run_table.delete(item)
+            # Format pace, duration, and start time for viewing
+            self.rows = [format_times(run) for run in previous_runs]
 
-        # Reconfigures the display frame label with the lenth of the results
-        number_results = len(formatted_runs)
-        self.results_label.configure(text=f"{number_results} Results Found")
+        # Index the runs for the quick filter and display them
+        self.index = RunsIndex(self.rows)
+        self.apply_filter()
 
-        # Add the runs to the table
-        for run in formatted_runs[::-1]:
-            self.run_table.insert("", 0, text="",
-                                  values=run)
+    def save_snapshot(self, runs):
+        """
+        Saves all the runs for the next time the app is opened. The app
+        still works without the snapshot so a failed write is ignored.
+        """
+        if self.snapshot_file:
+            try:
+                save_runs(self.snapshot_file, rows_to_records(runs))
+            except OSError:
+                pass
+
+    def show_snapshot(self) -> bool:
+        """
+        Shows the runs saved the last time the table was filled and returns
+        whether there was a snapshot to show.
+        """
+        if not self.snapshot_file or not self.snapshot_file.exists():
+            return False
+        try:
+            records = load_runs(self.snapshot_file)
+        except (OSError, ValueError):
+            return False
+        self.rows = [format_times(list(run)) for run in records_to_rows(records)]
+        self.index = RunsIndex(self.rows)
+        self.apply_filter()
+        return True
+
+    def show_rows(self, rows):
+        """
+        Clears the table and inserts the given rows. When cooperative
+        rendering is on the rows are appended in chunks scheduled with after()
+        so the window keeps repainting. Any rendering still in progress from a
+        previous query is cancelled first.
+        """
+        self.cancel_render()
+        self.run_table.delete(*self.run_table.get_children())
+        self.pending_rows = rows
+        self.rendered = 0
+        if self.cooperative:
+            self.render_chunk()
+        else:
+            for run in rows:
+                self.run_table.insert("", END, text="", values=run)
+            self.rendered = len(rows)
+            self.update_results_label()
+
+    def render_chunk(self):
+        """
+        Appends rows to the table until the frame budget is used up and then
+        schedules itself to continue after the window has repainted.
+        """
+        self.render_job = None
+        rows = self.pending_rows
+        start = time.perf_counter()
+        while self.rendered < len(rows):
+            self.run_table.insert("", END, text="", values=rows[self.rendered])
+            self.rendered += 1
+            if time.perf_counter() - start > RENDER_BUDGET:
+                break
+        self.update_results_label()
+        if self.rendered < len(rows):
+            self.render_job = self.after(1, self.render_chunk)
+        else:
+            # Only recorded the first time the table is painted after login
+            self.after_idle(TIMINGS.since, 'login', 'Login to first table paint')
+
+    def cancel_render(self):
+        """
+        Stops a chunked rendering pass that has not finished yet.
+        """
+        if self.render_job:
+            self.after_cancel(self.render_job)
+            self.render_job = None
+
+    def update_results_label(self):
+        """
+        Reconfigures the display frame label with the length of the results,
+        showing the progress while rows are still being inserted.
+        """
+        total = len(self.pending_rows)
+        if self.rendered < total:
+            text = f"Loading {self.rendered} of {total} Results..."
+        elif total == len(self.rows):
+            text = f"{total} Results Found"
+        else:
+            text = f"{total} of {len(self.rows)} Results Shown"
+        self.results_label.configure(text=text)
+
+    def schedule_filter(self, *args):
+        """
+        Tied to the quick filter string variable. Each keystroke restarts the
+        timer so that a burst of typing only filters the table once.
+        """
+        if self.filter_job:
+            self.after_cancel(self.filter_job)
+        self.filter_job = self.after(FILTER_DELAY, self.apply_filter)
+
+    def apply_filter(self):
+        """
+        Shows only the loaded runs that match the quick filter text.
+        """
+        if self.filter_job:
+            self.after_cancel(self.filter_job)
+            self.filter_job = None
+        positions = self.index.search(self.filter_variable.get())
+        if positions is None:
+            self.show_rows(self.rows)
+        else:
+            self.show_rows([self.rows[i] for i in positions])
+
+    def refresh(self):
+        """
+        Reloads the current runs only if the database has changed since they
+        were queried.
+        """
+        if self.data_version != self.connection.version:
+            self.fill_table(self.search_statement, self.search_params,
+                            self.grouped)
 
     def initialize(self):
+        """
+        Shows the snapshot first, if there is one, and fills the table from
+        the database once the window has painted it.
+        """
         self.create_table()
-        self.fill_table()
\ No newline at end of file
+        if self.show_snapshot():
+            # Counts the snapshot as current so refresh() doesn't query
+            # before the window has painted it. Only the deferred fill runs.
+            self.data_version = self.connection.version
+            self.after_idle(self.fill_table)
+        else:
+            self.fill_table()
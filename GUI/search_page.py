@@ -1,7 +1,10 @@
 """
 This module holds the class that serves as the search page for the app.
 The user will be able to select from the fields to request information from
-the database.
+the database. Several conditions can be combined into AND groups, and the
+groups are combined with OR, which is all sent to the database as one query.
+The matching runs can also be summarized by week, month or year by MySQL so
+the table shows one row per period.
 """
 
 
@@ -10,6 +13,7 @@ from tkinter import ttk
 from tkcalendar import Calendar
 from tkinter import messagebox
 from GUI.custom_widgets import PaceEntry, TimeEntry, DurationEntry
+from query_builder import Condition, SearchFilter, period_statement
 from constants import *
 
 
@@ -17,6 +21,8 @@ class SearchRunsPage:
     def __init__(self, root):
         self.root = root
         self.table = self.root.connection.table
+        self.search_filter = SearchFilter()
+        self.second_value_entry = None
 
     def create_frame(self):
         """
@@ -28,7 +34,7 @@ class SearchRunsPage:
         self.frame.rowconfigure(0, weight=0)
         self.frame.rowconfigure(1, weight=1)
         self.frame.rowconfigure(2, weight=0)
-        self.number_columns = 4
+        self.number_columns = 5
         for column in range(self.number_columns):
             self.frame.columnconfigure(column, weight=0)
 
@@ -56,6 +62,11 @@ class SearchRunsPage:
         self.limit_frame.grid(row=1, column=3, padx=5, pady=5, sticky='NEWS')
         self.fill_limit_frame()
 
+        self.group_frame = Frame(self.frame, borderwidth=2,
+                                 relief='sunken')
+        self.group_frame.grid(row=1, column=4, padx=5, pady=5, sticky='NEWS')
+        self.fill_group_frame()
+
         # Set up the submit button
         submit = Button(self.frame, text='Submit', command=self.query)
         submit.grid(row=2, columnspan=self.number_columns)
@@ -89,11 +100,12 @@ class SearchRunsPage:
         operator_label = Label(self.where_frame, text="Comparison",
                                borderwidth=2, relief='raised')
         operator_label.grid(row=2, columnspan=2, sticky='NEWS')
-        operators = ["<", "<=", ">", ">=", "==", "!="]
+        operators = ["<", "<=", ">", ">=", "==", "!=", "BETWEEN"]
         self.op_box = ttk.Combobox(self.where_frame, values=operators,
                                    state='readyonly')
         self.op_box.current(0)
         self.op_box.grid(row=3, columnspan=2, sticky='NEWS')
+        self.op_box.bind('<<ComboboxSelected>>', self.value_options)
 
         # Create an entry widget based on the value
         value_label = Label(self.where_frame, text="Value",
@@ -105,13 +117,24 @@ class SearchRunsPage:
         self.value_frame.grid(row=5, columnspan=2, sticky='NEWS')
         self.value_frame.columnconfigure(0, weight=1)
 
-        self.value_entry = Calendar(self.value_frame, selectmode='day',
-                                    year=CURRENT_DATE.year,
-                                    month=CURRENT_DATE.month,
-                                    day=CURRENT_DATE.day)
-        self.value_entry.grid(row=5, column=0, sticky='NEWS', padx=5, pady=5)
-
-        # Set the column combobox after the value entry box has been populated
+        # Buttons to build a search out of several conditions
+        conditions_frame = Frame(self.where_frame)
+        conditions_frame.grid(row=6, columnspan=2, sticky='NEWS')
+        add_button = Button(conditions_frame, text='Add (AND)',
+                            command=self.add_condition)
+        add_button.grid(row=0, column=0)
+        group_button = Button(conditions_frame, text='New OR Group',
+                              command=self.new_group)
+        group_button.grid(row=0, column=1)
+        clear_button = Button(conditions_frame, text='Clear',
+                              command=self.clear_conditions)
+        clear_button.grid(row=0, column=2)
+
+        # Lists the conditions that have been added
+        self.conditions_list = Listbox(self.where_frame, height=4)
+        self.conditions_list.grid(row=7, columnspan=2, sticky='NEWS')
+
+        # Setting the column combobox populates the value entry box
         self.options.current(0)
 
     def fill_order_frame(self):
@@ -172,29 +195,107 @@ class SearchRunsPage:
             radio.grid(row=row, sticky='W')
             row += 1
 
+    def fill_group_frame(self):
+        """
+        Creates a string variable and corresponding radio buttons for the
+        user to choose whether to see the runs or a summary of them by week,
+        month or year.
+        """
+        label = Label(self.group_frame, text='Summarize By',
+                      relief='raised', borderwidth=2)
+        label.grid(row=0, sticky='NEWS')
+
+        options = ['None', 'Week', 'Month', 'Year']
+        self.group_variable = StringVar(self.group_frame, value=options[0])
+        row = 1
+        for option in options:
+            radio = Radiobutton(self.group_frame, value=option, text=option,
+                                variable=self.group_variable)
+            radio.grid(row=row, sticky='W')
+            row += 1
+
+    def get_entry_value(self, entry):
+        """
+        Gets the value from a value entry widget. The calendar has a different
+        method than the other entries.
+        """
+        if isinstance(entry, Calendar):
+            return entry.get_date()
+        return entry.get()
+
+    def current_condition(self):
+        """
+        Creates a condition from the column, comparison and value widgets.
+        Returns None if the value entry was left blank.
+        """
+        column = self.options.get().strip().lower().replace(' ', '_')
+        operator = self.op_box.get()
+        value = self.get_entry_value(self.value_entry)
+        if value == '':
+            return None
+        second_value = None
+        if operator == 'BETWEEN':
+            second_value = self.get_entry_value(self.second_value_entry)
+        return Condition(column, operator, value, second_value)
+
+    def show_invalid_value(self):
+        message = f"""Invalid Value for {self.options.get().upper()}\n\n
+    Check the VALUE and try again"""
+        messagebox.showwarning(message=message)
+        self.value_entry.focus_set()
+
+    def add_condition(self):
+        """
+        Adds the condition in the where frame to the current AND group.
+        """
+        try:
+            condition = self.current_condition()
+        except ValueError:
+            self.show_invalid_value()
+        else:
+            if condition:
+                self.search_filter.add_condition(condition)
+                self.update_conditions_list()
+
+    def new_group(self):
+        """
+        Starts a new group of conditions that is combined with the others
+        using OR.
+        """
+        self.search_filter.new_group()
+        self.update_conditions_list()
+
+    def clear_conditions(self):
+        self.search_filter.clear()
+        self.update_conditions_list()
+
+    def update_conditions_list(self):
+        self.conditions_list.delete(0, END)
+        for line in self.search_filter.describe():
+            self.conditions_list.insert(END, line)
+        if self.search_filter.groups[-1] == [] and not self.search_filter.is_empty():
+            self.conditions_list.insert(END, 'OR')
+
     def query(self):
         """
         Gets all the search frame class variables and combines them into
-        a formatted select statement.
+        a formatted select statement. If no conditions have been added the
+        condition currently in the where frame is used on its own. If there
+        is no where value it will be blank.
         """
-        # Get the values from the value entry widget and make sure they are
-        # properly formatted. If there is no where value it will be blank
-        if self.value_entry:
-            comp_column = self.options.get().strip().lower().replace(' ', '_')
-            operator = self.op_box.get()
-            if comp_column in INTEGERS:
-                value = int(float(self.value_entry.get()))
-            elif comp_column == 'date':
-                value = self.value_entry.get_date()
-                dt = datetime.datetime.strptime(value, '%m/%d/%y')
-                value = f"'{dt.strftime('%Y-%m-%d')}'"
-            elif comp_column in TIMES:
-                value = f"'{self.value_entry.get()}'"
-            else:
-                value = self.value_entry.get()
-            where = f"""WHERE {comp_column} {operator} {value}"""
+        # Get the conditions and convert the values to the column datatypes
+        if self.search_filter.is_empty():
+            search_filter = SearchFilter()
+            try:
+                condition = self.current_condition()
+            except ValueError:
+                self.show_invalid_value()
+                return
+            if condition:
+                search_filter.add_condition(condition)
         else:
-            where = ''
+            search_filter = self.search_filter
+        where, params = search_filter.compile()
 
         # Get the column to order the results by as order
         order = self.order_variable.get()
@@ -208,16 +309,20 @@ class SearchRunsPage:
         else:
             limit = f"LIMIT {int(self.limit.get())}"
 
-        # Format the select statement to search in the database
-        select_statement = f"""SELECT * FROM {self.table} {where}
+        # Format the select statement to search in the database. Summaries
+        # are always ordered by the period
+        period = self.group_variable.get()
+        grouped = period != 'None'
+        if grouped:
+            select_statement = period_statement(self.table, period, where,
+                                                direction, limit)
+        else:
+            select_statement = f"""SELECT * FROM {self.table} {where}
     ORDER BY {order} {direction} {limit};"""
         try:
-            self.root.table.fill_table(select_statement)
+            self.root.table.fill_table(select_statement, params, grouped)
         except:
-            message = f"""Invalid Value for {self.options.get().upper()}\n\n
-    Check the VALUE and try again"""
-            messagebox.showwarning(message=message)
-            self.value_entry.focus_set()
+            self.show_invalid_value()
 
     def value_options(self, *args):
         """
@@ -233,26 +338,47 @@ class SearchRunsPage:
 
         # Choose the correct entry type for the column
         column = self.column_variable.get().strip().lower().replace(' ', '_')
+        self.value_entry = self.create_value_entry(column)
+        self.value_entry.grid(row=5, column=0, sticky='NEWS', padx=5, pady=5)
+
+        # BETWEEN needs a second entry for the upper value
+        self.second_value_entry = None
+        if self.op_box.get() == 'BETWEEN':
+            and_label = Label(self.value_frame, text='and')
+            and_label.grid(row=6, column=0)
+            self.second_value_entry = self.create_value_entry(column)
+            self.second_value_entry.grid(row=7, column=0, sticky='NEWS',
+                                         padx=5, pady=5)
+
+    def create_value_entry(self, column):
+        """
+        Creates the correct type of entry for the column in the value frame.
+        """
         if column == 'pace':
-            self.value_entry = PaceEntry(self.value_frame)
+            return PaceEntry(self.value_frame)
         elif column in INTEGERS or column in FLOATS:
-            self.value_entry = Entry(self.value_frame)
+            return Entry(self.value_frame)
         elif column in DATES:
-            self.value_entry = Calendar(self.value_frame, selectmode='day',
-                                        year=CURRENT_DATE.year,
-                                        month=CURRENT_DATE.month,
-                                        day=CURRENT_DATE.day)
+            return Calendar(self.value_frame, selectmode='day',
+                            year=CURRENT_DATE.year,
+                            month=CURRENT_DATE.month,
+                            day=CURRENT_DATE.day)
         elif column in TIMES:
-            self.value_entry = TimeEntry(self.value_frame)
+            return TimeEntry(self.value_frame)
         elif column in MINUTES:
-            self.value_entry = DurationEntry(self.value_frame)
+            return DurationEntry(self.value_frame)
 
-        self.value_entry.grid(row=5, column=0, sticky='NEWS', padx=5, pady=5)
+    def refresh(self):
+        """
+        The page doesn't display any data from the database.
+        """
+        pass
+
+    def show(self):
+        self.frame.grid()
+        self.root.current_frame = self.frame
 
     def initialize(self):
         self.create_frame()
         self.create_sub_frames()
-        self.fill_where_frame()
-        self.fill_limit_frame()
-        self.fill_order_frame()
         self.root.current_frame = self.frame
@@ -0,0 +1,51 @@
+"""
+This module creates the small window opened from the debug menu that lists
+the most recent start-up and page change timings recorded by the timing
+module.
+"""
+
+from tkinter import *
+from tkinter import ttk
+from timing import TIMINGS, LOG_FILE
+
+
+class TimingsWindow(Toplevel):
+    def __init__(self, root):
+        super().__init__(root)
+        self.title('Timings')
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(1, weight=1)
+        self.create_table()
+        self.fill_table()
+
+    def create_table(self):
+        """
+        Creates a treeview with a row for each timing and a refresh button.
+        """
+        label = Label(self, text=f"Full history saved to {LOG_FILE}",
+                      borderwidth=2, relief='raised')
+        label.grid(row=0, column=0, sticky='NEWS')
+
+        columns = ['time', 'name', 'total', 'fetch', 'build']
+        headings = ['Time', 'Timing', 'Total (ms)', 'Fetch (ms)', 'Build (ms)']
+        self.timings_table = ttk.Treeview(self, show='headings', columns=columns)
+        for column, heading in zip(columns, headings):
+            self.timings_table.heading(column, text=heading)
+            self.timings_table.column(column, width=100, anchor='center')
+        self.timings_table.column('name', width=220, anchor='w')
+        self.timings_table.grid(row=1, column=0, sticky='NEWS')
+
+        refresh = Button(self, text='Refresh', command=self.fill_table)
+        refresh.grid(row=2, column=0)
+
+    def fill_table(self):
+        """
+        Fills the table with the recorded timings, newest first.
+        """
+        self.timings_table.delete(*self.timings_table.get_children())
+        for record in reversed(TIMINGS.records):
+            values = [record['time'], record['name'],
+                      f"{record['total'] * 1000:.1f}",
+                      f"{record['fetch'] * 1000:.1f}",
+                      f"{record['build'] * 1000:.1f}"]
+            self.timings_table.insert('', END, values=values)
@@ -1,21 +1,268 @@
 """
 This module serves as the visuals page. The top will have a box for the user to
-choose what visuals they would like to see and the bottom will have an embedded
-canvas that will be used to display the matplotlib figure.
+choose what visuals they would like to see and the bottom will display the
+matplotlib figure. Besides the scatter plot of any two columns it can show a
+column over time as a line, with the weekly or monthly averages from the
+rollup tables laid over it, the training load over time from the rolling
+training metrics, the fitness, fatigue and form from the fitness model and a
+calendar of the daily distance or duration for a range of years. Matplotlib
+is only imported the first time the page is opened since it is slow to load.
+Plots with many points are reduced to about one point per pixel of the canvas.
+
+By default charts are drawn on an embedded canvas with the toolbar for
+zooming and panning. The canvas and figure are created once and each plot
+updates the data on them in place, and the points are reduced again at the
+new zoom level when the toolbar zooms or pans. Unchecking Interactive draws
+charts on a worker thread by the render service and shows them as an image
+instead, so the page never freezes while a chart is drawn and a chart that
+was already drawn is shown straight from the cache.
 """
 
 
 from tkinter import *
 from constants import *
 from tkinter import ttk
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg, NavigationToolbar2Tk)
+from tkinter import messagebox
+import base64
+from GUI.render_service import RenderService
+from rollups import ROLLUP_COLUMNS
+
+# Plots with more points than this are downsampled before drawing
+DOWNSAMPLE_THRESHOLD = 5000
+
+CHARTS = ['Scatter', 'Time Series', 'Training Load', 'Fitness', 'Calendar']
+
+# The overlays of the time series and the rollup period they come from
+OVERLAYS = {'None': None, 'Weekly': 'Week', 'Monthly': 'Month'}
+
+FIGURE_SIZE = (10, 4)
+DPI = 100
+
+# The columns the calendar can show as daily totals
+CALENDAR_COLUMNS = ['distance', 'duration', 'calories']
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+# The training load lines and their labels
+LOAD_LABELS = {'mileage_7': '7 Day Mileage', 'mileage_28': '28 Day Mileage / 4'}
+
+# The fitness model's lines and their labels
+FITNESS_LABELS = {'fitness': 'Fitness', 'fatigue': 'Fatigue', 'form': 'Form'}
+
+
+def get_limits(values):
+    """
+    Returns the axis limits for the values with a 5% margin.
+    """
+    if len(values) == 0:
+        return (0.0, 1.0)
+    low, high = float(values.min()), float(values.max())
+    margin = (high - low) * 0.05 or 1.0
+    return (low - margin, high + margin)
+
+
+def format_axis(axis, column):
+    """
+    Sets the tick locator and formatter for the column shown on an axis.
+    """
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+    from matplotlib.ticker import AutoLocator, ScalarFormatter
+
+    if column in DATES:
+        locator = AutoDateLocator()
+        axis.set_major_locator(locator)
+        axis.set_major_formatter(ConciseDateFormatter(locator))
+    else:
+        axis.set_major_locator(AutoLocator())
+        axis.set_major_formatter(ScalarFormatter())
+
+
+def downsample_series(x, values, width):
+    """
+    Returns the indices of the points of a series sorted by x to draw at the
+    width in pixels.
+    """
+    import numpy
+    from GUI.downsampling import min_max_downsample
+
+    if len(x) > DOWNSAMPLE_THRESHOLD:
+        return min_max_downsample(x, numpy.nan_to_num(values), width)
+    return numpy.arange(len(x))
+
+
+def downsample_visible(x, values, limits, width):
+    """
+    Returns the indices of the points of a series sorted by x to draw
+    between the x limits at the width in pixels. A point either side of the
+    limits is kept so lines leave the edges.
+    """
+    import numpy
+    from GUI.downsampling import min_max_downsample
+
+    start = max(int(numpy.searchsorted(x, limits[0])) - 1, 0)
+    end = int(numpy.searchsorted(x, limits[1])) + 1
+    return start + min_max_downsample(x[start:end],
+                                      numpy.nan_to_num(values[start:end]), width)
+
+
+def set_scatter_axes(axes, data):
+    axes.set_xlim(data['limits'][0])
+    axes.set_ylim(data['limits'][1])
+    axes.set_xlabel(data['labels'][0])
+    axes.set_ylabel(data['labels'][1])
+    format_axis(axes.xaxis, data['columns'][0])
+    format_axis(axes.yaxis, data['columns'][1])
+
+
+def set_series_axes(axes, data):
+    import numpy
+
+    axes.set_xlim(get_limits(numpy.concatenate([data['x'], data['overlay_x']])))
+    axes.set_ylim(get_limits(numpy.concatenate([data['y'], data['overlay_y']])))
+    axes.set_xlabel('Date')
+    axes.set_ylabel(data['label'])
+    format_axis(axes.xaxis, 'date')
+    format_axis(axes.yaxis, data['column'])
+
+
+def calendar_colormap():
+    """
+    Returns the calendar's colormap. Days outside the years are blank.
+    """
+    from matplotlib import colormaps
+
+    return colormaps['Greens'].with_extremes(bad='white')
+
+
+def set_calendar_axes(axes, data):
+    axes.set_xlim(data['extent'][:2])
+    axes.set_ylim(6.5, -0.5)
+    axes.set_xlabel('Date')
+    axes.set_ylabel('')
+    format_axis(axes.xaxis, 'date')
+    axes.set_yticks(range(7))
+    axes.set_yticklabels(WEEKDAYS)
+
+
+def set_load_axes(axes, ratio_axes, data):
+    import numpy
+
+    axes.set_xlim(get_limits(data['x']))
+    highest = max([float(values.max()) for values in data['series'].values()
+                   if len(values)] or [0.0])
+    axes.set_ylim(0, highest * 1.05 or 1.0)
+    ratio = data['ratio']
+    highest_ratio = numpy.nanmax(ratio) if numpy.isfinite(ratio).any() else 0
+    ratio_axes.set_ylim(0, max(2.0, float(highest_ratio) * 1.05))
+    axes.set_xlabel('Date')
+    axes.set_ylabel('Miles')
+    ratio_axes.set_ylabel('Workload Ratio')
+    format_axis(axes.xaxis, 'date')
+    format_axis(axes.yaxis, 'distance')
+
+
+def set_fitness_axes(axes, data):
+    import numpy
+
+    axes.set_xlim(get_limits(data['x']))
+    axes.set_ylim(get_limits(numpy.concatenate(list(data['series'].values()))))
+    axes.set_xlabel('Date')
+    axes.set_ylabel('TRIMP')
+    format_axis(axes.xaxis, 'date')
+    format_axis(axes.yaxis, 'duration')
+
+
+def draw_scatter(figure, data):
+    """
+    Draws a scatter plot on a figure that isn't on screen. This runs on the
+    render service's worker thread.
+    """
+    from GUI.downsampling import pixel_downsample
+
+    axes = figure.add_subplot(111)
+    x, y = data['x'], data['y']
+    if len(x) > DOWNSAMPLE_THRESHOLD:
+        keep = pixel_downsample(x, y, data['limits'][0], data['limits'][1],
+                                max(int(axes.bbox.width) // 2, 1),
+                                max(int(axes.bbox.height) // 2, 1))
+        x, y = x[keep], y[keep]
+    axes.scatter(x, y)
+    set_scatter_axes(axes, data)
+
+
+def draw_time_series(figure, data):
+    """
+    Draws a column over time and its overlay on a figure that isn't on
+    screen. This runs on the render service's worker thread.
+    """
+    axes = figure.add_subplot(111)
+    x, y = data['x'], data['y']
+    keep = downsample_series(x, y, max(int(axes.bbox.width), 1))
+    axes.plot(x[keep], y[keep], linewidth=1, label=data['label'])
+    if len(data['overlay_x']):
+        axes.plot(data['overlay_x'], data['overlay_y'], linewidth=2,
+                  drawstyle='steps-post', label=data['overlay_label'])
+        axes.legend(loc='upper left')
+    set_series_axes(axes, data)
+
+
+def draw_calendar(figure, data):
+    """
+    Draws the calendar as a single image on a figure that isn't on screen.
+    This runs on the render service's worker thread.
+    """
+    axes = figure.add_subplot(111)
+    image = axes.imshow(data['grid'], cmap=calendar_colormap(), aspect='auto',
+                        interpolation='nearest', extent=data['extent'])
+    image.set_clim(data['limits'])
+    colorbar_axes = axes.inset_axes([1.01, 0, 0.015, 1])
+    figure.colorbar(image, cax=colorbar_axes, label=data['label'])
+    set_calendar_axes(axes, data)
+
+
+def draw_training_load(figure, data):
+    """
+    Draws the training load lines on a figure that isn't on screen. This
+    runs on the render service's worker thread.
+    """
+    axes = figure.add_subplot(111)
+    ratio_axes = axes.twinx()
+    x = data['x']
+    width = max(int(axes.bbox.width), 1)
+    lines = []
+    for name, label in LOAD_LABELS.items():
+        values = data['series'][name]
+        keep = downsample_series(x, values, width)
+        lines.append(axes.plot(x[keep], values[keep], label=label)[0])
+    keep = downsample_series(x, data['ratio'], width)
+    lines.append(ratio_axes.plot(x[keep], data['ratio'][keep], color='tab:red',
+                                 linestyle=':', label='Workload Ratio')[0])
+    # The legend goes on the ratio axes so it is drawn above every line
+    ratio_axes.legend(handles=lines, loc='upper left')
+    set_load_axes(axes, ratio_axes, data)
+
+
+def draw_fitness(figure, data):
+    """
+    Draws the fitness, fatigue and form lines on a figure that isn't on
+    screen. This runs on the render service's worker thread.
+    """
+    axes = figure.add_subplot(111)
+    x = data['x']
+    width = max(int(axes.bbox.width), 1)
+    axes.axhline(0, color='gray', linewidth=0.5)
+    for name, label in FITNESS_LABELS.items():
+        values = data['series'][name]
+        keep = downsample_series(x, values, width)
+        axes.plot(x[keep], values[keep], label=label)
+    axes.legend(loc='upper left')
+    set_fitness_axes(axes, data)
 
 
 class RunVisuals:
     def __init__(self, root):
         self.root = root
         self.table = self.root.connection.table
+        self.data_version = None  # Database version of the plotted data
 
     def create_choices_frame(self):
         """
@@ -25,87 +272,652 @@ class RunVisuals:
                                    relief='sunken')
         self.visuals_frame.grid(row=0, column=0, padx=10, pady=10)
 
-        label = Label(self.visuals_frame, text="Scatter Plot", borderwidth=2,
+        label = Label(self.visuals_frame, text="Plot", borderwidth=2,
                       relief='raised')
         label.grid(row=0, columnspan=2, sticky='NEWS')
 
+        # Create the combobox for selecting the type of chart
+        chart_label = Label(self.visuals_frame, text='Chart:')
+        chart_label.grid(row=1, column=0, sticky='E')
+        self.chart = ttk.Combobox(self.visuals_frame, values=CHARTS,
+                                  state='readonly')
+        self.chart.current(0)
+        self.chart.grid(row=1, column=1)
+
         # Create the combobox for selecting the x-axis values
         columns = [column[:-1] for column in list(DISPLAY_NAMES_DICT.values())]
         x_label = Label(self.visuals_frame, text='X Axis:')
-        x_label.grid(row=1, column=0, sticky='E')
+        x_label.grid(row=2, column=0, sticky='E')
         self.x_axis = ttk.Combobox(self.visuals_frame, values=columns)
         self.x_axis.current(0)
-        self.x_axis.grid(row=1, column=1)
+        self.x_axis.grid(row=2, column=1)
 
         # Create the combobox for the y-axis values
         y_label = Label(self.visuals_frame, text='Y Axis:')
-        y_label.grid(row=2, column=0, sticky='E')
+        y_label.grid(row=3, column=0, sticky='E')
         self.y_axis = ttk.Combobox(self.visuals_frame, values=columns)
         self.y_axis.current(2)
-        self.y_axis.grid(row=2, column=1)
+        self.y_axis.grid(row=3, column=1)
 
         # Create the combobox for the date range value
         range_label = Label(self.visuals_frame, text='Range:')
-        range_label.grid(row=3, column=0, sticky='E')
+        range_label.grid(row=4, column=0, sticky='E')
         self.range = ttk.Combobox(self.visuals_frame,
                                   values=['ALL', '30 Days', '60 Days', '90 Days'])
         self.range.current(0)
-        self.range.grid(row=3, column=1)
+        self.range.grid(row=4, column=1)
+
+        # Create the combobox for the time series overlay
+        overlay_label = Label(self.visuals_frame, text='Overlay:')
+        overlay_label.grid(row=5, column=0, sticky='E')
+        self.overlay = ttk.Combobox(self.visuals_frame, values=list(OVERLAYS),
+                                    state='readonly')
+        self.overlay.current(0)
+        self.overlay.grid(row=5, column=1)
+
+        # Create the spinboxes for the calendar's first and last year
+        years_label = Label(self.visuals_frame, text='Years:')
+        years_label.grid(row=6, column=0, sticky='E')
+        years_frame = Frame(self.visuals_frame)
+        years_frame.grid(row=6, column=1)
+        self.first_year = Spinbox(years_frame, from_=1990, to=CURRENT_DATE.year,
+                                  width=6)
+        self.first_year.delete(0, END)
+        self.first_year.insert(0, str(CURRENT_DATE.year))
+        self.first_year.grid(row=0, column=0)
+        to_label = Label(years_frame, text='to')
+        to_label.grid(row=0, column=1)
+        self.last_year = Spinbox(years_frame, from_=1990, to=CURRENT_DATE.year,
+                                 width=6)
+        self.last_year.delete(0, END)
+        self.last_year.insert(0, str(CURRENT_DATE.year))
+        self.last_year.grid(row=0, column=2)
+
+        # Interactive draws on the canvas with the zoom toolbar. Unchecked,
+        # charts are drawn off the Tk thread and shown as images
+        self.interactive = IntVar(value=1)
+        interactive_button = Checkbutton(self.visuals_frame, text='Interactive',
+                                         variable=self.interactive,
+                                         command=self.change_mode)
+        interactive_button.grid(row=7, columnspan=2)
 
         # Create a button that collects the info and creates teh visual
         self.visuals_button = Button(self.visuals_frame, text='Plot',
                                      command=self.plot)
-        self.visuals_button.grid(row=4, columnspan=2)
+        self.visuals_button.grid(row=8, columnspan=2)
 
     def create_plot_frame(self):
-        # Create the bottom frame that will house the visual
+        """
+        Creates the bottom frame that will house the visual along with the
+        figure, canvas and toolbar. They are created once and kept for the
+        life of the page so plotting only has to update the data. Matplotlib
+        is imported here, the first time the visuals page is opened.
+        """
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_tkagg import (FigureCanvasTkAgg,
+                                                       NavigationToolbar2Tk)
+
         self.visuals_display = Frame(self.root.bottom_frame)
         self.visuals_display.grid(row=0, column=0, padx=10,
                                   pady=10)
 
+        # Create the embedded figure that will hold the plot
+        self.figure = Figure(figsize=FIGURE_SIZE, dpi=DPI)
+        self.axes = self.figure.add_subplot(111)
+        # The points are animated so that they are left out of the saved
+        # background and drawn on top of it
+        self.scatter = self.axes.scatter([], [], animated=True)
+
+        # The training load lines are hidden until that chart is chosen. The
+        # workload ratio has its own y-axis on the right
+        self.load_lines = {name: self.axes.plot([], [], label=label)[0]
+                           for name, label in LOAD_LABELS.items()}
+        self.ratio_axes = self.axes.twinx()
+        self.ratio_line = self.ratio_axes.plot([], [], color='tab:red',
+                                               linestyle=':',
+                                               label='Workload Ratio')[0]
+        self.legend = self.ratio_axes.legend(
+            handles=list(self.load_lines.values()) + [self.ratio_line],
+            loc='upper left')
+
+        # The fitness lines are hidden until that chart is chosen. Their
+        # legend is added as an artist so it doesn't replace the time series
+        # legend
+        from matplotlib.legend import Legend
+        self.zero_line = self.axes.axhline(0, color='gray', linewidth=0.5)
+        self.fitness_lines = {name: self.axes.plot([], [], label=label)[0]
+                              for name, label in FITNESS_LABELS.items()}
+        self.fitness_legend = Legend(self.axes, list(self.fitness_lines.values()),
+                                     list(FITNESS_LABELS.values()),
+                                     loc='upper left')
+        self.axes.add_artist(self.fitness_legend)
+
+        # The time series line and its overlay are hidden until that chart is
+        # chosen
+        self.series_line = self.axes.plot([], [], linewidth=1)[0]
+        self.overlay_line = self.axes.plot([], [], linewidth=2,
+                                           drawstyle='steps-post')[0]
+        self.series_legend = self.axes.legend(
+            handles=[self.series_line, self.overlay_line], loc='upper left')
+
+        # The calendar is a single image with a colorbar beside the axes
+        import numpy
+        self.calendar_image = self.axes.imshow(numpy.full((7, 1), numpy.nan),
+                                               cmap=calendar_colormap(),
+                                               aspect='auto',
+                                               interpolation='nearest')
+        self.colorbar_axes = self.axes.inset_axes([1.01, 0, 0.015, 1])
+        self.colorbar = self.figure.colorbar(self.calendar_image,
+                                             cax=self.colorbar_axes)
+
+        self.chart_artists = {
+            'Scatter': [self.scatter],
+            'Time Series': [self.series_line, self.overlay_line,
+                            self.series_legend],
+            'Training Load': (list(self.load_lines.values())
+                              + [self.ratio_axes, self.legend]),
+            'Fitness': (list(self.fitness_lines.values())
+                        + [self.zero_line, self.fitness_legend]),
+            'Calendar': [self.calendar_image, self.colorbar_axes],
+        }
+        self.chart_shown = None
+        self.show_chart('Scatter')
+        self.canvas = FigureCanvasTkAgg(figure=self.figure,
+                                        master=self.visuals_display)
+        self.canvas.get_tk_widget().grid(row=0, column=0)
+        self.toolbar = NavigationToolbar2Tk(self.canvas, self.visuals_display,
+                                            pack_toolbar=False)
+        self.toolbar.update()
+        self.toolbar.grid(row=1, column=0)
+
+        # Save the empty axes after every full draw so that a plot with the
+        # same axes and limits can be blitted on top of it
+        self.background = None
+        self.canvas.mpl_connect('draw_event', self.save_background)
+
+        # The full data of the plot. Only part of it may be drawn
+        self.x_data = numpy.array([])
+        self.y_data = numpy.array([])
+        self.x_sorted = False
+        self.line_data = {}  # The full x and y of each line on the canvas
+
+        # Redo the downsampling at the new limits when zooming or panning
+        self.plotting = False  # Set while a plot sets the limits
+        self.detail_job = None
+        self.axes.callbacks.connect('xlim_changed', self.limits_changed)
+        self.axes.callbacks.connect('ylim_changed', self.limits_changed)
+
+        # Charts drawn on the worker thread are shown in this label
+        self.renderer = RenderService(self.visuals_display, FIGURE_SIZE, DPI)
+        self.image = None
+        self.image_label = Label(self.visuals_display)
+        self.image_label.grid(row=0, column=0)
+        self.change_mode()
+
+    def change_mode(self):
+        """
+        Swaps between the image drawn on the worker thread and the
+        interactive canvas and toolbar, then plots again if there is a plot.
+        """
+        if self.interactive.get():
+            self.image_label.grid_remove()
+            self.canvas.get_tk_widget().grid()
+            self.toolbar.grid()
+        else:
+            self.canvas.get_tk_widget().grid_remove()
+            self.toolbar.grid_remove()
+            self.image_label.grid()
+        if self.data_version is not None:
+            self.plot()
+
+    def show_image(self, image):
+        """
+        Shows the PNG bytes from the render service.
+        """
+        if image is None:
+            self.image_label.config(image='', text='The chart could not be drawn')
+            return
+        self.image = PhotoImage(data=base64.b64encode(image))
+        self.image_label.config(image=self.image, text='')
+
+    def save_background(self, event):
+        """
+        Called after every full draw, including zooming with the toolbar.
+        Saves the axes without the points and then draws the points.
+        """
+        self.background = self.canvas.copy_from_bbox(self.axes.bbox)
+        self.axes.draw_artist(self.scatter)
+
+    def to_numbers(self, column, values):
+        """
+        Converts the values of a column from the database to floats that can
+        be set directly on the scatter. Dates become matplotlib date numbers
+        and start times become hours after midnight.
+        """
+        import numpy
+        from matplotlib.dates import date2num
+
+        if column in DATES:
+            return date2num(values) if values else numpy.array([])
+        elif column in TIMES:
+            return numpy.array([value.total_seconds() / 3600 for value in values])
+        return numpy.array([float(value) for value in values])
+
+    def limits_changed(self, *args):
+        """
+        Called when the x or y limits change. Zooming sets both limits and
+        panning sets them on every mouse move, so the points are reduced
+        once when Tk is next idle. Limits set by a plot are skipped since the
+        plot reduces the points itself.
+        """
+        if self.plotting or self.detail_job is not None:
+            return
+        self.detail_job = self.canvas.get_tk_widget().after_idle(
+            self.update_after_zoom)
+
+    def update_after_zoom(self):
+        self.detail_job = None
+        self.update_level_of_detail()
+        # Only draws if the toolbar's own draw has already happened
+        self.canvas.draw_idle()
+
+    def set_axes(self, set_limits, *args):
+        """
+        Sets the axes for a plot without reducing the points each time a
+        limit is set. The plot reduces them once afterwards.
+        """
+        self.plotting = True
+        try:
+            set_limits(*args)
+        finally:
+            self.plotting = False
+
+    def update_level_of_detail(self, *args):
+        """
+        Sets the points drawn by the scatter and the lines from the full
+        data. Large plots are reduced to the points that can be seen at the
+        current limits. Dates are a series sorted by x, so the lowest and
+        highest point of each pixel column are kept. Other plots keep one
+        point for every two by two block of pixels.
+        """
+        import numpy
+        from GUI.downsampling import pixel_downsample
+
+        self.update_lines()
+        x, y = self.x_data, self.y_data
+        if len(x) > DOWNSAMPLE_THRESHOLD:
+            width = max(int(self.axes.bbox.width), 1)
+            height = max(int(self.axes.bbox.height), 1)
+            if self.x_sorted:
+                keep = downsample_visible(x, y, self.axes.get_xlim(), width)
+            else:
+                keep = pixel_downsample(x, y, self.axes.get_xlim(),
+                                        self.axes.get_ylim(),
+                                        max(width // 2, 1), max(height // 2, 1))
+            x, y = x[keep], y[keep]
+        self.scatter.set_offsets(numpy.column_stack([x, y]))
+
+    def update_lines(self):
+        """
+        Sets the points drawn by each visible line from its full data, so
+        zooming in shows the days that were merged at the full range.
+        """
+        width = max(int(self.axes.bbox.width), 1)
+        limits = self.axes.get_xlim()
+        for line, (x, values) in self.line_data.items():
+            if not line.get_visible():
+                continue
+            if len(x) > DOWNSAMPLE_THRESHOLD:
+                keep = downsample_visible(x, values, limits, width)
+                line.set_data(x[keep], values[keep])
+            else:
+                line.set_data(x, values)
+
+    def show_chart(self, chart):
+        """
+        Shows the artists on the canvas used by the chart and hides the
+        others.
+        """
+        if chart == self.chart_shown:
+            return
+        self.chart_shown = chart
+        for name, artists in self.chart_artists.items():
+            for artist in artists:
+                artist.set_visible(name == chart)
+
+    def get_start_date(self):
+        """
+        Returns the first date of the chosen range, or None for all runs.
+        """
+        date_range = self.range.get()
+        if date_range == 'ALL':
+            return None
+        limit = int(date_range[:2])
+        return datetime.date.today() - datetime.timedelta(limit)
+
     def plot(self):
-        # Destroy and recreate plot frame in case existing visual
-        self.visuals_display.destroy()
-        self.create_plot_frame()
+        """
+        Draws the chosen chart. Unless the page is interactive the chart is
+        taken from the render service's cache, or drawn on its worker thread
+        while the old chart stays on screen.
+        """
+        self.data_version = self.root.connection.version
+        chart = self.chart.get()
+        # The choices each chart uses, for the render service's cache key
+        choices = {
+            'Scatter': (self.x_axis.get(), self.y_axis.get(), self.range.get()),
+            'Time Series': (self.y_axis.get(), self.range.get(),
+                            self.overlay.get()),
+            'Training Load': (self.range.get(),),
+            'Fitness': (self.range.get(),),
+            'Calendar': (self.y_axis.get(), self.first_year.get(),
+                         self.last_year.get()),
+        }
+        # The method that gets each chart's data, the function that draws it
+        # on the worker thread and the method that draws it on the canvas
+        methods = {
+            'Scatter': (self.scatter_data, draw_scatter, self.plot_scatter),
+            'Time Series': (self.time_series_data, draw_time_series,
+                            self.plot_time_series),
+            'Training Load': (self.training_load_data, draw_training_load,
+                              self.plot_training_load),
+            'Fitness': (self.fitness_data, draw_fitness, self.plot_fitness),
+            'Calendar': (self.calendar_data, draw_calendar, self.plot_calendar),
+        }
+        if chart not in methods:
+            return
+        key = (chart, choices[chart], self.data_version)
+        interactive = self.interactive.get()
+        if not interactive:
+            image = self.renderer.get(key)
+            if image is not None:
+                # A chart still being drawn must not replace this one
+                self.renderer.cancel()
+                self.show_image(image)
+                return
+
+        get_data, draw, plot_on_canvas = methods[chart]
+        data = get_data()
+        if data is None:
+            return
+        if interactive:
+            self.renderer.cancel()
+            plot_on_canvas(data)
+        else:
+            self.renderer.request(key, draw, data, self.show_image)
+
+    def scatter_data(self):
+        """
+        Queries the columns chosen for the scatter plot and returns them as
+        arrays with the axis limits and labels. Returns None if a column
+        isn't valid.
+        """
+        import numpy
 
         # Get the values from the combo boxes
         x = self.x_axis.get().strip().lower().replace(' ', '_')
         y = self.y_axis.get().strip().lower().replace(' ', '_')
-        date_range = self.range.get()
-        if date_range == 'ALL':
+        if x not in COLUMN_NAMES or y not in COLUMN_NAMES:
+            return None
+        start_date = self.get_start_date()
+        if start_date is None:
             where = ''
+            params = None
         else:
-            limit = int(date_range[:2])
-            date = datetime.date.today() - datetime.timedelta(limit)
-            where = f"date > '{date}' AND "
+            where = "date > %s AND "
+            params = (start_date,)
 
-        # Format the results of the query into lists for the x and y-axis
+        # Format the results of the query into arrays for the x and y-axis
         select_statement = f"""SELECT {x}, {y} FROM {self.table} WHERE {where}
          {x} is not null and {y} is not null;"""
-        result = self.root.connection.execute_query(select_statement)
-        x_results = [x[0] for x in result]
-        y_results = [y[1] for y in result]
-
-        # Create to embedded figure that will hold the plot
-        figure = Figure(figsize=(10, 4), dpi=100)
-        ax = figure.add_subplot(111)
-        self.canvas = FigureCanvasTkAgg(figure=figure,
-                                        master=self.visuals_display)
-        self.canvas.get_tk_widget().grid(row=0, column=0)
+        result = self.root.connection.execute_query(select_statement, params)
+        x_results = self.to_numbers(x, [row[0] for row in result])
+        y_results = self.to_numbers(y, [row[1] for row in result])
+
+        # Dates are kept in order so they can be downsampled as a series
+        if x in DATES:
+            order = numpy.argsort(x_results, kind='stable')
+            x_results, y_results = x_results[order], y_results[order]
+        return {'x': x_results, 'y': y_results, 'columns': (x, y),
+                'labels': (self.x_axis.get(), self.y_axis.get()),
+                'limits': (get_limits(x_results), get_limits(y_results)),
+                'sorted': x in DATES}
+
+    def time_series_data(self):
+        """
+        Queries the y-axis column by date and, if an overlay is chosen, the
+        column's weekly or monthly averages from the rollup tables. Returns
+        None if the column isn't valid.
+        """
+        import numpy
+
+        y = self.y_axis.get().strip().lower().replace(' ', '_')
+        if y not in COLUMN_NAMES or y in DATES:
+            return None
+        start_date = self.get_start_date()
+        if start_date is None:
+            where = ''
+            params = None
+        else:
+            where = "date > %s AND "
+            params = (start_date,)
+        select_statement = f"""SELECT date, {y} FROM {self.table} WHERE {where}
+         {y} is not null ORDER BY date;"""
+        result = self.root.connection.execute_query(select_statement, params)
+        data = {'x': self.to_numbers('date', [row[0] for row in result]),
+                'y': self.to_numbers(y, [row[1] for row in result]),
+                'column': y, 'label': self.y_axis.get(),
+                'overlay_x': numpy.array([]), 'overlay_y': numpy.array([]),
+                'overlay_label': f"{self.overlay.get()} Average"}
+
+        # The averages are read from the rollups, one row per period
+        period = OVERLAYS.get(self.overlay.get())
+        if period is not None and y in ROLLUP_COLUMNS:
+            rollups = self.root.connection.rollups
+            averages = rollups.get_averages(period, y, start_date)
+            data['overlay_x'] = self.to_numbers('date', [row[0] for row in averages])
+            data['overlay_y'] = numpy.array([float(row[1]) for row in averages])
+        return data
+
+    def calendar_data(self):
+        """
+        Returns the daily totals of the y-axis column for the chosen years as
+        a grid with a row for each day of the week and a column for each
+        week. MySQL adds up the runs for each day and numpy.bincount places
+        the days in the grid. Returns None if the choices aren't valid.
+        """
+        import numpy
+        from matplotlib.dates import date2num
 
-        # Create and draw the plot on the canvas
-        ax.scatter(x_results, y_results)
-        ax.set_xlabel(self.x_axis.get())
-        ax.set_ylabel(self.y_axis.get())
-        toolbar = NavigationToolbar2Tk(self.canvas, self.visuals_display,
-                                       pack_toolbar=False)
-        toolbar.update()
-        toolbar.grid()
-        self.canvas.draw()
+        column = self.y_axis.get().strip().lower().replace(' ', '_')
+        if column not in CALENDAR_COLUMNS:
+            names = ', '.join(name.capitalize() for name in CALENDAR_COLUMNS)
+            messagebox.showwarning(message=f"The calendar can show: {names}")
+            return None
+        try:
+            years = sorted([int(self.first_year.get()), int(self.last_year.get())])
+        except ValueError:
+            messagebox.showwarning(message="Enter the years as numbers")
+            return None
+        first_day = datetime.date(years[0], 1, 1)
+        last_day = datetime.date(years[1], 12, 31)
+
+        statement = f"""SELECT date, SUM({column}) FROM {self.table}
+        WHERE date BETWEEN %s AND %s AND {column} IS NOT NULL GROUP BY date;"""
+        result = self.root.connection.execute_query(statement,
+                                                    (first_day, last_day))
+
+        # The grid starts on the Monday before the first day
+        grid_start = first_day - datetime.timedelta(days=first_day.weekday())
+        number_of_days = (last_day - grid_start).days + 1
+        weeks = -(-number_of_days // 7)
+        offsets = numpy.array([(row[0] - grid_start).days for row in result],
+                              dtype=numpy.int64)
+        totals = numpy.array([float(row[1]) for row in result])
+        daily = numpy.bincount(offsets, weights=totals, minlength=weeks * 7)
+        # Blank the days of the first and last week outside the years
+        daily[:first_day.weekday()] = numpy.nan
+        daily[number_of_days:] = numpy.nan
+
+        start = float(date2num(grid_start))
+        highest = float(totals.max()) if len(totals) else 1.0
+        return {'grid': daily.reshape(weeks, 7).T,
+                'extent': (start, start + weeks * 7, 6.5, -0.5),
+                'limits': (0.0, highest), 'label': self.y_axis.get()}
+
+    def training_load_data(self):
+        """
+        Returns the training load metrics for each day of the chosen range
+        as arrays.
+        """
+        import numpy
+
+        metrics = self.root.metrics.get_metrics()
+        if not metrics:
+            empty = numpy.array([])
+            return {'x': empty, 'ratio': empty,
+                    'series': {name: empty for name in LOAD_LABELS}}
+        start, x = self.get_range_days(metrics['dates'])
+        return {'x': x, 'ratio': metrics['workload_ratio'][start:],
+                'series': {'mileage_7': metrics['mileage_7'][start:],
+                           'mileage_28': metrics['mileage_28'][start:] / 4}}
+
+    def fitness_data(self):
+        """
+        Returns the fitness, fatigue and form for each day of the chosen
+        range as arrays.
+        """
+        import numpy
+
+        curves = self.root.fitness.get_metrics()
+        if not curves:
+            empty = numpy.array([])
+            return {'x': empty, 'series': {name: empty for name in FITNESS_LABELS}}
+        start, x = self.get_range_days(curves['dates'])
+        return {'x': x, 'series': {name: curves[name][start:]
+                                   for name in FITNESS_LABELS}}
+
+    def get_range_days(self, dates):
+        """
+        Returns the index of the first of the daily dates in the chosen range
+        and the dates from it onward as matplotlib date numbers.
+        """
+        import numpy
+        from matplotlib.dates import date2num
+
+        start_date = self.get_start_date()
+        start = 0 if start_date is None else int(
+            numpy.searchsorted(dates, numpy.datetime64(start_date, 'D')))
+        x = date2num(dates[start:]) if len(dates) > start else numpy.array([])
+        return start, x
+
+    def plot_scatter(self, data):
+        """
+        Updates the scatter's points in place instead of creating a new
+        figure. If the axes and their limits are the same as the last plot
+        only the points are redrawn and blitted onto the saved background,
+        otherwise the canvas is redrawn with draw_idle.
+        """
+        self.x_data, self.y_data = data['x'], data['y']
+        self.x_sorted = data['sorted']
+
+        # Blit if nothing but the points changed
+        limits = data['limits']
+        same_axes = (self.background is not None
+                     and self.chart_shown == 'Scatter'
+                     and limits == (self.axes.get_xlim(), self.axes.get_ylim())
+                     and data['labels'] == (self.axes.get_xlabel(),
+                                            self.axes.get_ylabel()))
+        if same_axes:
+            self.update_level_of_detail()
+            self.canvas.restore_region(self.background)
+            self.axes.draw_artist(self.scatter)
+            self.canvas.blit(self.axes.bbox)
+        else:
+            self.show_chart('Scatter')
+            self.set_axes(set_scatter_axes, self.axes, data)
+            self.update_level_of_detail()
+            self.canvas.draw_idle()
+
+    def plot_time_series(self, data):
+        """
+        Draws the column over time on the canvas with its overlay.
+        """
+        self.line_data[self.series_line] = (data['x'], data['y'])
+        self.series_line.set_label(data['label'])
+        self.overlay_line.set_data(data['overlay_x'], data['overlay_y'])
+        self.overlay_line.set_label(data['overlay_label'])
+
+        self.show_chart('Time Series')
+        self.series_legend.remove()
+        self.series_legend = self.axes.legend(
+            handles=[self.series_line, self.overlay_line], loc='upper left')
+        self.series_legend.set_visible(len(data['overlay_x']) > 0)
+        self.chart_artists['Time Series'][2] = self.series_legend
+        self.set_axes(set_series_axes, self.axes, data)
+        self.update_lines()
+        self.canvas.draw_idle()
+
+    def plot_calendar(self, data):
+        """
+        Updates the calendar image on the canvas.
+        """
+        self.calendar_image.set_data(data['grid'])
+        self.calendar_image.set_extent(data['extent'])
+        self.calendar_image.set_clim(data['limits'])
+        self.colorbar.set_label(data['label'])
+
+        self.show_chart('Calendar')
+        self.set_axes(set_calendar_axes, self.axes, data)
+        self.canvas.draw_idle()
+
+    def plot_training_load(self, data):
+        """
+        Draws the 7 day mileage, the weekly average of the 28 day mileage
+        and the workload ratio for each day of the range. Long histories are
+        reduced to the lowest and highest day of each pixel column.
+        """
+        for name, values in data['series'].items():
+            self.line_data[self.load_lines[name]] = (data['x'], values)
+        self.line_data[self.ratio_line] = (data['x'], data['ratio'])
+
+        self.show_chart('Training Load')
+        self.set_axes(set_load_axes, self.axes, self.ratio_axes, data)
+        self.update_lines()
+        self.canvas.draw_idle()
+
+    def plot_fitness(self, data):
+        """
+        Draws the fitness, fatigue and form for each day of the range on the
+        canvas.
+        """
+        for name, values in data['series'].items():
+            self.line_data[self.fitness_lines[name]] = (data['x'], values)
+
+        self.show_chart('Fitness')
+        self.set_axes(set_fitness_axes, self.axes, data)
+        self.update_lines()
+        self.canvas.draw_idle()
+
+    def refresh(self):
+        """
+        Redraws the plot if one has been drawn and the database has changed
+        since.
+        """
+        if self.data_version is not None:
+            if self.data_version != self.root.connection.version:
+                self.plot()
+
+    def show(self):
+        self.root.table.grid_remove()
+        self.visuals_frame.grid()
+        self.visuals_display.grid()
+        self.root.current_frame = self.visuals_frame
+        self.root.visuals_display = self.visuals_display
 
     def initialize(self):
-        self.root.table.destroy()
+        self.root.table.grid_remove()
         self.create_choices_frame()
         self.create_plot_frame()
-        self.current_frame = self.visuals_frame
+        self.root.current_frame = self.visuals_frame
         self.root.visuals_display = self.visuals_display
@@ -0,0 +1,74 @@
+"""
+This file measures how long it takes to import everything the app needs
+before the login window can be shown. Each measurement is done in a new
+Python process so nothing is already cached in sys.modules. It also checks
+that none of the slow modules are loaded before the login window. It can be
+run manually from any directory and exits with 1 if the imports are over
+budget or a slow module was loaded.
+"""
+
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+# Modules that should only be imported after logging in
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib', 'tkcalendar',
+                 'mysql.connector']
+
+# The most time (seconds) the imports for the login window should take
+IMPORT_BUDGET = 0.5
+
+RUNS = 5
+
+# Imports main without running it and reports the time and slow modules
+MEASURE_CODE = f"""
+import sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+loaded = [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+print(elapsed)
+print(','.join(loaded))
+"""
+
+
+def measure_import(program_directory):
+    """
+    Imports main.py in a new Python process and returns the time it took and
+    a list of any slow modules that were imported.
+    """
+    result = subprocess.run([sys.executable, '-c', MEASURE_CODE],
+                            cwd=program_directory, capture_output=True,
+                            text=True, check=True)
+    elapsed, loaded = result.stdout.splitlines()[-2:]
+    loaded = [name for name in loaded.split(',') if name]
+    return float(elapsed), loaded
+
+
+def run_benchmark(program_directory, runs=RUNS):
+    times = []
+    loaded = []
+    for _ in range(runs):
+        elapsed, loaded = measure_import(program_directory)
+        times.append(elapsed)
+
+    print(f"Time to import the login window ({runs} runs):")
+    print(f"\tmedian: {statistics.median(times) * 1000:.1f} ms")
+    print(f"\tfastest: {min(times) * 1000:.1f} ms")
+    print(f"\tbudget: {IMPORT_BUDGET * 1000:.0f} ms")
+
+    passed = True
+    if loaded:
+        print(f"Slow modules loaded before login: {', '.join(loaded)}")
+        passed = False
+    if statistics.median(times) > IMPORT_BUDGET:
+        print("Imports are over budget.")
+        passed = False
+    return passed
+
+
+if __name__ == '__main__':
+    program_directory = Path(__file__).resolve().parent.parent
+    if not run_benchmark(program_directory):
+        sys.exit(1)
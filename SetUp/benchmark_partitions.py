@@ -0,0 +1,131 @@
+"""
+This file compares the recent date range queries used by the visuals and
+search pages on a regular runs table and on a table partitioned by year. Both
+tables are filled with the same made up runs in a scratch database that is
+dropped at the end. It is run manually from the program directory and asks
+for the MySQL login:
+    python -m SetUp.benchmark_partitions [number of runs]
+"""
+
+import getpass
+import random
+import statistics
+import sys
+import time
+from constants import *
+from database import Database
+
+BENCHMARK_DATABASE = 'run_app_partition_benchmark'
+DEFAULT_ROWS = 100_000
+YEARS = 15  # How many years of history the made up runs cover
+RANGES = [30, 60, 90]  # The date ranges offered on the visuals page
+REPEATS = 5
+BATCH_SIZE = 5000
+
+INSERT_COLUMNS = ['date', 'start_time', 'distance', 'duration', 'pace',
+                  'calories', 'avg_hr', 'max_hr']
+
+
+def made_up_runs(number_of_runs):
+    """
+    Yields runs spread randomly over the history. The same runs are made
+    every time so both tables get identical data.
+    """
+    generator = random.Random(1)
+    first_day = CURRENT_DATE - datetime.timedelta(days=365 * YEARS)
+    for _ in range(number_of_runs):
+        date = first_day + datetime.timedelta(days=generator.randrange(365 * YEARS))
+        start_time = f"{generator.randrange(5, 20):02d}:{generator.randrange(60):02d}:00"
+        distance = round(generator.uniform(2, 14), 2)
+        pace = round(generator.uniform(7, 11), 2)
+        duration = round(distance * pace, 2)
+        calories = int(distance * 110)
+        avg_hr = generator.randrange(130, 170)
+        yield (date, start_time, distance, duration, pace, calories, avg_hr,
+               avg_hr + 15)
+
+
+def fill_table(database, number_of_runs):
+    """
+    Inserts the made up runs in batches and returns how long it took.
+    """
+    placeholders = ', '.join(['%s'] * len(INSERT_COLUMNS))
+    statement = f"""INSERT INTO {database.table} ({', '.join(INSERT_COLUMNS)})
+    VALUES ({placeholders});"""
+    cursor = database.connection.cursor()
+    start = time.perf_counter()
+    batch = []
+    for run in made_up_runs(number_of_runs):
+        batch.append(run)
+        if len(batch) == BATCH_SIZE:
+            cursor.executemany(statement, batch)
+            batch = []
+    if batch:
+        cursor.executemany(statement, batch)
+    database.connection.commit()
+    cursor.close()
+    return time.perf_counter() - start
+
+
+def time_range_query(database, days):
+    """
+    Runs the same kind of query as the visuals page for the last number of
+    days. The query cache is skipped by using a cursor directly. Returns the
+    median time and the partitions MySQL read.
+    """
+    since = CURRENT_DATE - datetime.timedelta(days=days)
+    statement = f"""SELECT date, distance FROM {database.table}
+    WHERE date > %s AND distance IS NOT NULL;"""
+    times = []
+    for _ in range(REPEATS):
+        cursor = database.connection.cursor()
+        start = time.perf_counter()
+        cursor.execute(statement, (since,))
+        cursor.fetchall()
+        times.append(time.perf_counter() - start)
+        cursor.close()
+
+    cursor = database.connection.cursor(dictionary=True)
+    cursor.execute(f"EXPLAIN {statement}", (since,))
+    partitions = cursor.fetchall()[0].get('partitions')
+    cursor.close()
+    return statistics.median(times), partitions
+
+
+def run_benchmark(user, password, number_of_runs):
+    setup = Database(user, password)
+    setup.execute_query(f"CREATE DATABASE {BENCHMARK_DATABASE};")
+    setup.connection.close()
+    try:
+        regular = Database(user, password, BENCHMARK_DATABASE, 'runs_regular')
+        regular.create_table()
+        partitioned = Database(user, password, BENCHMARK_DATABASE,
+                               'runs_partitioned')
+        partitioned.create_table(partitioned=True)
+
+        for database in (regular, partitioned):
+            seconds = fill_table(database, number_of_runs)
+            print(f"Inserted {number_of_runs} runs into {database.table} "
+                  f"in {seconds:.1f} s")
+
+        print(f"\nMedian of {REPEATS} queries:")
+        for days in RANGES:
+            regular_time, _ = time_range_query(regular, days)
+            partitioned_time, partitions = time_range_query(partitioned, days)
+            print(f"\tLast {days} days: regular {regular_time * 1000:.1f} ms, "
+                  f"partitioned {partitioned_time * 1000:.1f} ms "
+                  f"({regular_time / partitioned_time:.1f}x), "
+                  f"partitions read: {partitions}")
+        regular.connection.close()
+        partitioned.connection.close()
+    finally:
+        cleanup = Database(user, password)
+        cleanup.execute_query(f"DROP DATABASE {BENCHMARK_DATABASE};")
+        cleanup.connection.close()
+
+
+if __name__ == '__main__':
+    number_of_runs = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS
+    user = input('MySQL User: ')
+    password = getpass.getpass('MySQL Password: ')
+    run_benchmark(user, password, number_of_runs)
@@ -1,7 +1,7 @@
 """
 This file builds all the necessary file paths using the program directory and
 the downloads folder so that the program knows where to look for the export
-zip and where to save the export xml and cleaned data csv files.
+zip and where to save the export xml and cleaned data files.
 """
 
 from constants import read_config_file
@@ -39,7 +39,9 @@ class ConfigureDirectories:
             'old_xml_file': Path.joinpath(self.filepaths['cleaning_data_directory'],
                                           'export.xml'),
             'cleaned_data': Path.joinpath(self.filepaths['cleaning_data_directory'],
-                                          'cleaned_data.csv'),
+                                          'cleaned_data.npy'),
+            'routes_directory': Path.joinpath(self.filepaths['cleaning_data_directory'],
+                                              'workout-routes'),
         })
         self.filepaths.update({
             'unzipped_file': Path.joinpath(self.filepaths['unzipped_folder'],
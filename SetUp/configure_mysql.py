@@ -30,6 +30,10 @@ class ConfigureMySQL:
         self.database_entry = Entry(self.window.frame)
         table_label = Label(self.window.frame, text='Table:')
         self.table_entry = Entry(self.window.frame)
+        self.partitioned = IntVar(self.window.frame, value=0)
+        partition_check = Checkbutton(self.window.frame,
+                                      text='Partition the table by year\n(for very large histories)',
+                                      variable=self.partitioned)
         button = Button(self.window.frame, text='Submit',
                         command=self.get_mysql_info)
 
@@ -38,7 +42,8 @@ class ConfigureMySQL:
         self.database_entry.grid(row=1, column=1)
         table_label.grid(row=2, column=0)
         self.table_entry.grid(row=2, column=1)
-        button.grid(row=3, columnspan=2)
+        partition_check.grid(row=3, columnspan=2)
+        button.grid(row=4, columnspan=2)
 
     def get_mysql_info(self):
         """
@@ -54,6 +59,7 @@ class ConfigureMySQL:
         """
         self.config.set('mysql_info', 'database', self.database)
         self.config.set('mysql_info', 'table', self.table)
+        self.config.set('mysql_info', 'partitioned', str(self.partitioned.get()))
         self.config.set('set_up', 'is_configured', '1')
         with open(self.config_path, 'w') as config_file:
             self.config.write(config_file)
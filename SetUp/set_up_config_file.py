@@ -16,7 +16,7 @@ def clear_configuration_file(config_path):
     config['set_up'] = {'is_configured': '0'}
 
     # MySQL section
-    config['mysql_info'] = {'database': '0', 'table': '0'}
+    config['mysql_info'] = {'database': '0', 'table': '0', 'partitioned': '0'}
 
     # Directory info section
     config['directory_info'] = {'downloads_directory': '0',
@@ -26,7 +26,8 @@ def clear_configuration_file(config_path):
                                 'unzipped_folder': '0',
                                 'unzipped_file': '0',
                                 'old_xml_file': '0',
-                                'cleaned_data': '0'}
+                                'cleaned_data': '0',
+                                'routes_directory': '0'}
 
     # Write the file
     with open(config_path, 'w') as config_file:
@@ -0,0 +1,226 @@
+"""
+This module loads new exports and maintains the database from the command
+line without opening any windows, so it can be run from cron or on a server
+with no display. It is run from the program directory:
+    python cli.py ingest [--no-stream] [--serial] [--batch-size N]
+    python cli.py maintain
+
+The MySQL user and password are read from the RUN_APP_USER and
+RUN_APP_PASSWORD environment variables, or asked for if they aren't set.
+The time taken by each stage is printed with the rows it added and how many
+rows or megabytes it got through a second. The exit code is 0 when every
+stage succeeded, even if there was no new export, and one of the EXIT codes
+below otherwise.
+"""
+
+import argparse
+import getpass
+import os
+import sys
+import time
+from pathlib import Path
+from constants import *
+
+EXIT_OK = 0
+EXIT_STAGE_FAILED = 1
+EXIT_USAGE = 2  # Also used by argparse for invalid arguments
+EXIT_LOGIN_FAILED = 3
+EXIT_NOT_CONFIGURED = 4
+
+MEGABYTE = 1024 * 1024
+
+
+class StageFailed(Exception):
+    pass
+
+
+class StageReport:
+    """
+    Times each stage and prints a line for it as soon as it finishes.
+    """
+    def __init__(self):
+        self.total = 0.0
+
+    def run(self, name, stage, rows=None, megabytes=None):
+        """
+        Runs a stage and prints its time. rows and megabytes are functions
+        called after the stage that return how much it got through.
+        """
+        start = time.perf_counter()
+        try:
+            result = stage()
+        except Exception as error:
+            print(f"{name:<16} failed after {time.perf_counter() - start:.2f} s: "
+                  f"{type(error).__name__}: {error}", file=sys.stderr)
+            raise StageFailed(name) from error
+        seconds = time.perf_counter() - start
+        self.total += seconds
+        line = f"{name:<16}{seconds:>9.2f} s"
+        if rows is not None:
+            count = rows()
+            line += f"{count:>12,} rows{count / max(seconds, 1e-9):>14,.0f} rows/s"
+        if megabytes is not None:
+            size = megabytes()
+            line += f"{size:>10.1f} MB{size / max(seconds, 1e-9):>10.1f} MB/s"
+        print(line)
+        return result
+
+
+def get_login(args):
+    user = args.user or os.environ.get('RUN_APP_USER') or input('MySQL User: ')
+    password = os.environ.get('RUN_APP_PASSWORD')
+    if password is None:
+        password = getpass.getpass('MySQL Password: ')
+    return user, password
+
+
+def connect(args, config):
+    """
+    Returns a connection to the configured database or None if the login
+    fails.
+    """
+    import mysql.connector
+    from database import Database
+
+    user, password = get_login(args)
+    try:
+        return Database(user, password, config.get('mysql_info', 'database'),
+                        config.get('mysql_info', 'table'))
+    except mysql.connector.Error as error:
+        print(f"Could not connect to MySQL: {error}", file=sys.stderr)
+        return None
+
+
+def file_megabytes(path) -> float:
+    path = Path(path)
+    return path.stat().st_size / MEGABYTE if path.exists() else 0.0
+
+
+def set_up_tables(connection, config):
+    """
+    Adds the indexes, rollup and records tables and partitions the same way
+    the login does, so an export can be loaded into a database that hasn't
+    been opened in the app since they were added.
+    """
+    connection.create_indexes()
+    connection.rollups.create_tables()
+    connection.records.create_table()
+    if config.getboolean('mysql_info', 'partitioned', fallback=False):
+        connection.add_future_partitions()
+
+
+def ingest(args, connection, config) -> int:
+    """
+    Runs each stage of the ingest pipeline with its timing.
+    """
+    from CleaningData.pipeline import IngestPipeline
+
+    pipeline = IngestPipeline(connection, args.config, streaming=args.stream,
+                              parallel=args.parallel, batch_size=args.batch_size)
+    report = StageReport()
+    xml_file = config.get('directory_info', 'old_xml_file')
+    counts = pipeline.counts
+    extracted = lambda: file_megabytes(xml_file) if pipeline.check.new_file else 0.0
+    report.run('Setup', lambda: set_up_tables(connection, config))
+    if not report.run('Unzip', pipeline.unzip, megabytes=extracted):
+        if pipeline.check.already_processed:
+            print("The export in the downloads folder has already been loaded")
+        else:
+            print("No new export found")
+        return EXIT_OK
+    report.run('Clean', pipeline.clean, rows=lambda: counts['cleaned_runs'],
+               megabytes=lambda: file_megabytes(xml_file))
+    report.run('Tables', pipeline.prepare)
+    # Nothing is kept if a load stage fails
+    with connection.transaction():
+        report.run('Load runs', pipeline.load, rows=lambda: counts['runs'])
+        report.run('Heart rate', pipeline.load_heart_rate,
+                   rows=lambda: counts['heart_rate_samples'])
+        report.run('Routes', pipeline.load_routes, rows=lambda: counts['routes'])
+    pipeline.finish()
+    print(f"{'Total':<16}{report.total:>9.2f} s")
+    return EXIT_OK
+
+
+def maintain(args, connection, config) -> int:
+    """
+    Makes sure the indexes, partitions, rollups, records and route index
+    are in place, and calculates the rollups, records and missing route
+    cells again.
+    """
+    from CleaningData.route_ingest import RouteIngest
+
+    report = StageReport()
+    report.run('Indexes', connection.create_indexes)
+    if config.getboolean('mysql_info', 'partitioned', fallback=False):
+        report.run('Partitions', connection.add_future_partitions)
+    report.run('Rollup tables', connection.rollups.create_tables)
+    report.run('Rollups', connection.rollups.refresh)
+    if not report.run('Records table', connection.records.create_table):
+        report.run('Records', connection.records.refresh)
+    routes = RouteIngest(connection, args.config)
+
+    def create_route_tables():
+        routes.create_table()
+        routes.index.create_table()
+
+    report.run('Route tables', create_route_tables)
+    report.run('Route index', routes.index.add_missing_routes)
+    print(f"{'Total':<16}{report.total:>9.2f} s")
+    return EXIT_OK
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(
+        description='Load new exports and maintain the run database without the GUI.')
+    parser.add_argument('--config', type=Path,
+                        default=Path.joinpath(Path.cwd(), 'config.ini'),
+                        help='path to config.ini (default: ./config.ini)')
+    parser.add_argument('--user', help='MySQL user (default: $RUN_APP_USER)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest_parser = commands.add_parser(
+        'ingest', help='load a new export from the downloads folder')
+    ingest_parser.add_argument(
+        '--stream', action=argparse.BooleanOptionalAction, default=True,
+        help='stream the XML file while cleaning instead of parsing the whole tree')
+    ingest_parser.add_argument(
+        '--parallel', action=argparse.BooleanOptionalAction, default=True,
+        help='parse the route files in a process pool')
+    ingest_parser.add_argument('--serial', dest='parallel', action='store_false',
+                               help='same as --no-parallel')
+    ingest_parser.add_argument(
+        '--batch-size', type=int, default=None,
+        help="rows sent to MySQL in each bulk insert (default: each loader's own)")
+    ingest_parser.set_defaults(function=ingest)
+
+    maintain_parser = commands.add_parser(
+        'maintain', help='rebuild the rollups, records and route index and add partitions')
+    maintain_parser.set_defaults(function=maintain)
+
+    args = parser.parse_args(arguments)
+    if args.command == 'ingest' and args.batch_size is not None and args.batch_size < 1:
+        parser.error('--batch-size must be at least 1')
+    return args
+
+
+def main(arguments=None) -> int:
+    args = parse_arguments(arguments)
+    config = read_config_file(args.config)
+    if not config.getboolean('set_up', 'is_configured', fallback=False):
+        print(f"{args.config} is not configured. Run main.py to set up the app.",
+              file=sys.stderr)
+        return EXIT_NOT_CONFIGURED
+    connection = connect(args, config)
+    if connection is None:
+        return EXIT_LOGIN_FAILED
+    try:
+        return args.function(args, connection, config)
+    except StageFailed:
+        return EXIT_STAGE_FAILED
+    finally:
+        connection.connection.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -48,6 +48,22 @@ MYSQL_DATATYPES = [('run_id', 'SMALLINT UNSIGNED PRIMARY KEY AUTO_INCREMENT'),
                    ('temperature', 'TINYINT UNSIGNED'),
                    ('humidity', 'TINYINT UNSIGNED')]
 
+# Columns that are indexed so searches on them don't scan the whole table
+INDEXED_COLUMNS = ['date', 'distance']
+
+# Partitioned tables split the runs into one partition per year. MySQL needs
+# the date in the primary key of a partitioned table and a larger run id
+# allows for histories of more than 65,535 runs.
+PARTITIONED_DATATYPES = ([('run_id', 'INT UNSIGNED AUTO_INCREMENT'),
+                          ('date', 'DATE NOT NULL')]
+                         + MYSQL_DATATYPES[2:])
+PARTITIONED_PRIMARY_KEY = 'PRIMARY KEY (run_id, date)'
+
+# How many years of past partitions a new partitioned table starts with and
+# how many years ahead the maintenance keeps partitions ready for
+PARTITION_YEARS_BACK = 15
+PARTITION_YEARS_AHEAD = 1
+
 
 def read_config_file(config_path):
     config = configparser.ConfigParser()
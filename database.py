@@ -4,12 +4,30 @@ database. The login info is requested by the app in the login module and then
 sent to the class. The database parameter is defaulted to none in case it is
 the user's first time logging in. After that the database name and table name
 are retrieved from the configuration file.
+
+The results of read statements are cached so that repeating a query costs
+nothing until the data changes. Every write bumps the version number and
+empties the cache. Adding, editing and deleting a run also updates the weekly
+and monthly rollups for the run's dates and the personal records.
 """
 
 import mysql.connector
 from pathlib import Path
 from constants import *
+from timing import TIMINGS
+from rollups import Rollups
+from records import Records
+from collections import OrderedDict
+from contextlib import contextmanager
 import datetime
+import sys
+import time
+
+# Statements that only read from the database and don't change the data
+READ_STATEMENTS = ('SELECT', 'DESC', 'SHOW', 'EXPLAIN')
+
+# The most memory (bytes) the cached query results are allowed to use
+CACHE_BYTES = 32 * 1024 * 1024
 
 
 class Database:
@@ -23,6 +41,18 @@ class Database:
         self.database = database
         self.table = table
         self.config_path = Path.joinpath(Path.cwd(), 'config.ini')
+        # Incremented by every write so pages can tell if their data is stale
+        self.version = 0
+
+        # Read results keyed by statement and params, least recently used first
+        self.cache = OrderedDict()
+        self.cache_size = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.in_transaction = False  # Commits wait for the end of transaction()
+
+        self.rollups = Rollups(self)
+        self.records = Records(self)
 
         self.connection = mysql.connector.connect(
             host='localhost',
@@ -36,18 +66,108 @@ class Database:
         self.database = config.get('mysql_info', 'database')
         self.table = config.get('mysql_info', 'table')
 
-    def execute_query(self, statement: str) -> list[tuple]:
+    def execute_query(self, statement: str, params=None) -> list[tuple]:
         """
         Takes a sql statement as a string and executes it in the database and
-        returns a list of tuples.
+        returns a list of tuples. Values can be passed separately as params
+        to fill the statement's %s placeholders. Reads are answered from the
+        cache when the same statement and params were run since the last
+        write. Any statement that is not a read bumps the version number. The
+        time spent in MySQL is reported to the timings.
         """
+        is_read = statement.lstrip().upper().startswith(READ_STATEMENTS)
+        if is_read:
+            key = (' '.join(statement.split()),
+                   tuple(params) if params is not None else None)
+            cached = self.get_cached(key)
+            if cached is not None:
+                return cached
+
+        start = time.perf_counter()
         cursor = self.connection.cursor()
-        cursor.execute(statement)
+        cursor.execute(statement, params)
         result = cursor.fetchall()
-        self.connection.commit()
+        self.commit()
         cursor.close()
+        TIMINGS.add_fetch_time(time.perf_counter() - start)
+
+        if is_read:
+            self.add_to_cache(key, result)
+        else:
+            self.mark_changed()
         return result
 
+    def commit(self):
+        """
+        Commits the statements run since the last commit, unless they are
+        part of a transaction() that hasn't finished.
+        """
+        if not self.in_transaction:
+            self.connection.commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs the statements in the block as one transaction. Everything is
+        committed at the end or rolled back if the block raises. Tables can't
+        be created inside it since MySQL commits when a table is created.
+        """
+        self.in_transaction = True
+        try:
+            yield
+        except BaseException:
+            self.connection.rollback()
+            raise
+        else:
+            self.connection.commit()
+        finally:
+            self.in_transaction = False
+            self.mark_changed()
+
+    def mark_changed(self):
+        """
+        Called after every write, or when the data was changed somewhere
+        else, so that cached results and page data are no longer used.
+        """
+        self.version += 1
+        self.cache.clear()
+        self.cache_size = 0
+
+    def get_cached(self, key):
+        """
+        Returns a copy of a cached result or None if the statement isn't
+        cached for the current version.
+        """
+        if key in self.cache:
+            version, result, size = self.cache[key]
+            if version == self.version:
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                return list(result)
+            del self.cache[key]
+            self.cache_size -= size
+        self.cache_misses += 1
+        return None
+
+    def add_to_cache(self, key, result):
+        """
+        Saves a result in the cache and drops the least recently used results
+        until the cache fits in its memory budget. Results too big for the
+        budget are not cached.
+        """
+        size = sys.getsizeof(result) + sys.getsizeof(key[0])
+        for row in result:
+            size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+        if size > CACHE_BYTES:
+            return
+        if key in self.cache:
+            self.cache_size -= self.cache.pop(key)[2]
+        self.cache[key] = (self.version, result, size)
+        self.cache_size += size
+        while self.cache_size > CACHE_BYTES:
+            _, (_, _, dropped_size) = self.cache.popitem(last=False)
+            self.cache_size -= dropped_size
+
     def get_column_names(self) -> list[str]:
         """
         Returns a list of the column names in the table.
@@ -68,6 +188,8 @@ class Database:
         values = f"('{"', '".join([str(value) for value in run_dict.values()])}')"
         insert_statement = f"""INSERT INTO {self.table} {columns} VALUES {values};"""
         self.execute_query(insert_statement)
+        self.rollups.refresh([run_dict.get('date')])
+        self.records.add_runs([run_dict])
 
     def update(self, run_dict, original_date):
         """
@@ -78,6 +200,8 @@ class Database:
         values = ', '.join(values_list)
         update_statement = f"UPDATE {self.table} SET {values} WHERE {condition};"
         self.execute_query(update_statement)
+        self.rollups.refresh([original_date, run_dict.get('date')])
+        self.records.update(run_dict, original_date)
 
     def delete(self, date):
         """
@@ -85,12 +209,86 @@ class Database:
         """
         delete_statement = f"DELETE FROM {self.table} WHERE date = '{date}';"
         self.execute_query(delete_statement)
+        self.rollups.refresh([date])
+        self.records.runs_changed([date])
+
+    def get_run_ids_by_start(self) -> dict:
+        """
+        Returns the run id of each run keyed by its start date and time.
+        """
+        statement = f"""SELECT run_id, date, start_time FROM {self.table}
+        WHERE start_time IS NOT NULL;"""
+        run_ids = {}
+        for run_id, date, start_time in self.execute_query(statement):
+            start = datetime.datetime.combine(date, datetime.time()) + start_time
+            run_ids[start] = run_id
+        return run_ids
 
     def create_database(self):
         self.execute_query(f'CREATE DATABASE {self.database};')
 
-    def create_table(self):
-        strings_list = [f"{column} {datatype}" for column, datatype in MYSQL_DATATYPES]
-        statement = f"CREATE TABLE {self.table} ({', '.join(strings_list)});"
-        self.execute_query(statement)
+    def create_table(self, partitioned=False):
+        """
+        Creates the runs table. A partitioned table is split by
+        PARTITION BY RANGE (YEAR(date)) into one partition per year so that
+        queries for a recent date range only read the newest partitions.
+        Runs older than the first year go in p_old and runs after the last
+        year in p_future until the maintenance adds their partitions.
+        """
+        datatypes = PARTITIONED_DATATYPES if partitioned else MYSQL_DATATYPES
+        strings_list = [f"{column} {datatype}" for column, datatype in datatypes]
+        if partitioned:
+            strings_list.append(PARTITIONED_PRIMARY_KEY)
+        strings_list += [f"INDEX {column}_index ({column})" for column in INDEXED_COLUMNS]
+        statement = f"CREATE TABLE {self.table} ({', '.join(strings_list)})"
+        if partitioned:
+            first_year = CURRENT_DATE.year - PARTITION_YEARS_BACK
+            last_year = CURRENT_DATE.year + PARTITION_YEARS_AHEAD
+            partitions = [f"PARTITION p_old VALUES LESS THAN ({first_year})"]
+            partitions += [f"PARTITION p{year} VALUES LESS THAN ({year + 1})"
+                           for year in range(first_year, last_year + 1)]
+            partitions.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+            statement += f" PARTITION BY RANGE (YEAR(date)) ({', '.join(partitions)})"
+        self.execute_query(f"{statement};")
 
+    def get_partitions(self) -> list[str]:
+        """
+        Returns the names of the table's partitions in order. The list is
+        empty if the table isn't partitioned.
+        """
+        statement = """SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s
+        AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION;"""
+        result = self.execute_query(statement, (self.database, self.table))
+        return [row[0] for row in result]
+
+    def add_future_partitions(self, years_ahead=PARTITION_YEARS_AHEAD):
+        """
+        Maintenance for partitioned tables. Splits p_future so that there is
+        a partition for every year up to years_ahead years from now. Does
+        nothing if the table isn't partitioned or the partitions already
+        exist.
+        """
+        partitions = self.get_partitions()
+        if 'p_future' not in partitions:
+            return
+        years = [int(name[1:]) for name in partitions if name[1:].isdigit()]
+        first_year = max(years) + 1 if years else CURRENT_DATE.year
+        last_year = CURRENT_DATE.year + years_ahead
+        if first_year > last_year:
+            return
+        new_partitions = [f"PARTITION p{year} VALUES LESS THAN ({year + 1})"
+                          for year in range(first_year, last_year + 1)]
+        new_partitions.append("PARTITION p_future VALUES LESS THAN MAXVALUE")
+        self.execute_query(f"""ALTER TABLE {self.table} REORGANIZE PARTITION p_future
+        INTO ({', '.join(new_partitions)});""")
+
+    def create_indexes(self):
+        """
+        Adds any missing indexes to a table that was created before the
+        indexes were part of create_table.
+        """
+        existing = {row[2] for row in self.execute_query(f"SHOW INDEX FROM {self.table};")}
+        for column in INDEXED_COLUMNS:
+            if f"{column}_index" not in existing:
+                self.execute_query(f"CREATE INDEX {column}_index ON {self.table} ({column});")
@@ -0,0 +1,131 @@
+"""
+This module calculates the Banister fitness and fatigue model over the whole
+run history. Each run's training impulse (TRIMP) comes from its duration and
+how hard it was, which is the average heart rate as a fraction of the heart
+rate reserve between RESTING_HR and the highest heart rate recorded. Fitness
+and fatigue are exponentially weighted sums of the daily TRIMP that fade with
+time constants of FITNESS_DAYS and FATIGUE_DAYS, and form is fitness minus
+fatigue. Runs without a heart rate add no TRIMP.
+
+Each weighted sum is the recurrence y[t] = y[t - 1] * decay + TRIMP[t], which
+is calculated with numpy as a scaled running total instead of a Python loop
+over the days. The results are cached the same way as the training metrics:
+until the database changes, and if the only change is new runs only the days
+from the earliest new run onward are calculated again. A new highest heart
+rate changes every run's TRIMP, so the model is calculated again from the
+start.
+"""
+
+import numpy
+from constants import *
+from training_metrics import TrainingMetrics
+
+# The time constants (days) of the weighted sums
+FITNESS_DAYS = 42
+FATIGUE_DAYS = 7
+TIME_CONSTANTS = {'fitness': FITNESS_DAYS, 'fatigue': FATIGUE_DAYS}
+
+# The heart rate taken as resting, since the runs don't record it
+RESTING_HR = 60
+
+# Banister's weighting of the heart rate reserve
+TRIMP_FACTOR = 0.64
+TRIMP_EXPONENT = 1.92
+
+# The scaled running total is restarted after this many time constants so
+# the scale, e ** (days / time constant), stays well within a float
+BLOCK_TIME_CONSTANTS = 500
+
+
+def get_trimp(duration, avg_hr, highest_hr) -> numpy.ndarray:
+    """
+    Returns the TRIMP of each run from arrays of its duration in minutes and
+    average heart rate. Missing values are NaN and give a TRIMP of 0.
+    """
+    with numpy.errstate(invalid='ignore'):
+        reserve = numpy.clip((avg_hr - RESTING_HR) / (highest_hr - RESTING_HR), 0, 1)
+        trimp = duration * reserve * TRIMP_FACTOR * numpy.exp(TRIMP_EXPONENT * reserve)
+    return numpy.nan_to_num(trimp)
+
+
+def exponential_sum(impulses, time_constant, previous=0.0) -> numpy.ndarray:
+    """
+    Returns y[t] = y[t - 1] * decay + impulses[t] for each day, where y is
+    previous the day before the first. Written out, y[t] is decay ** t times
+    the running total of impulses[s] / decay ** s, plus what is left of
+    previous.
+    """
+    decay = numpy.exp(-1 / time_constant)
+    block = max(int(BLOCK_TIME_CONSTANTS * time_constant), 1)
+    sums = numpy.empty(len(impulses))
+    for start in range(0, len(impulses), block):
+        chunk = impulses[start:start + block]
+        powers = decay ** numpy.arange(len(chunk))
+        sums[start:start + len(chunk)] = powers * (previous * decay
+                                                   + numpy.cumsum(chunk / powers))
+        previous = sums[start + len(chunk) - 1]
+    return sums
+
+
+class FitnessModel(TrainingMetrics):
+    columns = ['run_id', 'date', 'duration', 'avg_hr', 'max_hr']
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.highest_hr = None
+        self.impulses = numpy.zeros(0)  # The TRIMP of each day
+
+    def rebuild(self):
+        self.highest_hr = None
+        self.impulses = numpy.zeros(0)
+        super().rebuild()
+
+    def add_runs(self, runs):
+        """
+        Adds the TRIMP of the runs to their days and calculates the curves
+        again from the day of the earliest run added.
+        """
+        highest = max((float(run[4]) for run in runs if run[4] is not None),
+                      default=None)
+        if highest is not None and (self.highest_hr is None or highest > self.highest_hr):
+            if len(self.impulses):
+                self.rebuild()
+                return
+            self.highest_hr = highest
+
+        last_date = max(max(run[1] for run in runs), CURRENT_DATE)
+        number_of_days = (last_date - self.first_date).days + 1
+        first_changed = min(min((run[1] - self.first_date).days for run in runs),
+                            len(self.impulses))
+        days = numpy.array([(run[1] - self.first_date).days for run in runs])
+        duration = numpy.array([float(run[2]) if run[2] is not None else numpy.nan
+                                for run in runs])
+        heart_rate = numpy.array([float(run[3]) if run[3] is not None else numpy.nan
+                                  for run in runs])
+        trimp = (get_trimp(duration, heart_rate, self.highest_hr)
+                 if self.highest_hr is not None else numpy.zeros(len(runs)))
+
+        padding = numpy.zeros(max(number_of_days - len(self.impulses), 0))
+        self.impulses = numpy.concatenate([self.impulses, padding])
+        self.impulses += numpy.bincount(days, weights=trimp,
+                                        minlength=len(self.impulses))
+        self.last_run_id = max(self.last_run_id, max(run[0] for run in runs))
+        self.calculate(first_changed)
+
+    def calculate(self, start):
+        """
+        Calculates the curves from the start day onward, carrying on from
+        the fitness and fatigue of the day before, and keeps the curves
+        before it.
+        """
+        first = numpy.datetime64(self.first_date, 'D')
+        curves = {'dates': first + numpy.arange(start, len(self.impulses)),
+                  'trimp': self.impulses[start:]}
+        for name, time_constant in TIME_CONSTANTS.items():
+            previous = self.metrics[name][start - 1] if start > 0 else 0.0
+            curves[name] = exponential_sum(self.impulses[start:], time_constant,
+                                           previous)
+        curves['form'] = curves['fitness'] - curves['fatigue']
+        for name, values in curves.items():
+            kept = self.metrics.get(name, values[:0])[:start]
+            self.metrics[name] = numpy.concatenate([kept, values])
@@ -5,6 +5,7 @@ it runs through the processes in the SetUp folder. Otherwise, it prompts the
 returning user to log in via the login page.
 """
 
+import timing  # Imported first so the start-up timings begin here
 from constants import *
 from pathlib import Path
 from SetUp.configure_mysql import ConfigureMySQL
@@ -32,4 +33,5 @@ def main():
         mysql_configuration.initialize()
 
 
-main()
+if __name__ == '__main__':
+    main()
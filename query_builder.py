@@ -0,0 +1,171 @@
+"""
+This module builds the WHERE clause for the search page. A search is made of
+groups of conditions. The conditions in a group are combined with AND and the
+groups are combined with OR, so any combination of AND/OR can be searched in
+a single query. The values are converted to the column's datatype using the
+lists in the constants module and are sent to MySQL as parameters instead of
+being written into the statement. Each condition compares the bare column so
+MySQL is able to use an index on that column. It also builds the statements
+that summarize the runs by week, month or year.
+"""
+
+from constants import *
+
+# The operators shown on the search page and their MySQL equivalents
+OPERATORS = {'<': '<', '<=': '<=', '>': '>', '>=': '>=', '==': '=',
+             '!=': '!=', 'BETWEEN': 'BETWEEN'}
+
+
+def coerce_value(column: str, value):
+    """
+    Converts a value from the search page to the datatype of the column.
+    Raises a ValueError if the value can't be converted.
+    """
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            raise ValueError(f"Missing value for {column}")
+    if column in INTEGERS:
+        return int(float(value))
+    elif column in FLOATS or column in MINUTES:
+        return float(value)
+    elif column in DATES:
+        if isinstance(value, datetime.date):
+            return value
+        for date_format in ('%Y-%m-%d', '%m/%d/%y', '%m/%d/%Y'):
+            try:
+                return datetime.datetime.strptime(value, date_format).date()
+            except ValueError:
+                pass
+        raise ValueError(f"Invalid date: {value}")
+    elif column in TIMES:
+        if isinstance(value, datetime.time):
+            return value
+        for time_format in ('%H:%M:%S', '%H:%M', '%I:%M %p'):
+            try:
+                return datetime.datetime.strptime(value, time_format).time()
+            except ValueError:
+                pass
+        raise ValueError(f"Invalid time: {value}")
+    raise ValueError(f"Unknown column: {column}")
+
+
+class Condition:
+    def __init__(self, column, operator, value, second_value=None):
+        """
+        A single comparison of a column to a value. BETWEEN conditions use
+        the second value as the upper bound.
+        """
+        if column not in COLUMN_NAMES:
+            raise ValueError(f"Unknown column: {column}")
+        if operator not in OPERATORS:
+            raise ValueError(f"Unknown operator: {operator}")
+        self.column = column
+        self.operator = operator
+        self.values = [coerce_value(column, value)]
+        if operator == 'BETWEEN':
+            if second_value is None:
+                raise ValueError(f"BETWEEN needs two values for {column}")
+            self.values.append(coerce_value(column, second_value))
+            self.values.sort()
+
+    def compile(self) -> str:
+        if self.operator == 'BETWEEN':
+            return f"{self.column} BETWEEN %s AND %s"
+        return f"{self.column} {OPERATORS[self.operator]} %s"
+
+    def __str__(self):
+        if self.operator == 'BETWEEN':
+            return f"{self.column} BETWEEN {self.values[0]} AND {self.values[1]}"
+        return f"{self.column} {self.operator} {self.values[0]}"
+
+
+class SearchFilter:
+    def __init__(self):
+        """
+        Holds groups of conditions. New conditions are added to the last
+        group until a new group is started.
+        """
+        self.groups = [[]]
+
+    def add_condition(self, condition):
+        self.groups[-1].append(condition)
+
+    def new_group(self):
+        """
+        Starts a new group that will be combined with the others using OR.
+        An empty group is not started twice.
+        """
+        if self.groups[-1]:
+            self.groups.append([])
+
+    def clear(self):
+        self.groups = [[]]
+
+    def is_empty(self) -> bool:
+        return not any(self.groups)
+
+    def compile(self) -> tuple[str, list]:
+        """
+        Returns the WHERE clause with %s placeholders and the list of values
+        to send with it. Returns an empty clause if there are no conditions.
+        """
+        clauses = []
+        params = []
+        for group in self.groups:
+            if not group:
+                continue
+            clauses.append(f"({' AND '.join(c.compile() for c in group)})")
+            for condition in group:
+                params.extend(condition.values)
+        if not clauses:
+            return '', []
+        return f"WHERE {' OR '.join(clauses)}", params
+
+    def describe(self) -> list[str]:
+        """
+        Returns a line for each condition to display on the search page.
+        """
+        lines = []
+        for number, group in enumerate(g for g in self.groups if g):
+            if number:
+                lines.append('OR')
+            for position, condition in enumerate(group):
+                prefix = 'AND ' if position else ''
+                lines.append(f"{prefix}{condition}")
+        return lines
+
+
+###############################################################################
+# Period summaries
+###############################################################################
+
+# Expressions giving the first day of the week (Monday), month and year of a
+# run, so each period is labeled by a date the quick filter can match
+PERIOD_EXPRESSIONS = {
+    'Week': "DATE_SUB(date, INTERVAL WEEKDAY(date) DAY)",
+    'Month': "DATE_SUB(date, INTERVAL DAYOFMONTH(date) - 1 DAY)",
+    'Year': "MAKEDATE(YEAR(date), 1)",
+}
+
+# The columns of a period summary in the order they are selected
+PERIOD_COLUMNS = ['period', 'runs', 'distance', 'duration', 'pace', 'avg_hr',
+                  'longest']
+
+
+def period_statement(table, period, where='', direction='DESC', limit=''):
+    """
+    Returns a select statement that adds up the runs matching the where
+    clause for each week, month or year. MySQL does the adding up so only
+    one row per period is sent back. The pace is the total duration over the
+    total distance rather than an average of the paces.
+    """
+    if period not in PERIOD_EXPRESSIONS:
+        raise ValueError(f"Unknown period: {period}")
+    if direction not in ('ASC', 'DESC'):
+        raise ValueError(f"Unknown direction: {direction}")
+    return f"""SELECT {PERIOD_EXPRESSIONS[period]} AS period_start, COUNT(*),
+    SUM(distance), SUM(duration), SUM(duration) / SUM(distance),
+    ROUND(AVG(avg_hr)), MAX(distance)
+    FROM {table} {where}
+    GROUP BY period_start ORDER BY period_start {direction} {limit};"""
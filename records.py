@@ -0,0 +1,202 @@
+"""
+This module keeps the personal records table. It holds the quickest pace of
+any run, the best pace for runs in each distance bucket (a mile up to a 5K, a 5K up to a 10K and so on),
+the longest run by time and by distance and the highest VO2 max, each with
+the date of the run that set it. The home page reads the records from the
+table instead of scanning the runs.
+
+The records are kept up to date as runs change. A new or edited run is only
+compared with the current records. When a run holding a record is edited or
+deleted, only that record is found again from the runs, which MySQL can do
+with the date and distance indexes.
+"""
+
+from constants import *
+from query_builder import coerce_value
+
+# Miles in each race distance, rounded down to the two decimals the
+# distance column stores so a race logged at its distance is in its bucket
+MILE = 1.0
+FIVE_K = 3.10
+TEN_K = 6.21
+HALF_MARATHON = 13.10
+MARATHON = 26.20
+
+# Each record's column, whether the lowest or highest value is best and the
+# distance range (miles) of the runs it applies to
+RECORDS = {
+    'pace_any': ('pace', 'MIN', None, None),
+    'pace_mile': ('pace', 'MIN', MILE, FIVE_K),
+    'pace_5k': ('pace', 'MIN', FIVE_K, TEN_K),
+    'pace_10k': ('pace', 'MIN', TEN_K, HALF_MARATHON),
+    'pace_half': ('pace', 'MIN', HALF_MARATHON, MARATHON),
+    'pace_full': ('pace', 'MIN', MARATHON, None),
+    'longest_duration': ('duration', 'MAX', None, None),
+    'longest_distance': ('distance', 'MAX', None, None),
+    'vo2_max': ('vo2_max', 'MAX', None, None),
+}
+
+RECORD_NAMES = {'pace_any': 'Quickest Pace', 'pace_mile': 'Fastest Pace (1 Mile+)', 'pace_5k': 'Fastest Pace (5K+)',
+                'pace_10k': 'Fastest Pace (10K+)',
+                'pace_half': 'Fastest Pace (Half Marathon+)',
+                'pace_full': 'Fastest Pace (Marathon+)',
+                'longest_duration': 'Longest Run (Time)',
+                'longest_distance': 'Longest Run (Distance)',
+                'vo2_max': 'Highest VO2 Max'}
+
+
+def get_number(run, column):
+    """
+    Returns the run's value for the column as a float, or None if it is
+    missing.
+    """
+    value = run.get(column)
+    if value is None or value == 'NULL':
+        return None
+    try:
+        return coerce_value(column, value)
+    except ValueError:
+        return None
+
+
+def applies(record, run) -> bool:
+    """
+    Returns whether the run counts toward the record. Races logged at the
+    stored distance count toward their own bucket:
+
+    >>> applies('pace_5k', {'distance': '3.10', 'pace': '7.5'})
+    True
+    >>> applies('pace_mile', {'distance': '3.10', 'pace': '7.5'})
+    False
+    >>> applies('pace_10k', {'distance': 6.21, 'pace': 8.0})
+    True
+    >>> applies('pace_half', {'distance': 13.10, 'pace': 8.0})
+    True
+    >>> applies('pace_full', {'distance': 26.20, 'pace': 9.0})
+    True
+    >>> applies('pace_half', {'distance': 26.20, 'pace': 9.0})
+    False
+    """
+    column, _, low, high = RECORDS[record]
+    if get_number(run, column) is None:
+        return False
+    if low is None:
+        return True
+    distance = get_number(run, 'distance')
+    return (distance is not None and distance >= low
+            and (high is None or distance < high))
+
+
+def is_better(record, value, current) -> bool:
+    if current is None:
+        return True
+    if RECORDS[record][1] == 'MIN':
+        return value < current
+    return value > current
+
+
+class Records:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def get_table(self) -> str:
+        return f"{self.connection.table}_records"
+
+    def create_table(self) -> bool:
+        """
+        Creates the records table and fills it if it is missing. Returns
+        True if it was created. If it exists, any records added since it was
+        filled are found.
+        """
+        existing = {row[0] for row in self.connection.execute_query('SHOW TABLES;')}
+        if self.get_table() in existing:
+            missing = [record for record in RECORDS if record not in self.get_records()]
+            if missing:
+                self.refresh(missing)
+            return False
+        self.connection.execute_query(f"""CREATE TABLE {self.get_table()} (
+        record VARCHAR(20) PRIMARY KEY, date DATE, value DOUBLE);""")
+        self.refresh()
+        return True
+
+    def best_statement(self, record) -> tuple[str, list]:
+        """
+        Returns the statement and params that find the record's best run.
+        """
+        column, best, low, high = RECORDS[record]
+        where = f"{column} IS NOT NULL"
+        params = []
+        if low is not None:
+            where += " AND distance >= %s"
+            params.append(low)
+        if high is not None:
+            where += " AND distance < %s"
+            params.append(high)
+        order = 'ASC' if best == 'MIN' else 'DESC'
+        statement = f"""SELECT date, {column} FROM {self.connection.table}
+        WHERE {where} ORDER BY {column} {order}, date LIMIT 1;"""
+        return statement, params
+
+    def save(self, record, date, value):
+        self.connection.execute_query(
+            f"REPLACE INTO {self.get_table()} (record, date, value) VALUES (%s, %s, %s);",
+            (record, date, value))
+
+    def refresh(self, records=None):
+        """
+        Finds the records again from the runs, or all of them if no records
+        are given. A record with no runs is removed.
+        """
+        for record in records if records is not None else RECORDS:
+            statement, params = self.best_statement(record)
+            best = self.connection.execute_query(statement, params)
+            if best:
+                self.save(record, best[0][0], float(best[0][1]))
+            else:
+                self.connection.execute_query(
+                    f"DELETE FROM {self.get_table()} WHERE record = %s;", (record,))
+
+    def get_records(self) -> dict:
+        """
+        Returns the (date, value) of each record that has been set.
+        """
+        rows = self.connection.execute_query(
+            f"SELECT record, date, value FROM {self.get_table()};")
+        return {record: (date, value) for record, date, value in rows}
+
+    def add_runs(self, runs):
+        """
+        Compares new runs, dictionaries of column names to values, with the
+        current records and saves the records they beat.
+        """
+        current = self.get_records()
+        for record in RECORDS:
+            column = RECORDS[record][0]
+            best = current.get(record, (None, None))
+            new_best = None
+            for run in runs:
+                if applies(record, run):
+                    value = get_number(run, column)
+                    if is_better(record, value, best[1]):
+                        best = (run['date'], value)
+                        new_best = best
+            if new_best:
+                self.save(record, *new_best)
+
+    def runs_changed(self, dates):
+        """
+        Finds the records held by runs on the dates again after those runs
+        were edited or deleted.
+        """
+        dates = {coerce_value('date', date) for date in dates if date}
+        held = [record for record, (date, _) in self.get_records().items()
+                if date in dates]
+        if held:
+            self.refresh(held)
+
+    def update(self, run, original_date):
+        """
+        Updates the records after the run on the original date was edited.
+        """
+        self.runs_changed([original_date])
+        self.add_runs([run])
@@ -0,0 +1,148 @@
+"""
+This module keeps the weekly and monthly rollup tables. Each row holds the
+number of runs in a week or month and the sum and count of every number
+column, so the visuals page can plot weekly or monthly averages by reading
+one row per period instead of adding up the runs on every draw. The rollups
+are calculated by MySQL and only the periods containing a changed run are
+calculated again when a run is added, edited or deleted.
+"""
+
+from constants import *
+from query_builder import PERIOD_EXPRESSIONS, coerce_value
+
+# The rollup tables are named after the runs table with these suffixes
+ROLLUP_SUFFIXES = {'Week': 'weekly', 'Month': 'monthly'}
+
+# The columns that are added up in the rollups
+ROLLUP_COLUMNS = [column for column in COLUMN_NAMES
+                  if column not in DATES and column not in TIMES]
+
+# If more periods than this changed, such as after an import, the whole
+# rollup table is calculated again instead
+MAX_CHANGED_PERIODS = 50
+
+
+def period_start(date, period) -> datetime.date:
+    """
+    Returns the first day of the week (Monday) or month containing the date,
+    matching PERIOD_EXPRESSIONS.
+    """
+    if period == 'Week':
+        return date - datetime.timedelta(days=date.weekday())
+    return date.replace(day=1)
+
+
+def period_end(start, period) -> datetime.date:
+    """
+    Returns the first day of the next week or month.
+    """
+    if period == 'Week':
+        return start + datetime.timedelta(days=7)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+class Rollups:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def get_table(self, period) -> str:
+        if period not in ROLLUP_SUFFIXES:
+            raise ValueError(f"Unknown period: {period}")
+        return f"{self.connection.table}_{ROLLUP_SUFFIXES[period]}"
+
+    def create_tables(self) -> bool:
+        """
+        Creates any missing rollup tables and fills them. Returns True if a
+        table was created.
+        """
+        existing = {row[0] for row in self.connection.execute_query('SHOW TABLES;')}
+        created = False
+        for period in ROLLUP_SUFFIXES:
+            table = self.get_table(period)
+            if table in existing:
+                continue
+            columns = ', '.join(f"{column}_sum DOUBLE, {column}_count INT UNSIGNED"
+                                for column in ROLLUP_COLUMNS)
+            self.connection.execute_query(f"""CREATE TABLE {table} (
+            period_start DATE PRIMARY KEY, runs INT UNSIGNED, {columns});""")
+            self.refresh_period(period)
+            created = True
+        return created
+
+    def select_statement(self, period) -> str:
+        """
+        Returns the part of the statement that adds up the runs for each
+        period.
+        """
+        sums = ', '.join(f"SUM({column}), COUNT({column})"
+                         for column in ROLLUP_COLUMNS)
+        return f"""SELECT {PERIOD_EXPRESSIONS[period]} AS period_start, COUNT(*),
+        {sums} FROM {self.connection.table}"""
+
+    def insert_statement(self, period) -> str:
+        columns = ', '.join(f"{column}_sum, {column}_count"
+                            for column in ROLLUP_COLUMNS)
+        return f"INSERT INTO {self.get_table(period)} (period_start, runs, {columns})"
+
+    def refresh_period(self, period, starts=None):
+        """
+        Calculates the rollup rows for the periods beginning on the start
+        dates again, or the whole table if no start dates are given.
+        """
+        table = self.get_table(period)
+        if starts is None:
+            self.connection.execute_query(f"DELETE FROM {table};")
+            self.connection.execute_query(f"""{self.insert_statement(period)}
+            {self.select_statement(period)} GROUP BY period_start;""")
+            return
+
+        starts = sorted(starts)
+        placeholders = ', '.join(['%s'] * len(starts))
+        self.connection.execute_query(
+            f"DELETE FROM {table} WHERE period_start IN ({placeholders});", starts)
+        ranges = ' OR '.join(['(date >= %s AND date < %s)'] * len(starts))
+        params = []
+        for start in starts:
+            params += [start, period_end(start, period)]
+        self.connection.execute_query(f"""{self.insert_statement(period)}
+        {self.select_statement(period)} WHERE {ranges} GROUP BY period_start;""",
+                                      params)
+
+    def refresh(self, dates=None):
+        """
+        Updates the rollups after runs on the dates were added, edited or
+        deleted. Everything is calculated again if no dates are given.
+        """
+        if dates is None:
+            for period in ROLLUP_SUFFIXES:
+                self.refresh_period(period)
+            return
+        dates = [coerce_value('date', date) for date in dates if date]
+        dates = {date.date() if isinstance(date, datetime.datetime) else date
+                 for date in dates}
+        if not dates:
+            return
+        for period in ROLLUP_SUFFIXES:
+            starts = {period_start(date, period) for date in dates}
+            if len(starts) > MAX_CHANGED_PERIODS:
+                starts = None
+            self.refresh_period(period, starts)
+
+    def get_averages(self, period, column, start_date=None) -> list[tuple]:
+        """
+        Returns the start date of each period and the average of the column
+        for the runs in it, oldest first. Periods with no values for the
+        column are left out.
+        """
+        if column not in ROLLUP_COLUMNS:
+            raise ValueError(f"Column can't be rolled up: {column}")
+        where = f"WHERE {column}_count > 0"
+        params = None
+        if start_date is not None:
+            where += " AND period_start >= %s"
+            params = (period_start(start_date, period),)
+        statement = f"""SELECT period_start, {column}_sum / {column}_count
+        FROM {self.get_table(period)} {where} ORDER BY period_start;"""
+        return self.connection.execute_query(statement, params)
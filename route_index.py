@@ -0,0 +1,166 @@
+"""
+This module indexes the run routes by the grid cells they pass through so
+that finding the runs in an area, or the runs that follow the same course,
+only looks at the runs sharing cells instead of every stored route. The world
+is split into cells of CELL_DEGREES on a side and each route's cells are
+stored with its run id when the route is ingested. A cell id counts along
+each row of cells from the south west, so the cells of one row of a bounding
+box are a single range of ids.
+
+The similarity of two routes is the Jaccard index of their cells: the cells
+they share over all the cells either of them passes through. It is only
+calculated for the candidate runs that share at least one cell.
+"""
+
+import math
+import numpy
+
+# About 550 meters north to south
+CELL_DEGREES = 0.005
+CELL_COLUMNS = round(360 / CELL_DEGREES)
+
+# Routes at least this similar are treated as the same course
+SAME_COURSE_SIMILARITY = 0.6
+
+METERS_PER_DEGREE = 111320
+METERS_PER_MILE = 1609.344
+
+
+def cell_row_column(latitudes, longitudes):
+    rows = numpy.floor((numpy.asarray(latitudes) + 90) / CELL_DEGREES).astype(numpy.int64)
+    columns = numpy.floor((numpy.asarray(longitudes) + 180) / CELL_DEGREES).astype(numpy.int64)
+    return rows, numpy.clip(columns, 0, CELL_COLUMNS - 1)
+
+
+def cell_ids(latitudes, longitudes) -> numpy.ndarray:
+    """
+    Returns the sorted ids of the cells the points fall in.
+    """
+    rows, columns = cell_row_column(latitudes, longitudes)
+    return numpy.unique(rows * CELL_COLUMNS + columns)
+
+
+def decode_polyline(polyline):
+    """
+    Returns the latitude and longitude arrays of a Google encoded polyline.
+    Each character holds 5 bits of a value and the values end at the
+    characters without the 0x20 bit.
+    """
+    if not polyline:
+        return numpy.array([]), numpy.array([])
+    codes = numpy.frombuffer(polyline.encode('ascii'), dtype=numpy.uint8)
+    codes = codes.astype(numpy.int64) - 63
+    ends = (codes & 0x20) == 0
+    starts = numpy.flatnonzero(numpy.r_[True, ends[:-1]])
+    value_number = numpy.cumsum(numpy.r_[0, ends[:-1].astype(numpy.int64)])
+    position = numpy.arange(len(codes)) - starts[value_number]
+    values = numpy.add.reduceat((codes & 31) << (5 * position), starts)
+    deltas = numpy.where(values & 1, ~(values >> 1), values >> 1)
+    points = numpy.cumsum(deltas.reshape(-1, 2), axis=0) / 1e5
+    return points[:, 0], points[:, 1]
+
+
+class RouteIndex:
+    def __init__(self, connection):
+        self.connection = connection
+        self.table = f"{connection.table}_route_cells"
+        self.routes_table = f"{connection.table}_routes"
+
+    def create_table(self):
+        self.connection.execute_query(f"""CREATE TABLE IF NOT EXISTS {self.table} (
+        cell_id BIGINT UNSIGNED NOT NULL, run_id INT UNSIGNED NOT NULL,
+        PRIMARY KEY (cell_id, run_id), INDEX run_id_index (run_id));""")
+
+    def insert_statement(self) -> str:
+        return f"INSERT IGNORE INTO {self.table} (cell_id, run_id) VALUES (%s, %s)"
+
+    def add_missing_routes(self):
+        """
+        Indexes the stored routes that have no cells, such as routes that
+        were stored before the index existed.
+        """
+        statement = f"""SELECT r.run_id, r.polyline FROM {self.routes_table} r
+        LEFT JOIN {self.table} c ON c.run_id = r.run_id WHERE c.run_id IS NULL;"""
+        rows = []
+        for run_id, polyline in self.connection.execute_query(statement):
+            latitudes, longitudes = decode_polyline(polyline)
+            rows += [(int(cell), run_id) for cell in cell_ids(latitudes, longitudes)]
+        if rows:
+            cursor = self.connection.connection.cursor()
+            cursor.executemany(self.insert_statement(), rows)
+            self.connection.commit()
+            cursor.close()
+            self.connection.mark_changed()
+
+    def runs_in_box(self, south, west, north, east) -> list[int]:
+        """
+        Returns the ids of the runs that pass through a cell overlapping the
+        bounding box. Each row of cells is one range of cell ids.
+        """
+        rows, columns = cell_row_column([south, north], [west, east])
+        ranges = []
+        params = []
+        for row in range(int(rows[0]), int(rows[1]) + 1):
+            ranges.append('cell_id BETWEEN %s AND %s')
+            params += [row * CELL_COLUMNS + int(columns[0]),
+                       row * CELL_COLUMNS + int(columns[1])]
+        statement = f"""SELECT DISTINCT run_id FROM {self.table}
+        WHERE {' OR '.join(ranges)} ORDER BY run_id;"""
+        return [row[0] for row in self.connection.execute_query(statement, params)]
+
+    def runs_near(self, latitude, longitude, miles=0.25) -> list[int]:
+        """
+        Returns the ids of the runs that pass within about the distance of
+        a point.
+        """
+        degrees = miles * METERS_PER_MILE / METERS_PER_DEGREE
+        # Degrees of longitude get shorter away from the equator
+        longitude_degrees = degrees / max(math.cos(math.radians(latitude)), 0.01)
+        return self.runs_in_box(latitude - degrees, longitude - longitude_degrees,
+                                latitude + degrees, longitude + longitude_degrees)
+
+    def similar_runs(self, run_id, threshold=SAME_COURSE_SIMILARITY) -> list[tuple]:
+        """
+        Returns (run id, similarity) for the runs whose routes are at least
+        as similar as the threshold to the run's route, most similar first.
+        MySQL counts the shared cells of only the runs sharing a cell with
+        the run, and then the total cells of only those runs.
+        """
+        shared = self.connection.execute_query(f"""SELECT other.run_id, COUNT(*)
+        FROM {self.table} mine JOIN {self.table} other ON other.cell_id = mine.cell_id
+        WHERE mine.run_id = %s AND other.run_id != %s GROUP BY other.run_id;""",
+                                               (run_id, run_id))
+        if not shared:
+            return []
+        candidates = [row[0] for row in shared]
+        placeholders = ', '.join(['%s'] * (len(candidates) + 1))
+        totals = dict(self.connection.execute_query(f"""SELECT run_id, COUNT(*)
+        FROM {self.table} WHERE run_id IN ({placeholders}) GROUP BY run_id;""",
+                                                    [run_id] + candidates))
+        similar = []
+        for other, count in shared:
+            similarity = count / (totals[run_id] + totals[other] - count)
+            if similarity >= threshold:
+                similar.append((other, round(similarity, 3)))
+        return sorted(similar, key=lambda pair: pair[1], reverse=True)
+
+    def group_courses(self, threshold=SAME_COURSE_SIMILARITY) -> list[list[int]]:
+        """
+        Groups the runs that follow the same course. Each run is compared
+        only with the candidates that share its cells, and joins the group
+        of the first run it is similar to. Returns the groups with more than
+        one run, largest first.
+        """
+        run_ids = [row[0] for row in self.connection.execute_query(
+            f"SELECT DISTINCT run_id FROM {self.table} ORDER BY run_id;")]
+        grouped = set()
+        groups = []
+        for run_id in run_ids:
+            if run_id in grouped:
+                continue
+            group = [run_id] + [other for other, _ in self.similar_runs(run_id, threshold)
+                                if other not in grouped]
+            grouped.update(group)
+            if len(group) > 1:
+                groups.append(sorted(group))
+        return sorted(groups, key=len, reverse=True)
@@ -0,0 +1,132 @@
+"""
+This module saves runs to disk as a NumPy structured array in a .npy file
+instead of a CSV. Every column is stored with its own type, the dates and
+start times as datetime64 and timedelta64, so nothing has to be parsed when
+the file is read back. A missing value is marked in the record's nulls field
+rather than written as the string 'NULL'. The file is opened with
+numpy.load(mmap_mode='r'), which maps it into memory without reading or
+copying it, so loading takes about the same time whatever its size.
+
+The cleaned export is saved in this format for loading into the database,
+and the runs table is saved as a snapshot that the GUI shows before its
+first query has returned.
+"""
+
+import numpy
+import os
+from pathlib import Path
+from constants import *
+
+CACHE_COLUMNS = COLUMN_NAMES
+
+# The smallest type that holds each column of the MySQL table
+RUN_DTYPE = numpy.dtype([('date', 'datetime64[D]'), ('start_time', 'timedelta64[s]'),
+                         ('distance', 'f4'), ('duration', 'f4'), ('pace', 'f4'),
+                         ('calories', 'u2'), ('vo2_max', 'f4'), ('avg_hr', 'u1'),
+                         ('max_hr', 'u1'), ('min_hr', 'u1'), ('elevation', 'u2'),
+                         ('temperature', 'u1'), ('humidity', 'u1'),
+                         ('nulls', '?', (len(CACHE_COLUMNS),))])
+
+SNAPSHOT_FILE = 'runs_snapshot.npy'
+
+
+def cache_path(cleaned_data) -> Path:
+    """
+    Returns the path of the cleaned data cache. Older configuration files
+    point to cleaned_data.csv, which is swapped for the .npy file.
+    """
+    return Path(cleaned_data).with_suffix('.npy')
+
+
+def snapshot_path(config_path) -> Path | None:
+    """
+    Returns the path of the runs table snapshot in the CleaningData
+    directory, or None if the directories have not been configured.
+    """
+    config = read_config_file(config_path)
+    directory = config.get('directory_info', 'cleaning_data_directory', fallback='0')
+    if directory == '0':
+        return None
+    return Path(directory, SNAPSHOT_FILE)
+
+
+def seconds_of_day(value) -> int:
+    """
+    Returns the seconds since midnight of a start time, which MySQL returns
+    as a timedelta and the cleaning gives as a time.
+    """
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds())
+    hours, minutes, seconds = str(value).split(':')
+    return int(hours) * 3600 + int(minutes) * 60 + int(float(seconds))
+
+
+def rows_to_records(rows) -> numpy.ndarray:
+    """
+    Converts rows of values in the order of CACHE_COLUMNS to a structured
+    array. None and 'NULL' are marked in the nulls field.
+    """
+    rows = list(rows)
+    records = numpy.zeros(len(rows), dtype=RUN_DTYPE)
+    if not rows:
+        return records
+    columns = numpy.empty((len(rows), len(CACHE_COLUMNS)), dtype=object)
+    columns[:] = [tuple(row) for row in rows]
+    for position, name in enumerate(CACHE_COLUMNS):
+        values = columns[:, position]
+        nulls = numpy.array([value is None or value == 'NULL' for value in values])
+        records['nulls'][:, position] = nulls
+        present = values[~nulls]
+        if name == 'date':
+            present = numpy.array([str(value)[:10] for value in present],
+                                  dtype='datetime64[D]')
+        elif name == 'start_time':
+            present = numpy.array([seconds_of_day(value) for value in present],
+                                  dtype='timedelta64[s]')
+        else:
+            present = numpy.array(present, dtype=float)
+            if RUN_DTYPE[name].kind == 'u':
+                present = present.round()
+        records[name][~nulls] = present
+    return records
+
+
+def records_to_rows(records) -> list[tuple]:
+    """
+    Converts a structured array back to rows of Python values, with the
+    dates as dates, the start times as timedeltas like MySQL returns them
+    and None for the missing values.
+    """
+    columns = []
+    for position, name in enumerate(CACHE_COLUMNS):
+        values = records[name]
+        if values.dtype.kind == 'f':
+            # Decimal(4, 2) values stored as float32 are rounded back
+            values = values.astype(float).round(2)
+        values = values.astype(object)
+        values[records['nulls'][:, position]] = None
+        columns.append(values)
+    return list(zip(*columns))
+
+
+def save_runs(path, records):
+    """
+    Writes the records to a temporary file that then replaces the old file,
+    so a file being read is never half written.
+    """
+    path = Path(path)
+    temporary = path.with_name(f"{path.stem}.tmp")
+    with open(temporary, 'wb') as file:
+        numpy.save(file, records, allow_pickle=False)
+    os.replace(temporary, path)
+
+
+def load_runs(path) -> numpy.ndarray:
+    """
+    Maps the saved records into memory. An empty file can't be mapped so it
+    is read normally.
+    """
+    try:
+        return numpy.load(path, mmap_mode='r', allow_pickle=False)
+    except ValueError:
+        return numpy.load(path, allow_pickle=False)
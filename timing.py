@@ -0,0 +1,105 @@
+"""
+This module records how long the app takes to start up and to change pages.
+Each timing is split into the time spent waiting on MySQL (fetch) and the
+time spent everywhere else, which is mostly building tkinter widgets (build).
+The most recent timings are kept in memory for the debug menu on the main
+window and every timing is also written to a rolling log file in the program
+directory.
+"""
+
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+# Recorded when the module is first imported, which is the start of main.py
+PROCESS_START = time.perf_counter()
+
+LOG_FILE = Path.joinpath(Path.cwd(), 'timings.log')
+MAX_LOG_BYTES = 256 * 1024
+LOG_BACKUPS = 2
+
+# How many timings are kept in memory for the debug window
+MAX_RECORDS = 200
+
+
+class Timings:
+    def __init__(self):
+        self.marks = {'start': PROCESS_START}
+        self.records = deque(maxlen=MAX_RECORDS)
+        self.open_measurements = []  # Fetch totals of the running measurements
+        self.logger = None
+
+    def get_logger(self):
+        """
+        Sets up the rolling log file the first time something is recorded.
+        """
+        if self.logger is None:
+            self.logger = logging.getLogger('run_app.timings')
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+            handler = RotatingFileHandler(LOG_FILE, maxBytes=MAX_LOG_BYTES,
+                                          backupCount=LOG_BACKUPS)
+            handler.setFormatter(logging.Formatter('%(asctime)s\t%(message)s'))
+            self.logger.addHandler(handler)
+        return self.logger
+
+    def record(self, name, total, fetch=0.0):
+        """
+        Saves a timing in seconds to memory and to the log file.
+        """
+        build = max(total - fetch, 0.0)
+        self.records.append({'name': name, 'total': total, 'fetch': fetch,
+                             'build': build, 'time': time.strftime('%H:%M:%S')})
+        try:
+            self.get_logger().info(f"{name}\ttotal={total * 1000:.1f}ms\t"
+                                   f"fetch={fetch * 1000:.1f}ms\t"
+                                   f"build={build * 1000:.1f}ms")
+        except OSError:
+            pass  # The timings are still available in the debug window
+
+    def mark(self, name):
+        """
+        Saves the current time under a name so that a later timing can be
+        measured from it with since().
+        """
+        self.marks[name] = time.perf_counter()
+
+    def since(self, mark, name):
+        """
+        Records the time from a mark until now. Does nothing if the mark was
+        never set.
+        """
+        if mark in self.marks:
+            self.record(name, time.perf_counter() - self.marks.pop(mark))
+
+    @contextmanager
+    def measure(self, name):
+        """
+        Records how long the code inside the with block takes. Any database
+        time reported with add_fetch_time while it runs is recorded as fetch
+        time.
+        """
+        fetch = [0.0]
+        self.open_measurements.append(fetch)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            total = time.perf_counter() - start
+            self.open_measurements.remove(fetch)
+            self.record(name, total, fetch[0])
+
+    def add_fetch_time(self, seconds):
+        """
+        Called by the database after each query so the time is counted as
+        fetch time in every measurement that is running.
+        """
+        for fetch in self.open_measurements:
+            fetch[0] += seconds
+
+
+# Shared by the whole app
+TIMINGS = Timings()
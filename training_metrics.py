@@ -0,0 +1,193 @@
+"""
+This module calculates rolling training metrics over the whole run history:
+the 7 and 28 day mileage, the acute:chronic workload ratio (the 7 day mileage
+over the weekly average of the 28 day mileage) and the 7 day average pace and
+heart rate.
+
+The runs are added into one bin per day with numpy.bincount and every rolling
+sum is the difference of two points on a running total, so the whole history
+is calculated in one pass without any Python loops over the days. The results
+are cached until the database changes. If the only change is new runs, they
+are added to the bins and only the days from the earliest new run onward are
+calculated again.
+"""
+
+import numpy
+from constants import *
+
+# The rolling windows in days
+ACUTE_DAYS = 7
+CHRONIC_DAYS = 28
+
+# The values added into the daily bins. Pace is only taken from runs that
+# have both a distance and a duration.
+BINS = ['distance', 'paced_distance', 'paced_duration', 'hr_sum', 'hr_count']
+
+
+class TrainingMetrics:
+    # The columns read for each run and checksummed to find changed runs
+    columns = ['run_id', 'date', 'distance', 'duration', 'avg_hr']
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.version = None  # Database version the metrics were made from
+        self.first_date = None
+        self.last_run_id = 0
+        self.run_count = 0
+        self.checksum = 0
+        self.totals = {}  # Running total of each bin
+        self.metrics = {}
+
+    def checksum_statement(self) -> str:
+        """
+        Returns a statement that counts and checksums the runs up to a run
+        id, and all the runs. If the runs up to the last run id cached are
+        unchanged the cache only needs the newer runs added to it.
+        """
+        row = f"CRC32(CONCAT_WS(',', {', '.join(self.columns)}))"
+        return f"""SELECT SUM(run_id <= %s), SUM(IF(run_id <= %s, {row}, 0)),
+        COUNT(*), SUM({row}) FROM {self.connection.table};"""
+
+    def get_metrics(self) -> dict:
+        """
+        Returns the metrics, updating them first if the database has changed.
+        Each metric is a numpy array with one value per day in 'dates'.
+        """
+        if self.version != self.connection.version:
+            self.update()
+        return self.metrics
+
+    def current(self) -> dict:
+        """
+        Returns the value of each metric for today.
+        """
+        metrics = self.get_metrics()
+        if not metrics:
+            return {}
+        return {name: values[-1] for name, values in metrics.items()}
+
+    def update(self):
+        """
+        Adds only the new runs if none of the cached runs have changed,
+        otherwise calculates everything again.
+        """
+        self.version = self.connection.version
+        old_count, old_checksum, count, checksum = self.connection.execute_query(
+            self.checksum_statement(), (self.last_run_id, self.last_run_id))[0]
+        old_count, old_checksum = int(old_count or 0), int(old_checksum or 0)
+        count, checksum = int(count or 0), int(checksum or 0)
+
+        unchanged = (self.first_date is not None
+                     and old_count == self.run_count
+                     and old_checksum == self.checksum)
+        if unchanged and count == self.run_count:
+            return
+        if unchanged:
+            runs = self.get_runs(self.last_run_id)
+            if min(run[1] for run in runs) >= self.first_date:
+                self.add_runs(runs)
+                self.run_count, self.checksum = count, checksum
+                return
+        self.rebuild()
+        self.run_count, self.checksum = count, checksum
+
+    def get_runs(self, after_run_id=0) -> list[tuple]:
+        statement = f"""SELECT {', '.join(self.columns)}
+        FROM {self.connection.table} WHERE run_id > %s;"""
+        return self.connection.execute_query(statement, (after_run_id,))
+
+    def rebuild(self):
+        """
+        Calculates the metrics for the whole history.
+        """
+        self.first_date = None
+        self.last_run_id = 0
+        self.totals = {}
+        self.metrics = {}
+        runs = self.get_runs()
+        if runs:
+            self.first_date = min(run[1] for run in runs)
+            self.add_runs(runs)
+
+    def bin_runs(self, runs, number_of_days) -> dict:
+        """
+        Adds the runs into daily bins with one bincount per value.
+        """
+        days = numpy.array([(run[1] - self.first_date).days for run in runs])
+        distance = numpy.array([float(run[2]) if run[2] is not None else 0.0
+                                for run in runs])
+        duration = numpy.array([float(run[3]) if run[3] is not None else 0.0
+                                for run in runs])
+        heart_rate = numpy.array([float(run[4]) if run[4] is not None else 0.0
+                                  for run in runs])
+        paced = (distance > 0) & (duration > 0)
+        weights = {'distance': distance,
+                   'paced_distance': numpy.where(paced, distance, 0.0),
+                   'paced_duration': numpy.where(paced, duration, 0.0),
+                   'hr_sum': heart_rate,
+                   'hr_count': (heart_rate > 0).astype(float)}
+        return {name: numpy.bincount(days, weights=weights[name],
+                                     minlength=number_of_days)
+                for name in BINS}
+
+    def add_runs(self, runs):
+        """
+        Adds runs to the running totals and calculates the metrics again
+        from the day of the earliest run added.
+        """
+        last_date = max(max(run[1] for run in runs), CURRENT_DATE)
+        number_of_days = (last_date - self.first_date).days + 1
+        first_changed = min((run[1] - self.first_date).days for run in runs)
+        daily = self.bin_runs(runs, number_of_days)
+
+        for name in BINS:
+            totals = self.totals.get(name, numpy.zeros(0))
+            # Carry the last total forward over any new days
+            if len(totals) < number_of_days:
+                last_total = totals[-1] if len(totals) else 0.0
+                padding = numpy.full(number_of_days - len(totals), last_total)
+                totals = numpy.concatenate([totals, padding])
+            totals[first_changed:] += numpy.cumsum(daily[name][first_changed:])
+            self.totals[name] = totals
+
+        self.last_run_id = max(self.last_run_id, max(run[0] for run in runs))
+        self.calculate(first_changed)
+
+    def rolling_sum(self, name, days, start) -> numpy.ndarray:
+        """
+        Returns the sum of a bin over the past number of days for each day
+        from start onward.
+        """
+        totals = self.totals[name]
+        shifted = numpy.concatenate([numpy.zeros(days), totals])[start:len(totals)]
+        return totals[start:] - shifted
+
+    def calculate(self, start):
+        """
+        Calculates the metrics from the start day onward and keeps the
+        metrics before it.
+        """
+        number_of_days = len(self.totals['distance'])
+        first = numpy.datetime64(self.first_date, 'D')
+        acute = self.rolling_sum('distance', ACUTE_DAYS, start)
+        chronic = self.rolling_sum('distance', CHRONIC_DAYS, start)
+        paced_distance = self.rolling_sum('paced_distance', ACUTE_DAYS, start)
+        paced_duration = self.rolling_sum('paced_duration', ACUTE_DAYS, start)
+        hr_sum = self.rolling_sum('hr_sum', ACUTE_DAYS, start)
+        hr_count = self.rolling_sum('hr_count', ACUTE_DAYS, start)
+
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            new_metrics = {
+                'dates': first + numpy.arange(start, number_of_days),
+                'mileage_7': acute,
+                'mileage_28': chronic,
+                'workload_ratio': numpy.where(chronic > 0,
+                                              acute / (chronic / (CHRONIC_DAYS / ACUTE_DAYS)),
+                                              numpy.nan),
+                'pace_7': numpy.where(paced_distance > 0,
+                                      paced_duration / paced_distance, numpy.nan),
+                'avg_hr_7': numpy.where(hr_count > 0, hr_sum / hr_count, numpy.nan),
+            }
+        for name, values in new_metrics.items():
+            kept = self.metrics.get(name, values[:0])[:start]
+            self.metrics[name] = numpy.concatenate([kept, values])